@@ -9,6 +9,7 @@
    :software-evolution-library/rest)
   (:import-from :software-evolution-library/rest/async-jobs
                 :lookup-session-job-status)
+  (:import-from :software-evolution-library/rest/utility :wrap-gzip)
   (:import-from :clack :clackup :stop)
   (:import-from :snooze :make-clack-app :defroute
                 :payload-as-string :http-condition)
@@ -77,7 +78,7 @@
             ;; Borrowed from `sel/rest.lisp`.
             (progn
               (setf server
-                    (clackup (make-clack-app)
+                    (clackup (wrap-gzip (make-clack-app))
                              :port *port* :address *address*
                              :debug ,(in-pkg 'debug) :silent ,(in-pkg 'silent)))
               (unless *lisp-interaction*
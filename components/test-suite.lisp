@@ -4,6 +4,9 @@
   (:use :gt/full
    :software-evolution-library
         :software-evolution-library/utility/debug)
+  (:import-from :software-evolution-library/software/compilable
+                :compilable :compiler :flags)
+  (:import-from :trivial-garbage :make-weak-hash-table)
   #-windows (:shadowing-import-from :uiop :wait-process)
   (:export :*process-sleep-interval*
    :*process-kill-timeout*
@@ -23,7 +26,23 @@
    :analyze-fitness
    :create-all-tests-suite
    :create-random-test-suite
-   :update-random-test-suite))
+   :update-random-test-suite
+   :*fitness-cache*
+   :fitness-cache
+   :fitness-cache-capacity
+   :fitness-cache-path
+   :fitness-cache-hits
+   :fitness-cache-misses
+   :fitness-cache-key
+   :fitness-cache-software-key
+   :fitness-cache-test-key
+   :fitness-cache-get
+   :fitness-cache-put
+   :fitness-cache-stats
+   :save-fitness-cache)
+  (:local-nicknames
+   #+sbcl (:md5 :sb-md5)
+   #-sbcl (:md5 :md5)))
 ;; dummy definition for Windows
 #+windows (defun uiop::wait-process (x) 0)
 (in-package :software-evolution-library/components/test-suite)
@@ -417,3 +436,241 @@ By default, sum the results of applying `evaluate' to each test-case using
             (test-cases test-suite))
            (when-let ((val (plist-get :initial-value extra-keys)))
              (list :initial-value val)))))
+
+
+;;; Fitness cache
+;;;
+;;; Evolution regularly produces variants identical to ones which have
+;;; already been evaluated.  When `*fitness-cache*' holds a
+;;; `fitness-cache', `compute-fitness' (and so `evaluate' of software
+;;; without a fitness) first looks up the fitness of software by the
+;;; MD5 of its class, genome and compiler settings and of the test,
+;;; skipping compilation and the test runs on a hit.
+(defvar *fitness-cache* nil
+  "The `fitness-cache' used by `compute-fitness'.
+When nil, no fitness is cached.")
+
+(defclass fitness-cache ()
+  ((capacity
+    :initarg :capacity :initform 65536 :reader fitness-cache-capacity
+    :type (integer 1)
+    :documentation "Maximum number of entries held in the cache.")
+   (path
+    :initarg :path :initform nil :reader fitness-cache-path
+    :documentation "File the entries of the cache are persisted to, or nil.")
+   (table
+    :initform (make-hash-table :test 'equal) :reader fitness-cache-table
+    :documentation "Hash table mapping keys to (fitness extra-data . last-use)
+lists.")
+   (clock
+    :initform 0 :accessor fitness-cache-clock
+    :documentation "Counter stamped on entries as they are used.")
+   (hits
+    :initform 0 :accessor fitness-cache-hits
+    :documentation "Number of lookups which found a fitness.")
+   (misses
+    :initform 0 :accessor fitness-cache-misses
+    :documentation "Number of lookups which found no fitness.")
+   (journal-size
+    :initform 0 :accessor fitness-cache-journal-size
+    :documentation "Number of entries appended to PATH since it was
+last written in full.")
+   (lock
+    :initform (bt:make-recursive-lock "fitness-cache")
+    :reader fitness-cache-lock))
+  (:documentation "Bounded cache of the fitness of software on tests.
+When the cache grows beyond CAPACITY entries the least recently used entries
+are evicted.  When PATH is non-nil the entries are read from PATH when the
+cache is created, and appended to PATH as they are added."))
+
+(defmethod initialize-instance :after ((cache fitness-cache) &key)
+  "Read the entries persisted to the path of CACHE (if any)."
+  (when-let ((path (fitness-cache-path cache)))
+    (when (probe-file path)
+      (with-open-file (in path)
+        (with-standard-io-syntax
+          (let ((*read-eval* nil))
+            ;; A truncated last entry, e.g. from a crash, ends the file.
+            (iter (for entry = (ignore-errors (read in nil)))
+                  (while (and (consp entry) (consp (cdr entry))))
+                  (destructuring-bind (key fitness . extra-data) entry
+                    (fitness-cache-put cache key fitness
+                                       :extra-data extra-data
+                                       :persist nil))))))
+      (save-fitness-cache cache))))
+
+(defun md5-string (string)
+  "Return the MD5 of STRING as a hex string."
+  (with-output-to-string (out nil :element-type 'base-char)
+    (do-each (byte (md5:md5sum-string string :external-format :utf-8) 'list)
+      (format out "~(~2,'0x~)" byte))))
+
+(defgeneric fitness-cache-software-key (software)
+  (:documentation "Return a list of everything determining the fitness of
+SOFTWARE, for `fitness-cache-key'.")
+  (:method ((obj software))
+    (list (class-name (class-of obj)) (md5-string (genome-string obj)))))
+
+(defmethod fitness-cache-software-key :around ((obj compilable))
+  (append (call-next-method) (list (compiler obj) (flags obj))))
+
+(defvar *anonymous-test-keys* (make-weak-hash-table :test 'eq :weakness :key)
+  "Keys given to tests which have no name, see `fitness-cache-test-key'.")
+
+(defvar *anonymous-test-keys-lock* (bt:make-lock "anonymous-test-keys"))
+
+(defvar *anonymous-test-key-prefix*
+  (format nil "~36r" (random (expt 2 64) (make-random-state t)))
+  "Prefix unique to this process of the keys of tests with no name.")
+
+(defvar *anonymous-test-key-count* 0
+  "Number of keys given to tests with no name.")
+
+(defgeneric fitness-cache-test-key (test)
+  (:documentation "Return a list identifying TEST, for `fitness-cache-key'.
+By default each test is identified by a key unique to it and to this
+process, so its fitness is never reused for another test or across
+processes.")
+  (:method (test)
+    (bt:with-lock-held (*anonymous-test-keys-lock*)
+      (list (ensure-gethash test *anonymous-test-keys*
+                            (format nil "~a-~d" *anonymous-test-key-prefix*
+                                    (incf *anonymous-test-key-count*))))))
+  (:method ((test function))
+    (multiple-value-bind (lambda closure-p name)
+        (function-lambda-expression test)
+      (declare (ignore lambda))
+      ;; Global functions are identified by name, closures never are.
+      (if (and (not closure-p)
+               (or (and name (symbolp name))
+                   (and (listp name) (eql 'setf (first name))))
+               (ignore-errors (eql test (fdefinition name))))
+          (list name)
+          (call-next-method))))
+  (:method ((test test-suite))
+    (list (class-name (class-of test))
+          (mapcar (lambda (test-case)
+                    (list (class-name (class-of test-case))
+                          (program-name test-case)
+                          (program-args test-case)
+                          (time-limit test-case)))
+                  (test-cases test)))))
+
+(defun fitness-cache-key (software test &rest extra-keys)
+  "Return the key of the fitness of SOFTWARE on TEST in a cache.
+The key is the MD5 of `fitness-cache-software-key' of SOFTWARE,
+`fitness-cache-test-key' of TEST and the EXTRA-KEYS passed to `evaluate', so
+it is the same across processes for identical software and named tests."
+  (md5-string
+   (with-standard-io-syntax
+     (let ((*print-readably* nil))
+       (prin1-to-string (list (fitness-cache-software-key software)
+                              (fitness-cache-test-key test)
+                              extra-keys))))))
+
+(defun fitness-cache-get (cache key)
+  "Return the fitness stored under KEY in CACHE.
+The second value is true if a fitness was found, and the third is the extra
+data stored with it."
+  (bt:with-recursive-lock-held ((fitness-cache-lock cache))
+    (if-let ((entry (gethash key (fitness-cache-table cache))))
+      (progn
+        (incf (fitness-cache-hits cache))
+        (setf (cddr entry) (incf (fitness-cache-clock cache)))
+        (values (first entry) t (second entry)))
+      (progn
+        (incf (fitness-cache-misses cache))
+        (values nil nil nil)))))
+
+(defun evict-fitness-cache (cache)
+  "Evict the least recently used entries of CACHE down to 7/8 of its capacity.
+Evicting in batches amortizes sorting the entries by last use."
+  (let* ((table (fitness-cache-table cache))
+         (excess (- (hash-table-count table)
+                    (floor (* 7 (fitness-cache-capacity cache)) 8))))
+    (when (plusp excess)
+      (iter (for (key . nil) in (take excess
+                                      (sort (hash-table-alist table)
+                                            #'< :key #'cdddr)))
+            (remhash key table)))))
+
+(defun write-fitness-cache-entry (key fitness extra-data stream)
+  "Write the entry of FITNESS and EXTRA-DATA under KEY to STREAM.
+Entries which cannot be printed readably are only held in memory."
+  (when-let ((line (handler-case
+                       (with-standard-io-syntax
+                         (prin1-to-string (list* key fitness extra-data)))
+                     (print-not-readable () nil))))
+    (write-line line stream)))
+
+(defun fitness-cache-put (cache key fitness &key extra-data (persist t))
+  "Store FITNESS and EXTRA-DATA under KEY in CACHE, returning FITNESS.
+Unless PERSIST is nil the entry is also appended to the path of CACHE, which
+is written in full again when the appended entries outnumber its capacity."
+  (bt:with-recursive-lock-held ((fitness-cache-lock cache))
+    (setf (gethash key (fitness-cache-table cache))
+          (list* fitness extra-data (incf (fitness-cache-clock cache))))
+    (when (> (hash-table-count (fitness-cache-table cache))
+             (fitness-cache-capacity cache))
+      (evict-fitness-cache cache))
+    (when-let ((path (and persist (fitness-cache-path cache))))
+      (if (> (incf (fitness-cache-journal-size cache))
+             (fitness-cache-capacity cache))
+          (save-fitness-cache cache)
+          (with-open-file (out path :direction :output
+                                    :if-exists :append
+                                    :if-does-not-exist :create)
+            (write-fitness-cache-entry key fitness extra-data out))))
+    fitness))
+
+(defun save-fitness-cache (&optional (cache *fitness-cache*)
+                             (path (fitness-cache-path cache)))
+  "Write all entries of CACHE to PATH, replacing its previous contents."
+  (bt:with-recursive-lock-held ((fitness-cache-lock cache))
+    ;; Write next to PATH and rename so PATH is never left half written.
+    (let ((temp (concatenate 'string (namestring path) ".tmp")))
+      (with-open-file (out temp :direction :output :if-exists :supersede)
+        (maphash (lambda (key entry)
+                   (write-fitness-cache-entry key (first entry) (second entry)
+                                              out))
+                 (fitness-cache-table cache)))
+      (uiop:rename-file-overwriting-target temp path))
+    (when (equal path (fitness-cache-path cache))
+      (setf (fitness-cache-journal-size cache) 0))
+    path))
+
+(defun fitness-cache-stats (&optional (cache *fitness-cache*))
+  "Return a plist of the size, capacity, hits and misses of CACHE."
+  (if cache
+      (bt:with-recursive-lock-held ((fitness-cache-lock cache))
+        (list :size (hash-table-count (fitness-cache-table cache))
+              :capacity (fitness-cache-capacity cache)
+              :hits (fitness-cache-hits cache)
+              :misses (fitness-cache-misses cache)))
+      (list :size 0 :capacity 0 :hits 0 :misses 0)))
+
+(defmethod compute-fitness :around (test (obj software) &rest extra-keys
+                                    &key &allow-other-keys)
+  "Look up the fitness of OBJ on TEST in `*fitness-cache*' (when non-nil),
+computing and storing it on a miss."
+  (if-let ((cache *fitness-cache*))
+    (let ((key (apply #'fitness-cache-key obj test extra-keys)))
+      (multiple-value-bind (fitness found extra-data)
+          (fitness-cache-get cache key)
+        (if found
+            (values fitness extra-data)
+            (multiple-value-bind (fitness extra-data) (call-next-method)
+              (fitness-cache-put cache key fitness :extra-data extra-data)
+              (values fitness extra-data)))))
+    (call-next-method)))
+
+(defmethod compute-fitness ((test test-suite) (obj software) &rest extra-keys
+                            &key &allow-other-keys)
+  "Evaluate the phenome of OBJ on TEST, passing EXTRA-KEYS to `evaluate'.
+Software which fails to compile has fitness `*worst-fitness*'."
+  (with-temporary-file (:pathname bin)
+    (multiple-value-bind (bin errno)
+        (ignore-phenome-errors (phenome obj :bin bin))
+      (if (and bin (zerop errno))
+          (apply #'evaluate bin test extra-keys)
+          *worst-fitness*))))
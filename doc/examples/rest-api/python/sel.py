@@ -1,6 +1,17 @@
 """ SEL REST API interface wrapper for Python. """
 
+import asyncio
+import json
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import aiohttp
+except ImportError:
+    # aiohttp is only required by AsyncSelRest.
+    aiohttp = None
 
 #### Helper functions
 
@@ -12,22 +23,86 @@ def oid_result(resp):
     """ Convert a response's content to an integer. """
     return int(resp.text)
 
+def page_params(params, offset, limit, fields):
+    """ Add the offset, limit and fields (list of names) parameters which
+        are not None to the dict of request params, and return it.
+    """
+    if offset is not None:
+        params['offset'] = offset
+    if limit is not None:
+        params['limit'] = limit
+    if fields is not None:
+        params['fields'] = ','.join(fields)
+    return params
+
+def idempotent_retry(retries):
+    """ Return a urllib3 Retry retrying only idempotent GET requests on
+        connection errors and on server errors signalling overload.
+    """
+    kwargs = {'total' : retries,
+              'backoff_factor' : 0.1,
+              'status_forcelist' : [502, 503, 504]}
+    try:
+        return Retry(allowed_methods=frozenset(['GET']), **kwargs)
+    except TypeError:
+        # urllib3 before 1.26 names allowed_methods method_whitelist.
+        return Retry(method_whitelist=frozenset(['GET']), **kwargs)
+
 #### Main class
 
 class SelRest:
     """ This class represents a session with an SEL REST server.
         Upon creation, it registers as a new client with the server.
+
+        Requests are made over a pool of up to pool_size persistent
+        (keep-alive) connections. The timeout is either the number of
+        seconds to wait for the server or a (connect, read) pair. GET
+        requests, being idempotent, are retried up to retries times.
     """
-    def __init__(self, _urlbase="http://127.0.0.1:9004/"):
+    def __init__(self, _urlbase="http://127.0.0.1:9004/",
+                 pool_size=10, timeout=(3.05, 300), retries=3):
         self._urlbase = _urlbase
-        self._client_id = str_result(requests.post(self._url('client'),
-                                                   json={'max-population-size' : 1024},
-                                                   headers={'Content-Type' : 'application/json'}))
+        self._timeout = timeout
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              max_retries=idempotent_retry(retries))
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._client_id = str_result(self._post('client',
+                                                json={'max-population-size' : 1024}))
+
+    def close(self):
+        """ Close the pooled connections to the server. """
+        self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def _url(self, path):
         """ Helper to convert a relative url to an absolute one. """
         return ''.join([self._urlbase, path])
 
+    def _get(self, path, params):
+        """ Helper to GET a path, accepting a JSON response. """
+        return self._session.get(self._url(path), params=params,
+                                 headers={'Accept': 'application/json'},
+                                 timeout=self._timeout)
+
+    def _post(self, path, params=None, json=None):
+        """ Helper to POST JSON to a path. """
+        return self._session.post(self._url(path), params=params, json=json,
+                                  headers={'Content-Type': 'application/json'},
+                                  timeout=self._timeout)
+
+    def _put(self, path, params, json):
+        """ Helper to PUT JSON to a path, accepting a JSON response. """
+        return self._session.put(self._url(path), params=params, json=json,
+                                 headers={'Accept': 'application/json'},
+                                 timeout=self._timeout)
+
     #### Software object management
 
     def create_software(self, software_type, initializers):
@@ -35,23 +110,46 @@ class SelRest:
             dictionary of initializers.
             Returns the software oid (object id).
         """
-        return oid_result(requests.post(self._url('soft'),
-                                        params={'cid' : self._client_id, 'type' : software_type},
-                                        json=initializers,
-                                        headers={'Content-Type': 'application/json'}))
+        return oid_result(self._post('soft',
+                                     {'cid' : self._client_id, 'type' : software_type},
+                                     initializers))
+
+    def create_software_many(self, software_type, initializers_list):
+        """ Create a new software object, of the requested type, for each of
+            the passed dictionaries of initializers, in a single request.
+            Returns the list of software oids (object ids), in order.
+        """
+        return self._post('soft-many',
+                          {'cid' : self._client_id, 'type' : software_type},
+                          initializers_list).json()
 
-    def get_all_software(self):
+    def get_all_software(self, offset=None, limit=None, fields=None):
         """ Get all software objects associated with the current client.
             Returns a list of software oids.
+
+            Only limit software objects from offset on are returned when
+            those are given. If fields is a list of names out of 'oid',
+            'class', 'size' and 'fitness', a dict of those fields is
+            returned for each software object instead of its oid.
         """
-        return requests.get(self._url('soft'), params={'cid' : self._client_id},
-                            headers={'Accept': 'application/json'}).json()
+        return self._get('soft', page_params({'cid' : self._client_id},
+                                             offset, limit, fields)).json()
+
+    def iter_software(self, fields=None, page_size=100):
+        """ Iterate over the software objects associated with the current
+            client, as get_all_software, fetching page_size at a time.
+        """
+        offset = 0
+        while True:
+            page = self.get_all_software(offset, page_size, fields) or []
+            yield from page
+            if len(page) < page_size:
+                return
+            offset += page_size
 
     def get_software(self, oid):
         """ Get details of a specific software object, given its oid. """
-        return requests.get(self._url('soft'),
-                            params={'cid' : self._client_id, 'sid' : oid},
-                            headers={'Accept': 'application/json'}).json()
+        return self._get('soft', {'cid' : self._client_id, 'sid' : oid}).json()
 
     #### Software population management
 
@@ -64,23 +162,38 @@ class SelRest:
         """
         params = {'name' : str(name)} if name else {}
         params['cid'] = self._client_id
-        return str_result(requests.post(self._url('population'),
-                                        params=params,
-                                        json=initializers,
-                                        headers={'Content-Type': 'application/json'}))
+        return str_result(self._post('population', params, initializers))
 
     def get_all_populations(self):
         """ Get all population objects associated with the current client
             Returns a list of population ids (unique names).
         """
-        return requests.get(self._url('population'), params={'cid' : self._client_id},
-                            headers={'Accept': 'application/json'}).json()
+        return self._get('population', {'cid' : self._client_id}).json()
+
+    def get_population(self, name, offset=None, limit=None, fields=None):
+        """ Get details of a specific population, given its name.
 
-    def get_population(self, name):
-        """ Get details of a specific population, given its name. """
-        return requests.get(self._url('population'),
-                            params={'cid' : self._client_id, 'name' : name},
-                            headers={'Accept': 'application/json'}).json()
+            The listed members are paginated by offset and limit, and
+            selected by fields, as in get_all_software. With fields the
+            members are listed under 'members' rather than 'sids'.
+            Responses are gzip compressed when large.
+        """
+        return self._get('population',
+                         page_params({'cid' : self._client_id, 'name' : name},
+                                     offset, limit, fields)).json()
+
+    def iter_population(self, name, fields=None, page_size=100):
+        """ Iterate over the members of a specific population, given its
+            name, as sids or as dicts of fields, fetching page_size at a time.
+        """
+        offset = 0
+        while True:
+            population = self.get_population(name, offset, page_size, fields)
+            page = population.get('members' if fields else 'sids') or []
+            yield from page
+            if len(page) < page_size:
+                return
+            offset += page_size
 
     #
     def update_population(self, name, sids):
@@ -89,10 +202,8 @@ class SelRest:
             Args:
             - sids: an array of software ids to add
         """
-        return requests.put(self._url('population'),
-                            params={'cid' : self._client_id, 'name' : name},
-                            json={"sids": sids},
-                            headers={'Accept': 'application/json'}).json()
+        return self._put('population', {'cid' : self._client_id, 'name' : name},
+                         {"sids": sids}).json()
 
     #### Mutation management
 
@@ -101,24 +212,33 @@ class SelRest:
             object, mutation type and targets.
             Returns the mutation oid (object id).
         """
-        return oid_result(requests.post(self._url('mut'), params={'cid' : self._client_id},
-                                        json={'type': mutation_type,
-                                              'sid': oid,
-                                              'targets': targets,
-                                              'scion': "SCION:"+ str(scion)},
-                                        headers={'Content-Type': 'application/json'}))
+        return oid_result(self._post('mut', {'cid' : self._client_id},
+                                     {'type': mutation_type,
+                                      'sid': oid,
+                                      'targets': targets,
+                                      'scion': "SCION:"+ str(scion)}))
+
+    def create_mutations_many(self, mutations):
+        """ Create a new mutation object for each of the passed
+            (mutation_type, oid, targets, scion) tuples, in a single request.
+            Returns the list of mutation oids (object ids), in order.
+        """
+        return self._post('mut-many', {'cid' : self._client_id},
+                          [{'type': mutation_type,
+                            'sid': oid,
+                            'targets': targets,
+                            'scion': "SCION:"+ str(scion)}
+                           for (mutation_type, oid, targets, scion) in mutations]).json()
 
     def get_all_mutations(self):
         """ Get all mutation objects associated with the current client.
             Returns a list of mutation oids.
         """
-        return requests.get(self._url('mut'), params={'cid' : self._client_id},
-                            headers={'Accept': 'application/json'}).json()
+        return self._get('mut', {'cid' : self._client_id}).json()
 
     def get_mutation(self, oid):
         """ Get details of a specific mutation, given its oid. """
-        return requests.get(self._url('mut'), params={'cid' : self._client_id, 'mid' : oid},
-                            headers={'Accept': 'application/json'}).json()
+        return self._get('mut', {'cid' : self._client_id, 'mid' : oid}).json()
 
     #### Async Job/Task management
 
@@ -131,10 +251,7 @@ class SelRest:
 
             Returns the job name.
         """
-        return str_result(requests.post(self._url(endpoint),
-                                        params={'cid' : self._client_id},
-                                        json=values,
-                                        headers={'Content-Type': 'application/json'}))
+        return str_result(self._post(endpoint, {'cid' : self._client_id}, values))
 
     def get_all_endpoint_jobs(self, endpoint):
         """ Get all jobs associated with the current client and endpoint.
@@ -144,14 +261,11 @@ class SelRest:
 
             Returns a list of job names.
         """
-        return requests.get(self._url(endpoint), params={'cid' : self._client_id},
-                            headers={'Accept': 'application/json'}).json()
+        return self._get(endpoint, {'cid' : self._client_id}).json()
 
     def get_endpoint_job(self, endpoint, name):
         """ Get details of a specific endpoint job, given the endpoint and job name. """
-        return requests.get(self._url(endpoint),
-                            params={'cid' : self._client_id, 'name' : name},
-                            headers={'Accept': 'application/json'}).json()
+        return self._get(endpoint, {'cid' : self._client_id, 'name' : name}).json()
 
     #### Async Job/Task management
 
@@ -171,12 +285,10 @@ class SelRest:
             We will spawn an asynchronous task for each population entity,
             applying `func` to it.
         """
-        return str_result(requests.post(self._url('async'),
-                                        params={'cid' : self._client_id, 'name' : job_name},
-                                        json={'pid' : pid,
-                                              'func' : func,
-                                              'threads' : num_threads},
-                                        headers={'Content-Type': 'application/json'}))
+        return str_result(self._post('async', {'cid' : self._client_id, 'name' : job_name},
+                                     {'pid' : pid,
+                                      'func' : func,
+                                      'threads' : num_threads}))
 
     def create_async_job(self, job_name, arguments, func, num_threads):
         """ Create a new async_job, of the requested type, taking, as input:
@@ -195,25 +307,39 @@ class SelRest:
             `create_async_population_job` instead.
             A new asynchronous task is started, calling the function on the arguments.
         """
-        return str_result(requests.post(self._url('async'),
-                                        params={'cid' : self._client_id, 'name' : job_name},
-                                        json={'arguments' : [arguments],
-                                              'func' : func,
-                                              'threads' : num_threads},
-                                        headers={'Content-Type': 'application/json'}))
+        return str_result(self._post('async', {'cid' : self._client_id, 'name' : job_name},
+                                     {'arguments' : [arguments],
+                                      'func' : func,
+                                      'threads' : num_threads}))
 
     def get_all_async_jobs(self):
         """ Get all async_jobs associated with the current client.
             Returns a list of job names.
         """
-        return requests.get(self._url('async'), params={'cid' : self._client_id},
-                            headers={'Accept': 'application/json'}).json()
+        return self._get('async', {'cid' : self._client_id}).json()
 
     def get_async_job(self, name):
         """ Get details of a specific async job, given its name. """
-        return requests.get(self._url('async'),
-                            params={'cid' : self._client_id, 'name' : name},
-                            headers={'Accept': 'application/json'}).json()
+        return self._get('async', {'cid' : self._client_id, 'name' : name}).json()
+
+    def wait_async_job(self, name, timeout=None):
+        """ Wait for a specific async job to finish, given its name, or for
+            timeout seconds if timeout is not None.
+            Returns the details of the job as get_async_job, whose
+            'finished' field is false if the timeout passed first.
+
+            The server holds each request until the job finishes or for a
+            bounded time, so waiting doesn't poll the server.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            params = {'cid' : self._client_id, 'name' : name}
+            if deadline is not None:
+                params['timeout'] = max(0, deadline - time.monotonic())
+            job = self._get('async-wait', params).json()
+            if (not isinstance(job, dict) or job.get('finished')
+                or (deadline is not None and time.monotonic() >= deadline)):
+                return job
 
     #### Test Suite management
 
@@ -222,20 +348,318 @@ class SelRest:
             pairs.
             Returns the test-suite oid (object id).
         """
-        return oid_result(requests.post(self._url('tests'),
-                                        params={'cid' : self._client_id},
-                                        json=tests,
-                                        headers={'Content-Type': 'application/json'}))
+        return oid_result(self._post('tests', {'cid' : self._client_id}, tests))
+
+    def create_tests_many(self, tests_list):
+        """ Create a new test suite for each of the passed collections of
+            program-name/program-args pairs, in a single request.
+            Returns the list of test-suite oids (object ids), in order.
+        """
+        return self._post('tests-many', {'cid' : self._client_id}, tests_list).json()
 
     def get_all_tests(self):
         """ Get all mutation objects associated with the current client.
             Returns a list of mutation oids.
         """
-        return requests.get(self._url('tests'), params={'cid' : self._client_id},
-                            headers={'Accept': 'application/json'}).json()
+        return self._get('tests', {'cid' : self._client_id}).json()
 
     def get_tests(self, oid):
         """ Get details of a specific mutation, given its oid. """
-        return requests.get(self._url('tests'),
-                            params={'cid' : self._client_id, 'oid' : oid},
-                            headers={'Accept': 'application/json'}).json()
+        return self._get('tests', {'cid' : self._client_id, 'oid' : oid}).json()
+
+    #### Fitness cache
+
+    def get_fitness_cache_stats(self):
+        """ Get the size, capacity, hits and misses of the server's fitness
+            cache, which are all zero while the cache is disabled.
+        """
+        return self._get('fitness-cache', {'cid' : self._client_id}).json()
+
+    def set_fitness_cache(self, enabled=True, capacity=None, path=None):
+        """ Enable the server's fitness cache, replacing any previous cache,
+            or disable it when enabled is False.  The cache is shared by
+            every client of the server, which this resets for all of them
+            along with the cache's stats.  The cache holds at most
+            capacity entries (if given), which are persisted to and loaded
+            from the server file path (if given).  Returns the new stats of
+            the cache.
+        """
+        body = {'enabled' : enabled}
+        if capacity is not None:
+            body['capacity'] = capacity
+        if path is not None:
+            body['path'] = path
+        return self._put('fitness-cache', {'cid' : self._client_id},
+                         body).json()
+
+
+#### Asynchronous class
+
+class AsyncSelRest:
+    """ This class represents a session with an SEL REST server for use
+        with asyncio, with the same methods as SelRest as coroutines.
+        It is created, registering as a new client with the server, by
+        awaiting AsyncSelRest.create, and requires aiohttp.
+
+        Many requests may be awaited at once, e.g. using asyncio.gather,
+        over a pool of up to pool_size persistent connections. At most
+        max_concurrency requests are in flight at a time, the others
+        wait for their turn. The timeout is the total number of seconds
+        to wait for each request. GET requests, being idempotent, are
+        retried up to retries times.
+    """
+    def __init__(self, _urlbase, session, max_concurrency, retries):
+        self._urlbase = _urlbase
+        self._session = session
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._retries = retries
+        self._client_id = None
+
+    @classmethod
+    async def create(cls, _urlbase="http://127.0.0.1:9004/",
+                     pool_size=100, max_concurrency=100, timeout=300, retries=3):
+        """ Create a session with the SEL REST server at _urlbase. """
+        if aiohttp is None:
+            raise ImportError("AsyncSelRest requires the aiohttp package.")
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=pool_size),
+            timeout=aiohttp.ClientTimeout(total=timeout))
+        self = cls(_urlbase, session, max_concurrency, retries)
+        try:
+            self._client_id = await self._post('client',
+                                               json={'max-population-size' : 1024})
+        except BaseException:
+            # Don't leak the pooled connections when registering fails or
+            # is cancelled.
+            await session.close()
+            raise
+        return self
+
+    async def close(self):
+        """ Close the pooled connections to the server. """
+        await self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _url(self, path):
+        """ Helper to convert a relative url to an absolute one. """
+        return ''.join([self._urlbase, path])
+
+    async def _get(self, path, params):
+        """ Helper to GET a path, returning the JSON response. GET requests
+            are retried on connection errors and on server errors
+            signalling overload.
+        """
+        for attempt in range(self._retries + 1):
+            try:
+                async with self._semaphore:
+                    async with self._session.get(self._url(path), params=params,
+                                                 headers={'Accept': 'application/json'}) as resp:
+                        if resp.status not in (502, 503, 504) or attempt == self._retries:
+                            resp.raise_for_status()
+                            return await resp.json(content_type=None)
+            except aiohttp.ClientConnectionError:
+                if attempt == self._retries:
+                    raise
+            await asyncio.sleep(0.1 * 2 ** attempt)
+
+    async def _post(self, path, params=None, json=None):
+        """ Helper to POST JSON to a path, returning the response text. """
+        async with self._semaphore:
+            async with self._session.post(self._url(path), params=params, json=json,
+                                          headers={'Content-Type': 'application/json'}) as resp:
+                resp.raise_for_status()
+                return await resp.text()
+
+    async def _put(self, path, params, json):
+        """ Helper to PUT JSON to a path, returning the JSON response. """
+        async with self._semaphore:
+            async with self._session.put(self._url(path), params=params, json=json,
+                                         headers={'Accept': 'application/json'}) as resp:
+                resp.raise_for_status()
+                return await resp.json(content_type=None)
+
+    #### Software object management
+
+    async def create_software(self, software_type, initializers):
+        """ See SelRest.create_software. """
+        return int(await self._post('soft',
+                                    {'cid' : self._client_id, 'type' : software_type},
+                                    initializers))
+
+    async def create_software_many(self, software_type, initializers_list):
+        """ See SelRest.create_software_many. """
+        return json.loads(await self._post('soft-many',
+                                            {'cid' : self._client_id,
+                                             'type' : software_type},
+                                            initializers_list))
+
+    async def get_all_software(self, offset=None, limit=None, fields=None):
+        """ See SelRest.get_all_software. """
+        return await self._get('soft', page_params({'cid' : self._client_id},
+                                                   offset, limit, fields))
+
+    async def iter_software(self, fields=None, page_size=100):
+        """ See SelRest.iter_software. """
+        offset = 0
+        while True:
+            page = await self.get_all_software(offset, page_size, fields) or []
+            for software in page:
+                yield software
+            if len(page) < page_size:
+                return
+            offset += page_size
+
+    async def get_software(self, oid):
+        """ See SelRest.get_software. """
+        return await self._get('soft', {'cid' : self._client_id, 'sid' : oid})
+
+    #### Software population management
+
+    async def create_population(self, initializers, name=None):
+        """ See SelRest.create_population. """
+        params = {'name' : str(name)} if name else {}
+        params['cid'] = self._client_id
+        return await self._post('population', params, initializers)
+
+    async def get_all_populations(self):
+        """ See SelRest.get_all_populations. """
+        return await self._get('population', {'cid' : self._client_id})
+
+    async def get_population(self, name, offset=None, limit=None, fields=None):
+        """ See SelRest.get_population. """
+        return await self._get('population',
+                               page_params({'cid' : self._client_id, 'name' : name},
+                                           offset, limit, fields))
+
+    async def iter_population(self, name, fields=None, page_size=100):
+        """ See SelRest.iter_population. """
+        offset = 0
+        while True:
+            population = await self.get_population(name, offset, page_size, fields)
+            page = population.get('members' if fields else 'sids') or []
+            for member in page:
+                yield member
+            if len(page) < page_size:
+                return
+            offset += page_size
+
+    async def update_population(self, name, sids):
+        """ See SelRest.update_population. """
+        return await self._put('population', {'cid' : self._client_id, 'name' : name},
+                               {"sids": sids})
+
+    #### Mutation management
+
+    async def create_mutation(self, mutation_type, oid, targets, scion):
+        """ See SelRest.create_mutation. """
+        return int(await self._post('mut', {'cid' : self._client_id},
+                                    {'type': mutation_type,
+                                     'sid': oid,
+                                     'targets': targets,
+                                     'scion': "SCION:"+ str(scion)}))
+
+    async def create_mutations_many(self, mutations):
+        """ See SelRest.create_mutations_many. """
+        return json.loads(await self._post('mut-many', {'cid' : self._client_id},
+                                           [{'type': mutation_type,
+                                             'sid': oid,
+                                             'targets': targets,
+                                             'scion': "SCION:"+ str(scion)}
+                                            for (mutation_type, oid, targets, scion)
+                                            in mutations]))
+
+    async def get_all_mutations(self):
+        """ See SelRest.get_all_mutations. """
+        return await self._get('mut', {'cid' : self._client_id})
+
+    async def get_mutation(self, oid):
+        """ See SelRest.get_mutation. """
+        return await self._get('mut', {'cid' : self._client_id, 'mid' : oid})
+
+    #### Async Job/Task management
+
+    async def create_endpoint_job(self, endpoint, values):
+        """ See SelRest.create_endpoint_job. """
+        return await self._post(endpoint, {'cid' : self._client_id}, values)
+
+    async def get_all_endpoint_jobs(self, endpoint):
+        """ See SelRest.get_all_endpoint_jobs. """
+        return await self._get(endpoint, {'cid' : self._client_id})
+
+    async def get_endpoint_job(self, endpoint, name):
+        """ See SelRest.get_endpoint_job. """
+        return await self._get(endpoint, {'cid' : self._client_id, 'name' : name})
+
+    async def create_async_population_job(self, job_name, pid, func, num_threads):
+        """ See SelRest.create_async_population_job. """
+        return await self._post('async', {'cid' : self._client_id, 'name' : job_name},
+                                {'pid' : pid,
+                                 'func' : func,
+                                 'threads' : num_threads})
+
+    async def create_async_job(self, job_name, arguments, func, num_threads):
+        """ See SelRest.create_async_job. """
+        return await self._post('async', {'cid' : self._client_id, 'name' : job_name},
+                                {'arguments' : [arguments],
+                                 'func' : func,
+                                 'threads' : num_threads})
+
+    async def get_all_async_jobs(self):
+        """ See SelRest.get_all_async_jobs. """
+        return await self._get('async', {'cid' : self._client_id})
+
+    async def get_async_job(self, name):
+        """ See SelRest.get_async_job. """
+        return await self._get('async', {'cid' : self._client_id, 'name' : name})
+
+    async def wait_async_job(self, name, timeout=None):
+        """ See SelRest.wait_async_job. """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            params = {'cid' : self._client_id, 'name' : name}
+            if deadline is not None:
+                params['timeout'] = max(0, deadline - time.monotonic())
+            job = await self._get('async-wait', params)
+            if (not isinstance(job, dict) or job.get('finished')
+                or (deadline is not None and time.monotonic() >= deadline)):
+                return job
+
+    #### Test Suite management
+
+    async def create_tests(self, tests):
+        """ See SelRest.create_tests. """
+        return int(await self._post('tests', {'cid' : self._client_id}, tests))
+
+    async def create_tests_many(self, tests_list):
+        """ See SelRest.create_tests_many. """
+        return json.loads(await self._post('tests-many', {'cid' : self._client_id},
+                                           tests_list))
+
+    async def get_all_tests(self):
+        """ See SelRest.get_all_tests. """
+        return await self._get('tests', {'cid' : self._client_id})
+
+    async def get_tests(self, oid):
+        """ See SelRest.get_tests. """
+        return await self._get('tests', {'cid' : self._client_id, 'oid' : oid})
+
+    #### Fitness cache
+
+    async def get_fitness_cache_stats(self):
+        """ See SelRest.get_fitness_cache_stats. """
+        return await self._get('fitness-cache', {'cid' : self._client_id})
+
+    async def set_fitness_cache(self, enabled=True, capacity=None, path=None):
+        """ See SelRest.set_fitness_cache. """
+        body = {'enabled' : enabled}
+        if capacity is not None:
+            body['capacity'] = capacity
+        if path is not None:
+            body['path'] = path
+        return await self._put('fitness-cache', {'cid' : self._client_id},
+                               body)
@@ -0,0 +1,434 @@
+"""
+Asyncio interface to the tree-sitter-interface.
+
+ASTs created using this module live in a tree-sitter-interface process
+of their own, separate from the process used by the blocking `asts` API,
+and their methods are coroutines.  Each request is tagged with an id so
+that many requests may be in flight at once, with responses matched to
+requests by their id regardless of the order in which they arrive.
+
+```python
+import asts
+from asts import aio
+
+async def main():
+    root = await aio.AST.from_string("x = 1\\n", asts.ASTLanguage.Python)
+    print(await root.source_text())
+    await aio.stop()
+```
+"""
+
+import asyncio
+import itertools
+import json
+
+from typing import (
+    Any,
+    AsyncGenerator,
+    ClassVar,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from typing_extensions import Final
+from .asts import ASTException, ASTLanguage, ASTTimeout, _env_int, _guess_language
+from .asts import _interface as _sync_interface
+
+
+class AST:
+    def __init__(self, oid: int, type_name: str) -> None:
+        """
+        Internal constructor creating an AST with the given object id (oid)
+        pointing to an object in the asynchronous tree-sitter-interface.
+
+        Clients should not invoke this method and instead use the static
+        factory methods below for AST creation.
+        """
+        assert isinstance(oid, int), "AST object id (oid) must be an integer."
+        assert oid >= 0, "AST object id (oid) must be a non-negative integer."
+
+        self._oid = oid
+        self._type_name = type_name
+
+    # AST contruction from source code text
+    @staticmethod
+    async def from_string(
+        text: str,
+        language: Optional[ASTLanguage] = None,
+        *,
+        deepest: Optional[bool] = False,
+        error_tree: Optional[bool] = True,
+    ) -> "AST":
+        """
+        Parse source-code string source of language and return the root
+        of the resulting AST.  See asts.AST.from_string.
+        """
+        language = _guess_language(text) if not language else language
+        return await _interface.dispatch(
+            "from_string",
+            text,
+            language,
+            deepest,
+            error_tree,
+        )
+
+    # AST python magic methods
+    def __repr__(self) -> str:
+        """Return a string representation of the AST."""
+        return f"<{__name__}.AST {self._type_name} {hex(self.oid)}>"
+
+    def __del__(self) -> None:
+        if self._oid is not None:
+            _interface._gc_oids.append(self._oid)
+        self._oid = None
+
+    def __hash__(self) -> int:
+        """Return the hashcode for the AST."""
+        return self.oid
+
+    def __eq__(self, other: Any) -> bool:
+        """Return true if AST has the same oid as other."""
+        if isinstance(other, AST):
+            return self.oid == other.oid
+        else:
+            return False
+
+    # AST properties for immutable attributes
+    @property
+    def oid(self) -> int:
+        """Return the oid for this AST."""
+        return self._oid
+
+    @property
+    def type_name(self) -> str:
+        """Return the name of the AST's type in the asts package."""
+        return self._type_name
+
+    # AST queries
+    async def language(self) -> ASTLanguage:
+        """Return the AST's language."""
+        return ASTLanguage[await _interface.dispatch("language", self)]
+
+    async def source_text(self) -> str:
+        """Return a string of the AST's source text."""
+        return await _interface.dispatch("source_text", self)
+
+    async def children(self) -> List["AST"]:
+        """Return a list of the AST's children."""
+        return await _interface.dispatch("children", self) or []
+
+    async def child_slots(self) -> List[Tuple[str, int]]:
+        """Return a list of the AST's child slots."""
+        return await _interface.dispatch("child_slots", self) or []
+
+    async def child_slot(self, slot: str) -> Optional[Union["AST", List["AST"]]]:
+        """Return the contents of the AST's child slot value."""
+        return await _interface.dispatch("child_slot", self, slot)
+
+    async def slots(self) -> Dict[str, Optional[Union["AST", List["AST"]]]]:
+        """Return the contents of each of the AST's child slots by name."""
+        slots = await _interface.dispatch("slots", self) or []
+        return {slot: value for slot, _, value in slots}
+
+    async def refcount(self) -> int:
+        """Return the AST's reference count."""
+        return await _interface.dispatch("refcount", self)
+
+    async def ast_at_point(self, line: int, column: int) -> Optional["AST"]:
+        """Return the most specific AST covering line and column."""
+        return await _interface.dispatch("ast_at_point", self, line, column)
+
+    async def ast_path(self, child: "AST") -> List:
+        """Return the path to CHILD in SELF."""
+        return await _interface.dispatch("ast_path", self, child) or []
+
+    async def lookup(self, path: List) -> Optional["AST"]:
+        """Return the AST at PATH in SELF, if possible."""
+        return await _interface.dispatch("lookup", self, path)
+
+    async def parent(self, root: "AST") -> Optional["AST"]:
+        """Return AST's parent under ROOT."""
+        return await _interface.dispatch("parent", root, self)
+
+    async def parents(self, root: "AST") -> List["AST"]:
+        """Return AST's parents to the ROOT."""
+        parents = []
+        p = await self.parent(root)
+        while p:
+            parents.append(p)
+            p = await p.parent(root)
+        return parents
+
+    async def imports(self, root: "AST") -> List[List[str]]:
+        """Return a list of imports available at AST."""
+        return await _interface.dispatch("imports", root, self) or []
+
+    async def provided_by(self, root: "AST") -> Optional[str]:
+        """Return library providing AST's identifier."""
+        return await _interface.dispatch("provided_by", root, self)
+
+    # AST traversal
+    async def traverse(self) -> AsyncGenerator["AST", None]:
+        """Traverse self in pre-order, yielding subtrees."""
+        async for ast in self._perform_traverse(order="pre"):
+            yield ast
+
+    async def post_traverse(self) -> AsyncGenerator["AST", None]:
+        """Traverse self in post-order, yielding subtrees."""
+        async for ast in self._perform_traverse(order="post"):
+            yield ast
+
+    async def level_traverse(self) -> AsyncGenerator["AST", None]:
+        """Perform an AST traversal in level order, yielding subtrees."""
+        async for ast in self._perform_traverse(order="level"):
+            yield ast
+
+    async def _perform_traverse(
+        self,
+        order: str = "pre",
+    ) -> AsyncGenerator["AST", None]:
+        """
+        Perform an AST traversal in pre-, post-, or level order, yielding
+        subtrees retrieved from the interface in chunks.
+        """
+        chunk_size = _sync_interface._DEFAULT_CHUNK_SIZE
+        start = 0
+        while True:
+            chunk = await _interface.dispatch(
+                "traverse_chunk", self, order, start, chunk_size
+            )
+            for ast in chunk or []:
+                yield ast
+            if len(chunk or []) < chunk_size:
+                break
+            start += chunk_size
+
+
+class _interface:
+    """
+    asynchronous interface between python and the sel process
+    """
+
+    _DEFAULT_THREADS: Final[Optional[int]] = _env_int("ASTS_THREADS")
+    _DEFAULT_STREAM_LIMIT: Final[int] = 2**24
+
+    _threads: ClassVar[Optional[int]] = _DEFAULT_THREADS
+    _proc: ClassVar[Optional[asyncio.subprocess.Process]] = None
+    _reader: ClassVar[Optional[asyncio.StreamReader]] = None
+    _writer: ClassVar[Optional[asyncio.StreamWriter]] = None
+    _receiver: ClassVar[Optional[asyncio.Future]] = None
+    _loop: ClassVar[Optional[asyncio.AbstractEventLoop]] = None
+    _lock: ClassVar[Optional[asyncio.Lock]] = None
+    _pending: ClassVar[Dict[int, asyncio.Future]] = {}
+    _ids: ClassVar[Any] = itertools.count(1)
+    _gc_oids: ClassVar[List[int]] = []
+
+    @staticmethod
+    def is_process_running() -> bool:
+        """
+        Return TRUE if this process is connected to an interface from
+        the running event loop.
+        """
+        return (
+            _interface._writer is not None
+            and _interface._loop is asyncio.get_event_loop()
+            and not _interface._receiver.done()
+        )
+
+    @staticmethod
+    async def start() -> None:
+        """
+        Start a tree-sitter-interface Lisp process communicating over
+        asynchronous streams or, if the ASTS_DAEMON environment variable
+        gives the host:port of a shared interface, connect to it instead.
+        A new interface is started for each event loop.
+        """
+        loop = asyncio.get_event_loop()
+        if _interface._loop is not loop:
+            _interface._loop = loop
+            _interface._lock = asyncio.Lock()
+            _interface._writer = None
+
+        async with _interface._lock:
+            if _interface.is_process_running():
+                return
+
+            if _sync_interface._DEFAULT_DAEMON:
+                host, port = _sync_interface._DEFAULT_DAEMON.rsplit(":", 1)
+                reader, writer = await asyncio.open_connection(
+                    host, int(port), limit=_interface._DEFAULT_STREAM_LIMIT
+                )
+            else:
+                # Given ASTS_THREADS, the interface handles the requests in
+                # flight using that many worker threads.
+                cmdline = [_sync_interface._command()]
+                if _interface._threads:
+                    cmdline += ["--threads", str(_interface._threads)]
+                _interface._proc = await asyncio.create_subprocess_exec(
+                    *cmdline,
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.DEVNULL,
+                    limit=_interface._DEFAULT_STREAM_LIMIT,
+                )
+                reader, writer = _interface._proc.stdout, _interface._proc.stdin
+
+            _interface._reader = reader
+            _interface._writer = writer
+            _interface._gc_oids = []
+            _interface._pending = {}
+            _interface._receiver = asyncio.ensure_future(_interface._receive())
+
+    @staticmethod
+    async def stop() -> None:
+        """
+        Stop the asynchronous tree-sitter-interface Lisp process or, when
+        using a shared daemon, disconnect from it.
+        """
+        if _interface.is_process_running():
+            _interface._writer.write(_sync_interface._DEFAULT_QUIT_SENTINEL)
+            await _interface._writer.drain()
+            _interface._writer.close()
+            await _interface._receiver
+            if _interface._proc is not None:
+                await _interface._proc.wait()
+        _interface._writer = None
+        _interface._proc = None
+
+    @staticmethod
+    async def dispatch(*args: Tuple[Any], **kwargs: Dict[str, Any]) -> Any:
+        """
+        Dispatch processing to the asynchronous tree-sitter-interface,
+        returning the response once it has been received.  Other requests
+        may be made while awaiting the response.
+        """
+
+        def handle_errors(data: Dict[str, Any]) -> Any:
+            """Check for errors in the subprocess reported in the JSON output."""
+            if data.get("timeout", None):
+                raise ASTTimeout(data["error"])
+            if data.get("error", None):
+                raise ASTException(data["error"])
+
+            return data.get("result", None)
+
+        def serialize(v: Any) -> Any:
+            """Serialize V to a form for passing thru the JSON text interface."""
+            if isinstance(v, AST):
+                return {"type": "ast", "oid": v.oid}
+            if isinstance(v, ASTLanguage):
+                return v.name
+            elif isinstance(v, dict):
+                return {serialize(key): serialize(val) for key, val in v.items()}
+            elif isinstance(v, (list, tuple)):
+                return [serialize(i) for i in v]
+            else:
+                return v
+
+        await _interface.start()
+
+        # Flush the queue of garbage collected AST object ids (oids) with
+        # a request of its own, without awaiting its response.
+        if len(_interface._gc_oids) > _sync_interface._DEFAULT_GC_THRESHOLD:
+            oids = _interface._gc_oids
+            _interface._gc_oids = []
+            _interface._send(["gc", oids], respond=False)
+
+        # Send the request tagged with a fresh id and await the response
+        # with the same id.
+        fn, args = args[0], args[1:]
+        request = [fn] + serialize(list(args)) + serialize(list(kwargs.items()))
+        response = _interface._send(request)
+        await _interface._writer.drain()
+        return _interface._deserialize(handle_errors(await response))
+
+    @staticmethod
+    def _send(request: List[Any], respond: bool = True) -> Optional[asyncio.Future]:
+        """
+        Write REQUEST tagged with a fresh id to the interface, returning
+        a future for its response if RESPOND is true.
+        """
+        request_id = next(_interface._ids)
+        response = _interface._loop.create_future() if respond else None
+        if respond:
+            _interface._pending[request_id] = response
+        message = {"id": request_id, "request": request}
+        _interface._writer.write(f"{json.dumps(message)}\n".encode())
+        return response
+
+    @staticmethod
+    async def _receive() -> None:
+        """
+        Read responses from the interface, resolving the future of the
+        request with the id of each response.  Responses to cancelled
+        requests are discarded, releasing any ASTs they hold.  As the
+        request a malformed response, or one without an id, answers is
+        unknown, the requests in flight fail and reading continues.
+        """
+        try:
+            while True:
+                line = await _interface._readline()
+                if not line:
+                    break
+                try:
+                    data = json.loads(line.decode())
+                except ValueError as e:
+                    msg = f"Malformed response from the interface: {e}"
+                    _interface._fail_pending(ASTException(msg))
+                    continue
+                if not isinstance(data, dict) or data.get("id") is None:
+                    error = data.get("error") if isinstance(data, dict) else None
+                    msg = error or f"Response without an id: {data}"
+                    _interface._fail_pending(ASTException(msg))
+                    continue
+                response = _interface._pending.pop(data["id"], None)
+                if response is None or response.cancelled():
+                    _interface._deserialize(data.get("result", None))
+                else:
+                    response.set_result(data)
+        finally:
+            msg = f"{_sync_interface._DEFAULT_CMD_NAME} exited."
+            _interface._fail_pending(RuntimeError(msg))
+
+    @staticmethod
+    async def _readline() -> bytes:
+        """
+        Read a response line of any length from the interface, in chunks
+        of at most the stream limit, returning b"" at the end of the stream.
+        """
+        chunks = []
+        while True:
+            try:
+                chunks.append(await _interface._reader.readuntil(b"\n"))
+                return b"".join(chunks)
+            except asyncio.IncompleteReadError as e:
+                chunks.append(e.partial)
+                return b"".join(chunks)
+            except asyncio.LimitOverrunError as e:
+                chunks.append(await _interface._reader.readexactly(e.consumed))
+
+    @staticmethod
+    def _fail_pending(exception: Exception) -> None:
+        """Fail the requests in flight with exception."""
+        for response in _interface._pending.values():
+            if not response.done():
+                response.set_exception(exception)
+        _interface._pending = {}
+
+    @staticmethod
+    def _deserialize(v: Any) -> Any:
+        """Deserialize V from the form used with the JSON text interface."""
+        if isinstance(v, dict) and v.get("oid", None):
+            return AST(oid=v["oid"], type_name=v["type"])
+        elif isinstance(v, dict):
+            return {key: _interface._deserialize(val) for key, val in v.items()}
+        elif isinstance(v, list):
+            return [_interface._deserialize(i) for i in v]
+        else:
+            return v
+
+
+start = _interface.start
+stop = _interface.stop
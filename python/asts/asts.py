@@ -1,13 +1,24 @@
 import atexit
+import base64
 import collections
+import contextlib
+import difflib
 import enum
+import itertools
 import json
+import mmap
 import multiprocessing
+import os
 import pkg_resources
+import select
 import shutil
 import socket
 import subprocess
+import tempfile
+import threading
 import time
+import traceback
+import weakref
 
 import pygments.lexers
 
@@ -19,8 +30,11 @@ from typing import (
     ByteString,
     Dict,
     Generator,
+    Iterable,
     List,
+    NamedTuple,
     Optional,
+    Set,
     Tuple,
     Union,
 )
@@ -49,6 +63,12 @@ class ASTException(Exception):
     pass
 
 
+class ASTTimeout(ASTException):
+    """specialization for interface requests exceeding their deadline"""
+
+    pass
+
+
 def _guess_language(text: str) -> Optional[ASTLanguage]:
     """Use pygments to guess the source language of text, if possible."""
     lexer = pygments.lexers.guess_lexer(text)
@@ -72,6 +92,31 @@ def _guess_language(text: str) -> Optional[ASTLanguage]:
         )
 
 
+@contextlib.contextmanager
+def deadline(seconds: float) -> Generator[None, None, None]:
+    """
+    Raise ASTTimeout from any interface request made in this thread within
+    the context which has not completed seconds after entering the context.
+
+    Requests reaching the deadline are cancelled by the interface.  Should
+    the interface fail to respond shortly after the deadline, it is reset,
+    invalidating all ASTs.  Nested contexts use the earliest deadline.
+    """
+    outer = getattr(_interface._local, "deadline", None)
+    inner = time.monotonic() + seconds
+    _interface._local.deadline = inner if outer is None else min(outer, inner)
+    try:
+        yield
+    finally:
+        _interface._local.deadline = outer
+
+
+def _env_int(name: str) -> Optional[int]:
+    """Return the integer value of the environment variable name, if set."""
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
 # Base AST class
 class AST:
     def __init__(self, oid: int) -> None:
@@ -86,6 +131,7 @@ class AST:
         assert oid >= 0, "AST object id (oid) must be a non-negative integer."
 
         self._oid = oid
+        _interface._live_asts[id(self)] = self
 
     # AST contruction from source code text
     @staticmethod
@@ -118,6 +164,18 @@ class AST:
             error_tree,
         )
 
+    @staticmethod
+    def from_bytes(data: ByteString) -> "AST":
+        """
+        Return a new AST from the binary serialization data created by
+        AST.to_bytes, possibly in another process.  This avoids the cost
+        of re-parsing the source text of the AST.
+        """
+        return _interface.dispatch(
+            AST.from_bytes.__name__,
+            base64.b64encode(data).decode(),
+        )
+
     # AST construction using templates
     @staticmethod
     def ast_template(
@@ -205,7 +263,8 @@ class AST:
         return f"<{module}.{qualname} {hex(self.oid)}>"
 
     def __del__(self) -> None:
-        _interface.dispatch(AST.__del__.__name__, self.oid)
+        if self._oid is not None:
+            _interface.dispatch(AST.__del__.__name__, self.oid)
         self._oid = None
 
     def __copy__(self) -> "AST":
@@ -216,17 +275,40 @@ class AST:
         """Return a deep copy of AST conforming to copy.deepcopy."""
         return AST.copy(self)
 
+    def __reduce__(self) -> Tuple[Callable[[bytes], "AST"], Tuple[bytes]]:
+        """Return a pickle representation of AST using its binary serialization."""
+        return (AST.from_bytes, (self.to_bytes(),))
+
+    def to_bytes(self) -> ByteString:
+        """
+        Return a binary serialization of the AST tree, in the cl-store
+        format, which may be passed to AST.from_bytes, possibly in another
+        process.
+        """
+        return base64.b64decode(_interface.dispatch(AST.to_bytes.__name__, self))
+
     def __iter__(self) -> Generator["AST", None, None]:
         """Traverse self in pre-order, yielding subtrees"""
         yield from self.traverse()
 
     def __hash__(self) -> int:
-        """Return the hashcode for the AST."""
-        return self.oid
+        """
+        Return the hashcode for the AST.  The hashcode is kept when the
+        interface is restarted, reassigning oids, so ASTs in sets and
+        dictionaries are still found.
+        """
+        if self._oid is None:
+            return self._hash
+        return _interface._hashes.get(self._oid, self._oid)
 
     def __eq__(self, other: Any) -> bool:
-        """Return true if AST has the same oid as other."""
+        """
+        Return true if AST has the same oid as other.  An AST invalidated
+        by a restart of the interface is only equal to itself.
+        """
         if isinstance(other, AST):
+            if self.oid is None or other.oid is None:
+                return self is other
             return self.oid == other.oid
         else:
             return False
@@ -244,8 +326,42 @@ class AST:
 
     @cached_property
     def source_text(self) -> str:
-        """Return a string of the AST's source text."""
-        return _interface.dispatch(AST.source_text.func.__name__, self)
+        """
+        Return a string of the AST's source text.  For a root created by
+        a mutation of a root whose source text was already retrieved, only
+        the changed region of the text is retrieved and patched into the
+        source text of the original root.
+        """
+        base = self.__dict__.pop("_base_source_text", None)
+        changes = AST.source_text_changes(self) if base is not None else None
+        if changes is None:
+            return _interface.dispatch(AST.source_text.func.__name__, self)
+
+        for start, end, text in reversed(changes):
+            base = base[:start] + text + base[end:]
+        return base
+
+    @staticmethod
+    def source_text_changes(root: "AST") -> Optional[List[Tuple[int, int, str]]]:
+        """
+        Return the changes from the source text of the root that root was
+        created from by a mutation to the source text of root, as a list
+        of (start, end, text) tuples replacing the characters from start
+        to end of the former with text.  Return None if root was not
+        created by a mutation or the source text of the original root was
+        never retrieved.
+        """
+        changes = _interface.dispatch(AST.source_text_changes.__name__, root)
+        return [tuple(change) for change in changes] if changes else None
+
+    def _derived_from(self, root: "AST") -> "AST":
+        """
+        Note that this AST was created by a mutation of root, allowing its
+        source text to be derived from the source text of root, if known.
+        """
+        if "source_text" in root.__dict__:
+            self.__dict__["_base_source_text"] = root.__dict__["source_text"]
+        return self
 
     @cached_property
     def children(self) -> List["AST"]:
@@ -266,12 +382,38 @@ class AST:
         """Return the most specific AST covering LINE and COLUMN."""
         return _interface.dispatch(AST.ast_at_point.__name__, self, line, column)
 
+    def asts_at_points(self, points: List[Tuple[int, int]]) -> List[Optional["AST"]]:
+        """Return the most specific AST covering each (line, column) in POINTS."""
+        return _interface.dispatch(AST.asts_at_points.__name__, self, points) or []
+
+    def asts_in_range(
+        self,
+        start: Tuple[int, int],
+        end: Tuple[int, int],
+    ) -> List["AST"]:
+        """Return the ASTs contained between the (line, column) START and END."""
+        return _interface.dispatch(AST.asts_in_range.__name__, self, start, end) or []
+
     def ast_source_ranges(
         self,
     ) -> List[Tuple["AST", Tuple[Tuple[int, int], Tuple[int, int]]]]:
         """Return the source ranges (line, col) for AST its recursive children"""
         return _interface.dispatch(AST.ast_source_ranges.__name__, self)
 
+    def iter_ast_source_ranges(
+        self,
+        chunk_size: Optional[int] = None,
+    ) -> Generator[Tuple["AST", Tuple[Tuple[int, int], Tuple[int, int]]], None, None]:
+        """
+        Lazily yield the source ranges (line, col) for AST and its recursive
+        children, retrieving them from the interface CHUNK_SIZE at a time.
+        """
+        yield from _interface.dispatch_chunks(
+            "ast_source_ranges_chunk",
+            self,
+            chunk_size=chunk_size,
+        )
+
     def ast_path(self, child: "AST") -> List:
         """Return the path to CHILD in SELF."""
         return _interface.dispatch(AST.ast_path.__name__, self, child) or []
@@ -296,6 +438,24 @@ class AST:
         else:
             return _interface.dispatch(AST.child_slot.__name__, self, slot)
 
+    def slots(self) -> Dict[str, Optional[Union["AST", List["AST"]]]]:
+        """
+        Return the contents of each of the AST's child slots, keyed by slot
+        name, using a single request.  The values are also cached for the
+        AST's child slot properties.
+        """
+        slots = {}
+        child_slots = []
+        for slot, arity, value in _interface.dispatch(AST.slots.__name__, self) or []:
+            slots[slot] = value
+            child_slots.append([slot, arity])
+
+            name = slot.lower().replace("-", "_")
+            if isinstance(vars(type(self)).get(name), cached_property):
+                self.__dict__.setdefault(name, value)
+        self.__dict__.setdefault(AST.child_slots.func.__name__, child_slots)
+        return slots
+
     def parent(self, root: "AST") -> "AST":
         """Return AST's parent under ROOT."""
         return _interface.dispatch(AST.parent.__name__, root, self)
@@ -313,6 +473,55 @@ class AST:
         """Return library providing AST's identifier."""
         return _interface.dispatch(AST.provided_by.__name__, root, self)
 
+    @staticmethod
+    def imports_many(root: "AST", asts: List["AST"]) -> List[List[List[str]]]:
+        """Return a list of imports available at each of ASTS under ROOT."""
+        imports = _interface.dispatch(AST.imports_many.__name__, root, asts)
+        return [i or [] for i in imports or []]
+
+    @staticmethod
+    def provided_by_many(root: "AST", asts: List["AST"]) -> List[Optional[str]]:
+        """Return the library providing each of ASTS' identifiers under ROOT."""
+        return _interface.dispatch(AST.provided_by_many.__name__, root, asts) or []
+
+    def match(
+        self,
+        template: str,
+        language: Optional[ASTLanguage] = None,
+    ) -> List[Tuple["AST", Dict[str, Union["AST", List["AST"]]]]]:
+        """
+        Return every subtree of AST matching the given template along with
+        the metavariable bindings for the match.
+
+        For instance, `root.match("$X + 0")` returns a list of
+        `(ast, {"X": x})` pairs, one for each subtree of root adding zero
+        to an expression x.  List metavariables (e.g. `@ARGS`) are bound
+        to lists of ASTs.  The search is performed entirely by the
+        tree-sitter-interface in a single request.
+        """
+        language = language or self.language
+        matches = _interface.dispatch(AST.match.__name__, self, template, language)
+        return [(ast, dict(bindings or [])) for ast, bindings in matches or []]
+
+    @staticmethod
+    def diff(
+        old: "AST",
+        new: "AST",
+    ) -> List[Tuple[str, Optional["AST"], Optional["AST"]]]:
+        """
+        Return a structural edit script from the old tree to the new tree
+        as a list of (operation, old_ast, new_ast) tuples, where operation
+        is one of "insert" (of new_ast), "delete" (of old_ast), "move" (of
+        old_ast to the position of new_ast), or "update" (of the text of
+        the leaf old_ast to that of new_ast).  Only the topmost subtree of
+        any inserted, deleted, or moved subtree is listed.
+
+        The subtrees are matched by the tree-sitter-interface using hashes
+        of their structure, scaling linearly with the size of the trees.
+        """
+        edits = _interface.dispatch(AST.diff.__name__, old, new) or []
+        return [tuple(edit) for edit in edits]
+
     def function_asts(self) -> List["AST"]:
         """Return any function ASTs under AST."""
         return [c for c in self if isinstance(c, FunctionAST)]
@@ -331,42 +540,53 @@ class AST:
         )
         return vars_in_scope or []
 
+    @staticmethod
+    def get_vars_in_scope_many(
+        root: "AST",
+        asts: List["AST"],
+        keep_globals: bool = True,
+    ) -> List[List[Dict]]:
+        """
+        Return all variables in enclosing scopes for each of the ASTs under
+        ROOT, optionally including globals, using a single request.
+        """
+        vars_in_scope = _interface.dispatch(
+            AST.get_vars_in_scope_many.__name__,
+            root,
+            asts,
+            keep_globals,
+        )
+        return [v or [] for v in vars_in_scope or []]
+
     # AST traversal
     def traverse(self) -> Generator["AST", None, None]:
         """Traverse self in pre-order, yielding subtrees."""
-        yield from self._perform_traverse(post_order=False)
+        yield from self._perform_traverse(order="pre")
 
     def post_traverse(self) -> Generator["AST", None, None]:
         """Traverse self in post-order, yielding subtrees."""
-        yield from self._perform_traverse(post_order=True)
+        yield from self._perform_traverse(order="post")
+
+    def level_traverse(self) -> Generator["AST", None, None]:
+        """Perform an AST traversal in level order, yielding subtrees."""
+        yield from self._perform_traverse(order="level")
 
     def _perform_traverse(
         self,
-        post_order: bool = False,
+        order: str = "pre",
     ) -> Generator["AST", None, None]:
-        """Perform an AST traversal in pre- or post-order, yielding subtrees."""
-        if not post_order:
-            yield self
-        for child in self.children:
-            yield from child._perform_traverse(post_order=post_order)
-        if post_order:
-            yield self
-
-    def level_traverse(self) -> Generator["AST", None, None]:
-        """Perform an AST traversal in level order, yielding subtrees."""
-        queue = collections.deque([])
-        queue.append(self)
-        while queue:
-            node = queue.popleft()
-            yield node
-            queue.extend(node.children)
+        """
+        Perform an AST traversal in pre-, post-, or level order, yielding
+        subtrees retrieved from the interface in chunks.
+        """
+        yield from _interface.dispatch_chunks("traverse_chunk", self, order)
 
     # AST mutation
     @staticmethod
     def cut(root: "AST", pt: "AST") -> "AST":
         """Return a new root with pt removed."""
         AST._root_mutation_check(root, pt)
-        return _interface.dispatch(AST.cut.__name__, root, pt)
+        return _interface.dispatch(AST.cut.__name__, root, pt)._derived_from(root)
 
     @staticmethod
     def replace(root: "AST", pt: "AST", value: LiteralOrAST) -> "AST":
@@ -375,7 +595,8 @@ class AST:
 
         AST._root_mutation_check(root, pt)
         AST._mutation_value_check(value)
-        return _interface.dispatch(AST.replace.__name__, root, pt, value)
+        new_root = _interface.dispatch(AST.replace.__name__, root, pt, value)
+        return new_root._derived_from(root)
 
     @staticmethod
     def insert(root: "AST", pt: "AST", value: LiteralOrAST) -> "AST":
@@ -384,7 +605,8 @@ class AST:
 
         AST._root_mutation_check(root, pt)
         AST._mutation_value_check(value)
-        return _interface.dispatch(AST.insert.__name__, root, pt, value)
+        new_root = _interface.dispatch(AST.insert.__name__, root, pt, value)
+        return new_root._derived_from(root)
 
     @staticmethod
     def transform(
@@ -475,6 +697,258 @@ class AST:
         ), "Cannot use a root node as a mutation value."
 
 
+# Compiled AST templates
+class Template:
+    """
+    AST template parsed once by the tree-sitter-interface and cached for
+    repeated instantiation.
+
+    For instance, `Template("$ID = 1", ASTLanguage.Python).instantiate(id="x")`
+    is equivalent to `AST.ast_template("$ID = 1", ASTLanguage.Python, id="x")`.
+    """
+
+    def __init__(self, template: str, language: ASTLanguage) -> None:
+        """Compile the template string for the given language."""
+        self._template = template
+        self._language = language
+        self._parameters = _interface.dispatch(
+            "compile_template",
+            template,
+            language,
+        )
+
+    def __repr__(self) -> str:
+        """Return a string representation of the template."""
+        type_ = type(self)
+        return f"<{type_.__module__}.{type_.__qualname__} {self.template!r}>"
+
+    @property
+    def template(self) -> str:
+        """Return the template's source text."""
+        return self._template
+
+    @property
+    def language(self) -> ASTLanguage:
+        """Return the template's language."""
+        return self._language
+
+    @property
+    def parameters(self) -> List[str]:
+        """Return the names of the template's metavariables."""
+        return self._parameters or []
+
+    def instantiate(
+        self,
+        *args: Tuple[LiteralOrAST],
+        **kwargs: Dict[str, LiteralOrAST],
+    ) -> AST:
+        """
+        Build a single AST from the template using the given positional
+        or keyword metavariable values, as with `AST.ast_template`.
+        """
+        return _interface.dispatch(
+            Template.instantiate.__name__,
+            self.template,
+            self.language,
+            *args,
+            **kwargs,
+        )
+
+    def instantiate_many(
+        self,
+        bindings: List[Union[Dict[str, LiteralOrAST], List[LiteralOrAST]]],
+    ) -> List[AST]:
+        """
+        Build one AST from the template for each set of metavariable
+        values in bindings using a single request to the interface.
+        Each set of values is either a dictionary of keyword values or
+        a list of positional values.
+        """
+        bindings = [
+            list(binding.items()) if isinstance(binding, dict) else list(binding)
+            for binding in bindings
+        ]
+        return (
+            _interface.dispatch(
+                Template.instantiate_many.__name__,
+                self.template,
+                self.language,
+                bindings,
+            )
+            or []
+        )
+
+
+# Batched AST mutation
+class Editor:
+    """
+    Record cut, insert, and replace edits against a single root and apply
+    them together in a single request, yielding a single new root.
+
+    For instance, to replace every "x" identifier in root with "y":
+
+    ```
+    editor = Editor(root)
+    for ast in root:
+        if isinstance(ast, IdentifierAST) and ast.source_text == "x":
+            editor.replace(ast, "y")
+    new_root = editor.commit()
+    ```
+
+    All edits are expressed in terms of subtrees of the original root.
+    Edits which conflict, such as replacing a subtree and also editing
+    within it, are rejected when the edits are committed.
+    """
+
+    def __init__(self, root: AST) -> None:
+        """Create an editor recording edits against ROOT."""
+        self._root = root
+        self._edits = []
+
+    def __len__(self) -> int:
+        """Return the number of edits recorded."""
+        return len(self._edits)
+
+    @property
+    def root(self) -> AST:
+        """Return the root the edits are recorded against."""
+        return self._root
+
+    def cut(self, pt: AST) -> "Editor":
+        """Record the removal of pt."""
+        AST._root_mutation_check(self.root, pt)
+        self._edits.append(("cut", pt))
+        return self
+
+    def replace(self, pt: AST, value: LiteralOrAST) -> "Editor":
+        """Record the replacement of pt with value."""
+        AST._root_mutation_check(self.root, pt)
+        self._edits.append(("replace", pt, self._edit_value(value)))
+        return self
+
+    def insert(self, pt: AST, value: LiteralOrAST) -> "Editor":
+        """Record the insertion of value at pt."""
+        AST._root_mutation_check(self.root, pt)
+        self._edits.append(("insert", pt, self._edit_value(value)))
+        return self
+
+    def commit(self) -> AST:
+        """Return a new root with all of the recorded edits applied."""
+        if not self._edits:
+            return self.root
+        new_root = _interface.dispatch("apply_edits", self.root, self._edits)
+        return new_root._derived_from(self.root)
+
+    @staticmethod
+    def _edit_value(value: LiteralOrAST) -> Union[AST, str]:
+        """
+        Return value as an AST or as source text to be parsed by the
+        interface when the edits are committed.
+        """
+        if isinstance(value, AST):
+            AST._mutation_value_check(value)
+            return value
+        else:
+            return str(value)
+
+
+# Parallel rewriting of many files
+class RewriteResult(NamedTuple):
+    """
+    Result of rewriting a single input with rewrite_many.  On success,
+    source holds the rewritten source text (and diff a unified diff
+    against the original, if requested); on failure, error holds the
+    formatted exception raised while rewriting the input.
+    """
+
+    index: int
+    name: str
+    source: Optional[str] = None
+    diff: Optional[str] = None
+    error: Optional[str] = None
+
+
+def rewrite_many(
+    inputs: Iterable[Union[str, Path, AST]],
+    transformer: Callable[[AST], Optional[LiteralOrAST]],
+    *,
+    language: Optional[ASTLanguage] = None,
+    workers: Optional[int] = None,
+    diff: bool = False,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Generator[RewriteResult, None, None]:
+    """
+    Apply the transformer to each of inputs, file paths or root ASTs, in
+    parallel, yielding a RewriteResult for each input as it completes.
+
+    Inputs are distributed across worker processes (by default, one per
+    CPU), each with its own tree-sitter-interface backend.  Root ASTs are
+    passed to the workers in their binary serialization, avoiding a
+    re-parse, and deserialized as part of rewriting them.  The transformer must be picklable, i.e. defined at the
+    top level of a module.  When workers is 0, the inputs are rewritten
+    in the current process instead.
+
+    An error rewriting any single input is reported in the error field of
+    its result and does not affect the rewriting of other inputs.  When
+    given, progress is called with the number of inputs completed and the
+    total number of inputs after each input completes.  Results are yielded
+    in order of completion; the index field gives the position of the
+    corresponding input.
+    """
+    tasks = []
+    for index, item in enumerate(inputs):
+        if isinstance(item, AST):
+            task = (index, f"<ast {item.oid}>", item.to_bytes(), language)
+        else:
+            task = (index, str(item), None, language)
+        tasks.append(task + (transformer, diff))
+
+    if workers == 0:
+        results = map(_rewrite_one, tasks)
+        yield from _report_rewrite_progress(results, len(tasks), progress)
+    else:
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(workers) as pool:
+            results = pool.imap_unordered(_rewrite_one, tasks)
+            yield from _report_rewrite_progress(results, len(tasks), progress)
+
+
+def _report_rewrite_progress(
+    results: Iterable[RewriteResult],
+    total: int,
+    progress: Optional[Callable[[int, int], None]],
+) -> Generator[RewriteResult, None, None]:
+    """Yield results, calling progress with the count completed after each."""
+    for completed, result in enumerate(results, start=1):
+        if progress:
+            progress(completed, total)
+        yield result
+
+
+def _rewrite_one(task: Tuple[Any, ...]) -> RewriteResult:
+    """Rewrite a single rewrite_many task, capturing any error raised."""
+    index, name, data, language, transformer, diff = task
+    try:
+        if data is None:
+            text = Path(name).read_text()
+            root = AST.from_string(text, language)
+        else:
+            root = AST.from_bytes(data)
+            text = root.source_text
+        source = AST.transform(root, transformer).source_text
+        if not diff:
+            return RewriteResult(index, name, source)
+        lines = difflib.unified_diff(
+            text.splitlines(keepends=True),
+            source.splitlines(keepends=True),
+            fromfile=name,
+            tofile=name,
+        )
+        return RewriteResult(index, name, source, "".join(lines))
+    except Exception:
+        return RewriteResult(index, name, error=traceback.format_exc())
+
+
 # Tree-sitter interface process management
 class _interface:
     """
@@ -487,21 +961,73 @@ class _interface:
     _DEFAULT_STARTUP_WAIT: Final[int] = 3
     _DEFAULT_SOCKET_TIMEOUT: Final[int] = 300
     _DEFAULT_GC_THRESHOLD: Final[int] = 128
+    _DEFAULT_CHUNK_SIZE: Final[int] = 1024
     _DEFAULT_QUIT_SENTINEL: Final[ByteString] = b"QUIT\n"
+    _DEFAULT_DAEMON: Final[Optional[str]] = os.environ.get("ASTS_DAEMON")
+    _DEFAULT_MAX_REQUESTS: Final[Optional[int]] = _env_int("ASTS_MAX_REQUESTS")
+    _DEFAULT_MAX_HEAP: Final[Optional[int]] = _env_int("ASTS_MAX_HEAP")
+    _DEFAULT_MAX_LIVE_ASTS: Final[Optional[int]] = _env_int("ASTS_MAX_LIVE_ASTS")
+    _DEFAULT_WATCHDOG_INTERVAL: Final[int] = 256
+    _DEFAULT_TIMEOUT_GRACE: Final[float] = 1.0
+    _DEFAULT_UNIX_SOCKET: Final[bool] = bool(os.environ.get("ASTS_UNIX_SOCKET"))
+    _DEFAULT_SHARED_MEMORY: Final[Optional[int]] = _env_int("ASTS_SHARED_MEMORY")
+    _DEFAULT_QUERY_CACHE_SIZE: Final[Optional[int]] = _env_int("ASTS_QUERY_CACHE_SIZE")
+    _PURE_QUERIES: Final[frozenset] = frozenset(
+        [
+            "lookup",
+            "parent",
+            "ast_path",
+            "child_slot",
+            "imports",
+            "provided_by",
+            "function_name",
+            "function_parameters",
+            "function_body",
+            "call_function",
+            "call_arguments",
+        ]
+    )
 
     _proc: ClassVar[Optional[subprocess.Popen]] = None
+    _socket: ClassVar[Optional[socket.socket]] = None
+    _socket_file: ClassVar[Optional[Any]] = None
+    _socket_dir: ClassVar[Optional[str]] = None
+    _daemon_pid: ClassVar[Optional[int]] = None
+    _live_asts: ClassVar[weakref.WeakValueDictionary] = weakref.WeakValueDictionary()
+    _requests: ClassVar[int] = 0
+    _restarting: ClassVar[bool] = False
+    _local: ClassVar[threading.local] = threading.local()
     _lock: ClassVar[multiprocessing.RLock] = multiprocessing.RLock()
     _gc_oids: ClassVar[List[int]] = []
+    _hashes: ClassVar[Dict[int, int]] = {}
+    _shm_paths: ClassVar[Set[str]] = set()
+    _query_cache_size: ClassVar[Optional[int]] = _DEFAULT_QUERY_CACHE_SIZE
+    _query_cache: ClassVar[collections.OrderedDict] = collections.OrderedDict()
+    _query_cache_oids: ClassVar[Dict[int, set]] = {}
+    _query_cache_stale: ClassVar[List[int]] = []
+    _query_cache_hits: ClassVar[int] = 0
+    _query_cache_misses: ClassVar[int] = 0
 
     @staticmethod
     def is_process_running() -> bool:
-        """Return TRUE if the Lisp subprocess is running."""
+        """
+        Return TRUE if the Lisp subprocess is running or, when using a
+        shared daemon, if this process is connected to it.
+        """
+        if _interface._DEFAULT_DAEMON:
+            return (
+                _interface._socket is not None and _interface._daemon_pid == os.getpid()
+            )
         return _interface._proc is not None and _interface._proc.poll() is None
 
     @staticmethod
     def _check_for_process_crash() -> None:
         """Check if the Lisp subprocess has crashed and, if so, throw an error."""
-        if not _interface.is_process_running():
+        if _interface._DEFAULT_DAEMON:
+            if not _interface.is_process_running():
+                msg = f"Not connected to {_interface._DEFAULT_DAEMON}."
+                raise RuntimeError(msg)
+        elif not _interface.is_process_running():
             stdout = _interface._proc.stdout.read().decode().strip()
             stderr = _interface._proc.stderr.read().decode().strip()
 
@@ -512,27 +1038,37 @@ class _interface:
 
     @staticmethod
     def start() -> None:
-        """Start the tree-sitter-interface Lisp process."""
+        """
+        Start the tree-sitter-interface Lisp process or, if the ASTS_DAEMON
+        environment variable gives the host:port of a shared interface
+        started with `tree-sitter-interface --port PORT --daemon`, connect
+        to it instead.
+        """
         with _interface._lock:
-            if not _interface.is_process_running():
-                # Find the interface binary, either on the $PATH or in an
-                # installed python wheel.
-                cmd = _interface._DEFAULT_CMD_NAME
-                if not shutil.which(cmd):
-                    cmd = pkg_resources.resource_filename(
-                        __name__, _interface._DEFAULT_CMD_NAME
-                    )
-                    if not Path(cmd).exists():
-                        raise RuntimeError(
-                            f"{_interface._DEFAULT_CMD_NAME} binary must be on your $PATH."
-                        )
-
-                # Build the command line, listing on stdio or a port depending on
-                # if a DEFAULT_PORT has been specified.
+            if _interface._DEFAULT_DAEMON:
+                if not _interface.is_process_running():
+                    _interface._connect()
+            elif not _interface.is_process_running():
+                cmd = _interface._command()
+
+                # Build the command line, listing on stdio, a port, or a unix
+                # domain socket depending on if a DEFAULT_PORT has been
+                # specified or the ASTS_UNIX_SOCKET environment variable set.
+                # Given ASTS_SHARED_MEMORY, strings over that many characters
+                # are passed in shared memory files rather than inline.
                 if _interface._DEFAULT_PORT:
                     cmdline = [cmd, "--port", str(_interface._DEFAULT_PORT)]
+                elif _interface._uses_unix_socket():
+                    _interface._socket_dir = tempfile.mkdtemp(prefix="asts-")
+                    path = os.path.join(_interface._socket_dir, "interface.sock")
+                    cmdline = [cmd, "--socket", path]
                 else:
                     cmdline = [cmd]
+                if _interface._DEFAULT_SHARED_MEMORY:
+                    cmdline += [
+                        "--shared-memory",
+                        str(_interface._DEFAULT_SHARED_MEMORY),
+                    ]
 
                 # Startup the interface subprocess.
                 _interface._proc = subprocess.Popen(
@@ -567,14 +1103,200 @@ class _interface:
                         _interface._check_for_process_crash()
                         time.sleep(1.0)
 
+                # Wait up to _DEFAULT_STARTUP_WAIT seconds for the interface
+                # to create the unix domain socket and connect to it.
+                if _interface._uses_unix_socket():
+                    _interface._connect_unix_socket(path)
+
                 # Check if tree-sitter interface crashed on startup.
                 _interface._check_for_process_crash()
 
+    @staticmethod
+    def _command() -> str:
+        """
+        Return the path to the interface binary, either on the $PATH or in
+        an installed python wheel.
+        """
+        cmd = _interface._DEFAULT_CMD_NAME
+        if not shutil.which(cmd):
+            cmd = pkg_resources.resource_filename(
+                __name__, _interface._DEFAULT_CMD_NAME
+            )
+            if not Path(cmd).exists():
+                raise RuntimeError(
+                    f"{_interface._DEFAULT_CMD_NAME} binary must be on your $PATH."
+                )
+        return cmd
+
+    @staticmethod
+    def _connect() -> None:
+        """
+        Open a persistent connection to the shared interface daemon.  The
+        daemon keeps the references to ASTs held by each connection apart,
+        releasing them when the connection is closed.
+        """
+        host, port = _interface._DEFAULT_DAEMON.rsplit(":", 1)
+        _interface._socket = socket.create_connection((host, int(port)))
+        _interface._socket.settimeout(_interface._DEFAULT_SOCKET_TIMEOUT)
+        _interface._socket_file = _interface._socket.makefile("rwb")
+        _interface._daemon_pid = os.getpid()
+        _interface._gc_oids = []
+        _interface._query_cache_clear()
+
+    @staticmethod
+    def _uses_unix_socket() -> bool:
+        """
+        Return TRUE if the interface subprocess listens on a unix domain
+        socket, as the ASTS_UNIX_SOCKET environment variable is set and no
+        DEFAULT_PORT, which takes precedence, has been specified.
+        """
+        return _interface._DEFAULT_UNIX_SOCKET and not _interface._DEFAULT_PORT
+
+    @staticmethod
+    def _connect_unix_socket(path: str) -> None:
+        """
+        Open a persistent connection to the interface subprocess listening
+        on the unix domain socket at path once the socket has been created.
+        """
+        for _ in range(_interface._DEFAULT_STARTUP_WAIT * 10):
+            _interface._check_for_process_crash()
+            if os.path.exists(path):
+                break
+            time.sleep(0.1)
+
+        _interface._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        _interface._socket.connect(path)
+        _interface._socket.settimeout(_interface._DEFAULT_SOCKET_TIMEOUT)
+        _interface._socket_file = _interface._socket.makefile("rwb")
+
     @staticmethod
     def stop() -> None:
-        """Stop the tree-sitter-interface Lisp process."""
+        """
+        Stop the tree-sitter-interface Lisp process or, when using a shared
+        daemon, disconnect from it, leaving the daemon running.
+        """
         if _interface.is_process_running():
             _interface._communicate(_interface._DEFAULT_QUIT_SENTINEL)
+        if _interface._socket is not None:
+            _interface._socket_file.close()
+            _interface._socket.close()
+            _interface._socket = None
+        _interface._remove_files()
+
+        # Requests release their own shared memory files, but may never
+        # finish when stopping at exit.
+        if not _interface._restarting:
+            _interface._release_shared_memory(list(_interface._shm_paths))
+
+    @staticmethod
+    def _remove_files() -> None:
+        """
+        Remove the unix domain socket directory and the shared memory
+        files left unread, e.g. by a timed out request, of the stopped
+        interface process.
+        """
+        if _interface._socket_dir is not None:
+            shutil.rmtree(_interface._socket_dir, ignore_errors=True)
+            _interface._socket_dir = None
+        if _interface._proc is not None:
+            directory = _interface._shared_memory_dir() or tempfile.gettempdir()
+            pattern = f"asts-{_interface._proc.pid}-*.shm"
+            _interface._release_shared_memory(Path(directory).glob(pattern))
+
+    @staticmethod
+    def stats() -> Dict[str, int]:
+        """
+        Return the number of requests handled by the interface process,
+        its heap usage and heap limit in bytes, and its number of ASTs
+        referenced from python.
+        """
+        return _interface.dispatch("interface_stats")
+
+    @staticmethod
+    def query_cache_stats() -> Dict[str, int]:
+        """
+        Return the number of hits and misses of the cache of pure queries
+        enabled by setting ASTS_QUERY_CACHE_SIZE, and its number of entries.
+        """
+        return {
+            "hits": _interface._query_cache_hits,
+            "misses": _interface._query_cache_misses,
+            "entries": len(_interface._query_cache),
+        }
+
+    @staticmethod
+    def restart() -> None:
+        """
+        Restart the interface process, releasing its heap.  The ASTs live
+        in python are checkpointed before the restart and restored after
+        it, with their oids updated in place.  If the ASTs cannot be
+        checkpointed, they are invalidated instead.
+        """
+        with _interface._lock:
+            _interface._restarting = True
+            try:
+                asts = [
+                    ast for ast in _interface._live_asts.values() if ast.oid is not None
+                ]
+                try:
+                    data = _interface.dispatch("checkpoint", asts) if asts else None
+                except ASTException:
+                    data = None
+
+                _interface.stop()
+                if _interface._proc is not None:
+                    _interface._proc.wait()
+                _interface._gc_oids = []
+                _interface._query_cache_clear()
+                _interface.start()
+
+                # Restored ASTs keep their hashcodes, by their new oids.
+                oids = _interface.dispatch("restore", data) if data else []
+                hashes = {}
+                for ast, oid in itertools.zip_longest(asts, oids):
+                    if oid is None:
+                        _interface._invalidate(ast)
+                    else:
+                        hashes[oid] = hash(ast)
+                        ast._oid = oid
+                _interface._hashes = hashes
+            finally:
+                _interface._restarting = False
+
+    @staticmethod
+    def _invalidate(ast: AST) -> None:
+        """Invalidate AST, which no longer has an oid, keeping its hashcode."""
+        if ast._oid is not None:
+            ast._hash = hash(ast)
+            ast._oid = None
+
+    @staticmethod
+    def _watchdog() -> None:
+        """
+        Every _DEFAULT_WATCHDOG_INTERVAL requests, check the interface
+        process against the configured maximum requests, heap bytes, and
+        live ASTs, restarting it if any have been reached.  A shared daemon
+        is never restarted.
+        """
+        _interface._requests += 1
+        limits = {
+            "requests": _interface._DEFAULT_MAX_REQUESTS,
+            "heap": _interface._DEFAULT_MAX_HEAP,
+            "asts": _interface._DEFAULT_MAX_LIVE_ASTS,
+        }
+        if (
+            _interface._restarting
+            or _interface._DEFAULT_DAEMON
+            or _interface._requests % _interface._DEFAULT_WATCHDOG_INTERVAL
+            or all(limit is None for limit in limits.values())
+        ):
+            return
+
+        stats = _interface.stats()
+        if any(
+            limit is not None and stats[key] >= limit for key, limit in limits.items()
+        ):
+            _interface.restart()
 
     @staticmethod
     def dispatch(*args: Tuple[Any], **kwargs: Dict[str, Any]) -> Any:
@@ -582,6 +1304,8 @@ class _interface:
 
         def handle_errors(data: Any) -> Any:
             """Check for errors in the subprocess reported in the JSON output."""
+            if isinstance(data, dict) and data.get("timeout", None):
+                raise ASTTimeout(data["error"])
             if isinstance(data, dict) and data.get("error", None):
                 raise ASTException(data["error"])
 
@@ -590,9 +1314,16 @@ class _interface:
         def serialize(v: Any) -> Any:
             """Serialize V to a form for passing thru the JSON text interface."""
             if isinstance(v, AST):
+                if v.oid is None:
+                    name = type(v).__name__
+                    raise ASTException(f"{name} was invalidated by a restart.")
                 return {"type": "ast", "oid": v.oid}
             if isinstance(v, ASTLanguage):
                 return v.name
+            elif isinstance(v, str) and _interface._shares_memory(v):
+                path = _interface._write_shared_memory(v)
+                shm_paths.append(path)
+                return {"type": "shm", "path": path}
             elif isinstance(v, dict):
                 return {serialize(key): serialize(val) for key, val in v.items()}
             elif isinstance(v, list):
@@ -606,6 +1337,8 @@ class _interface:
             """Deserialize V from the form used with the JSON text interface."""
             if isinstance(v, dict) and v.get("oid", None):
                 return globals()[v["type"]](oid=v["oid"])
+            elif isinstance(v, dict) and v.get("type", None) == "shm":
+                return _interface._read_shared_memory(v["path"])
             elif isinstance(v, dict):
                 return {deserialize(key): deserialize(val) for key, val in v.items()}
             elif isinstance(v, list):
@@ -627,17 +1360,193 @@ class _interface:
         # than pushing each oid to the Lisp subprocess individually.
         if fn == "__del__" and args[0] is not None:
             _interface._gc_oids.append(args[0])
+            if _interface._query_cache_size:
+                _interface._query_cache_stale.append(args[0])
             return
 
-        # Build the request JSON to send to the subprocess.
-        request = [fn] + serialize(list(args)) + serialize(list(kwargs.items()))
-        request = f"{json.dumps(request)}\n".encode()
+        # Restart the subprocess between requests if it has exceeded any
+        # of the configured limits.  This precedes serialization as a
+        # restart assigns new oids to the live ASTs.
+        _interface._watchdog()
+
+        # Build the request JSON to send to the subprocess.  As ASTs are
+        # immutable, the results of pure queries are cached, when enabled,
+        # and returned without a request.  Shared memory files written for
+        # the request are removed afterwards if the subprocess has not
+        # read and removed them, e.g. as the request timed out.
+        shm_paths = []
+        try:
+            request = [fn] + serialize(list(args)) + serialize(list(kwargs.items()))
+            key = None
+            if _interface._query_cache_size and fn in _interface._PURE_QUERIES:
+                key = json.dumps(request)
+                found, result = _interface._query_cache_get(key)
+                if found:
+                    return result
+
+            # Within a deadline context, the request is wrapped to be
+            # cancelled by the subprocess when the time remaining before the
+            # deadline has passed.
+            deadline = getattr(_interface._local, "deadline", None)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ASTTimeout(f"Deadline passed before calling {fn}.")
+                request = ["with_timeout", remaining] + request
+            request = f"{json.dumps(request)}\n".encode()
 
-        # Send the request to the tree-sitter-interface and receive the response.
-        response = _interface._communicate(request)
+            # Send the request to the tree-sitter-interface and receive the
+            # response.
+            response = _interface._communicate(request, deadline)
+        finally:
+            _interface._release_shared_memory(shm_paths)
 
         # Load the response from the Lisp subprocess.
-        return deserialize(handle_errors(json.loads(response.decode())))
+        result = deserialize(handle_errors(json.loads(response.decode())))
+        if key is not None:
+            oids = [arg.oid for arg in args if isinstance(arg, AST)]
+            _interface._query_cache_put(key, oids, result)
+        return result
+
+    @staticmethod
+    def dispatch_chunks(
+        *args: Tuple[Any],
+        chunk_size: Optional[int] = None,
+    ) -> Generator[Any, None, None]:
+        """
+        Dispatch processing to the tree-sitter-interface, lazily yielding
+        the elements of the resulting list.  The function dispatched to
+        takes a start position and count as its final arguments and the
+        results are retrieved in chunks of CHUNK_SIZE elements so they are
+        never materialized at once and retrieval stops early if the
+        generator is not exhausted.
+        """
+        chunk_size = chunk_size or _interface._DEFAULT_CHUNK_SIZE
+        start = 0
+        while True:
+            chunk = _interface.dispatch(*args, start, chunk_size) or []
+            yield from chunk
+            if len(chunk) < chunk_size:
+                break
+            start += chunk_size
+
+    @staticmethod
+    def _query_cache_get(key: str) -> Tuple[bool, Any]:
+        """
+        Return a pair of whether the result of the query KEY is cached and
+        a copy of the cached result.  Entries for ASTs garbage collected
+        since the last lookup are invalidated first.
+        """
+        with _interface._lock:
+            while _interface._query_cache_stale:
+                oid = _interface._query_cache_stale.pop()
+                for stale in _interface._query_cache_oids.pop(oid, ()):
+                    _interface._query_cache.pop(stale, None)
+
+            if key not in _interface._query_cache:
+                _interface._query_cache_misses += 1
+                return False, None
+
+            _interface._query_cache_hits += 1
+            _interface._query_cache.move_to_end(key)
+            return True, _interface._copy_result(_interface._query_cache[key][1])
+
+    @staticmethod
+    def _query_cache_put(key: str, oids: List[int], result: Any) -> None:
+        """
+        Cache RESULT of the query KEY on the ASTs with OIDS, evicting the
+        least recently used entries beyond _query_cache_size.
+        """
+        with _interface._lock:
+            _interface._query_cache[key] = (oids, _interface._copy_result(result))
+            for oid in oids:
+                _interface._query_cache_oids.setdefault(oid, set()).add(key)
+
+            while len(_interface._query_cache) > _interface._query_cache_size:
+                evicted, (evicted_oids, _) = _interface._query_cache.popitem(last=False)
+                for oid in evicted_oids:
+                    keys = _interface._query_cache_oids.get(oid, set())
+                    keys.discard(evicted)
+                    if not keys:
+                        _interface._query_cache_oids.pop(oid, None)
+
+    @staticmethod
+    def _query_cache_clear() -> None:
+        """Clear the cache of pure queries when oids are reassigned."""
+        with _interface._lock:
+            _interface._query_cache.clear()
+            _interface._query_cache_oids.clear()
+            _interface._query_cache_stale = []
+
+    @staticmethod
+    def _copy_result(v: Any) -> Any:
+        """Copy the lists and dictionaries of V, leaving ASTs shared."""
+        if isinstance(v, list):
+            return [_interface._copy_result(i) for i in v]
+        elif isinstance(v, dict):
+            return {key: _interface._copy_result(val) for key, val in v.items()}
+        else:
+            return v
+
+    @staticmethod
+    def _shares_memory(text: str) -> bool:
+        """
+        Return TRUE if text is over the ASTS_SHARED_MEMORY threshold and
+        the interface subprocess, not a daemon, may read shared memory.
+        """
+        return (
+            _interface._DEFAULT_SHARED_MEMORY is not None
+            and not _interface._DEFAULT_DAEMON
+            and len(text) > _interface._DEFAULT_SHARED_MEMORY
+        )
+
+    @staticmethod
+    def _shared_memory_dir() -> Optional[str]:
+        """Return the directory for shared memory files, /dev/shm if present."""
+        return "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+    @staticmethod
+    def _write_shared_memory(text: str) -> str:
+        """
+        Write text to a fresh shared memory file through a memory map,
+        returning its path.  The file is deleted by its reader, or by
+        _release_shared_memory if it is never read.
+        """
+        data = text.encode()
+        fd, path = tempfile.mkstemp(
+            prefix="asts-", suffix=".shm", dir=_interface._shared_memory_dir()
+        )
+        try:
+            os.ftruncate(fd, len(data))
+            with mmap.mmap(fd, len(data)) as m:
+                m[:] = data
+        finally:
+            os.close(fd)
+        _interface._shm_paths.add(path)
+        return path
+
+    @staticmethod
+    def _read_shared_memory(path: str) -> str:
+        """
+        Return the text in the shared memory file at path, read through a
+        memory map, and delete the file.
+        """
+        try:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return ""
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    return m[:].decode()
+        finally:
+            _interface._release_shared_memory([path])
+
+    @staticmethod
+    def _release_shared_memory(paths: Iterable[Union[str, Path]]) -> None:
+        """Delete the shared memory files at paths which still exist."""
+        for path in paths:
+            _interface._shm_paths.discard(str(path))
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
 
     @staticmethod
     def _gc() -> None:
@@ -656,48 +1565,133 @@ class _interface:
             _interface._communicate(request)
 
     @staticmethod
-    def _communicate(request: ByteString) -> ByteString:
-        """Communicate request to the Lisp subprocess and receive response."""
+    def _reset() -> None:
+        """
+        Forcibly stop the tree-sitter-interface, invalidating all of the live
+        ASTs, and start a fresh one.  This is used to cancel a request the
+        Lisp subprocess has failed to cancel itself.
+        """
+        with _interface._lock:
+            for ast in list(_interface._live_asts.values()):
+                _interface._invalidate(ast)
+            _interface._hashes = {}
+
+            if _interface._socket is not None:
+                _interface._socket_file.close()
+                _interface._socket.close()
+                _interface._socket = None
+            if not _interface._DEFAULT_DAEMON and _interface._proc is not None:
+                _interface._proc.kill()
+                _interface._proc.wait()
+            _interface._remove_files()
+
+            _interface._gc_oids = []
+            _interface._query_cache_clear()
+            _interface.start()
+
+    @staticmethod
+    def _communicate(
+        request: ByteString,
+        deadline: Optional[float] = None,
+    ) -> ByteString:
+        """
+        Communicate request to the Lisp subprocess and receive response.
+        When a deadline is given, raise ASTTimeout if the response is not
+        received shortly after the deadline, resetting the subprocess.
+        """
 
-        def recvline(socket: socket.socket) -> ByteString:
+        def recvline(s: socket.socket) -> ByteString:
             """Read a single line from the socket."""
             chunks = []
             while True:
                 chunk = s.recv(1024)
                 chunks.append(chunk)
-                if chunk.endswith(b"\n"):
+                if not chunk or chunk.endswith(b"\n"):
                     break
 
-            response = "".join(chunks)
+            response = b"".join(chunks)
             return response
 
+        def readline_within(f: Any, timeout: float) -> ByteString:
+            """
+            Read a single line from the pipe f, raising socket.timeout if
+            the full line has not been read within timeout seconds.
+            """
+            end = time.monotonic() + timeout
+            chunks = []
+            while True:
+                remaining = end - time.monotonic()
+                if remaining <= 0 or not select.select([f], [], [], remaining)[0]:
+                    raise socket.timeout()
+                chunk = os.read(f.fileno(), 65536)
+                chunks.append(chunk)
+                if not chunk or chunk.endswith(b"\n"):
+                    break
+
+            return b"".join(chunks)
+
+        def seconds_until(deadline: float, grace: float = 0.0) -> float:
+            """Return the number of seconds until deadline, plus grace."""
+            return max(0.0, deadline - time.monotonic()) + grace
+
         # Send the request to the Lisp subprocess, either over a socket or
         # on standard input, and wait for a response.  This section is locked
         # to prevent issues with multiple threads writing at the same time.
-        with _interface._lock:
+        # Within a deadline, waiting for the lock is also bounded.
+        lock_timeout = None if deadline is None else seconds_until(deadline)
+        if not _interface._lock.acquire(timeout=lock_timeout):
+            raise ASTTimeout("Deadline passed waiting for the interface.")
+
+        try:
             # Preliminaries:
             #  (1) Send list of object ids (oids) to garbage collect to the Lisp
             #      subprocess, if applicable.  See comment above re: deadlocks.
             #  (2) Check the process hasn't crashed before communicating with it.
+            #      When using a shared daemon, a forked child process opens its
+            #      own connection rather than sharing its parent's.
+            if _interface._DEFAULT_DAEMON and _interface._daemon_pid != os.getpid():
+                _interface._connect()
             _interface._gc()
             _interface._check_for_process_crash()
 
-            # Send the request and receive the response.
-            if _interface._DEFAULT_PORT:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.connect((_interface._DEFAULT_HOST, _interface._DEFAULT_PORT))
-                    s.settimeout(_interface._DEFAULT_SOCKET_TIMEOUT)
-                    s.sendall(request)
-                    response = recvline(s).strip()
+            # Send the request and receive the response.  The subprocess
+            # cancels requests at their deadline, so allow a grace period
+            # for the response reporting the cancellation to arrive.
+            if deadline is None:
+                timeout = _interface._DEFAULT_SOCKET_TIMEOUT
             else:
-                _interface._proc.stdin.write(request)
-                _interface._proc.stdin.flush()
-                response = _interface._proc.stdout.readline().strip()
+                timeout = seconds_until(deadline, _interface._DEFAULT_TIMEOUT_GRACE)
+
+            try:
+                if _interface._DEFAULT_DAEMON or _interface._uses_unix_socket():
+                    _interface._socket.settimeout(timeout)
+                    _interface._socket_file.write(request)
+                    _interface._socket_file.flush()
+                    response = _interface._socket_file.readline().strip()
+                elif _interface._DEFAULT_PORT:
+                    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                        s.connect((_interface._DEFAULT_HOST, _interface._DEFAULT_PORT))
+                        s.settimeout(timeout)
+                        s.sendall(request)
+                        response = recvline(s).strip()
+                else:
+                    _interface._proc.stdin.write(request)
+                    _interface._proc.stdin.flush()
+                    if deadline is None:
+                        response = _interface._proc.stdout.readline().strip()
+                    else:
+                        response = readline_within(_interface._proc.stdout, timeout)
+                        response = response.strip()
+            except socket.timeout:
+                _interface._reset()
+                raise ASTTimeout("Deadline passed, the interface has been reset.")
 
             # Post:
             #  (1) Check the process hasn't crashed after communicating with it.
             if request != _interface._DEFAULT_QUIT_SENTINEL:
                 _interface._check_for_process_crash()
+        finally:
+            _interface._lock.release()
 
         return response
 
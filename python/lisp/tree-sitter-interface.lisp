@@ -19,6 +19,13 @@
         :software-evolution-library/utility/range
         :software-evolution-library/python/lisp/utility)
   (:import-from :software-evolution-library :oid)
+  (:import-from :functional-trees/attrs :with-attr-table)
+  (:import-from :trivial-garbage :make-weak-hash-table)
+  (:import-from :bordeaux-threads)
+  (:import-from :cl-store)
+  (:import-from :cl-base64)
+  (:import-from :flexi-streams)
+  (:import-from :cffi)
   #-windows (:import-from :osicat)
   (:import-from :deploy :define-library)
   (:export :run-tree-sitter-interface))
@@ -29,15 +36,69 @@
 (eval-when (:compile-toplevel :load-toplevel :execute)
   (defparameter +interface-command-line-options+
     '((("port") :type integer
-       :documentation "listen for requests on the given port"))
+       :documentation "listen for requests on the given port")
+      (("daemon") :type boolean :optional t
+       :documentation "with --port, serve many persistent clients at once")
+      (("threads") :type integer :optional t :initial-value 1
+       :documentation "handle requests using the given number of worker threads")
+      (("socket") :type string
+       :documentation "listen for requests on a unix domain socket at the given path")
+      (("shared-memory") :type integer
+       :documentation "pass strings over the given length in shared memory files"))
     "tree-sitter-interface command line options."))
 
 #-windows
 (define-library osicat-posix::librt :dont-open t :dont-deploy t)
 
-(defvar *external-asts* (make-hash-table)
+(defun make-shared-hash-table (&rest args &key weakness &allow-other-keys)
+  "Return a hash table, weak if WEAKNESS is given, which is safe to access
+from the worker threads handling requests concurrently."
+  (apply (if weakness #'make-weak-hash-table #'make-hash-table)
+         #+sbcl :synchronized #+sbcl t
+         (if weakness args (remove-from-plist args :weakness))))
+
+(defvar *external-asts* (make-shared-hash-table)
   "Mapping of hashes to (AST . refcount) pairs for externally referenced ASTs.")
 
+(defvar *external-ast-locks*
+  (coerce (iter (repeat 64) (collect (bt:make-lock "external-asts"))) 'vector)
+  "Locks striped over oids serializing updates to the reference counts
+in `*external-asts*'.")
+
+(defvar *root-caches* (make-shared-hash-table)
+  "Mapping of AST oids to hash tables of values computed from the AST,
+cached until the AST is deallocated.")
+
+(defvar *template-matchers* (make-shared-hash-table :test #'equal)
+  "Mapping of (template . language) pairs to compiled template matchers.")
+
+(defvar *compiled-templates* (make-shared-hash-table :test #'equal)
+  "Mapping of (template . language) pairs to compiled AST templates.")
+
+(defvar *source-texts* (make-shared-hash-table :weakness :key)
+  "Weak mapping of ASTs to their generated source text.")
+
+(defvar *source-bases* (make-shared-hash-table :weakness :key)
+  "Weak mapping of roots created by mutations to the generated source text
+of the root they were derived from, if any.")
+
+(defvar *request-count* 0
+  "Number of requests handled by the interface.")
+
+(defvar *request-count-lock* (bt:make-lock "request-count")
+  "Lock serializing updates to `*request-count*'.")
+
+(defvar *output-lock* (bt:make-lock "output")
+  "Lock serializing the responses written by the worker threads.")
+
+(defvar *shared-memory-threshold* nil
+  "When non-nil, strings in responses longer than this many characters are
+written to shared memory files referenced from the response.")
+
+(defvar *shared-parses* nil
+  "When non-nil, a weak mapping of parse arguments to the ASTs parsed
+from them, allowing the immutable trees to be shared between clients.")
+
 (defmacro with-muffled-warnings (&body body)
   "Execute BODY in an environment where warnings are muffled."
   `(handler-bind ((warning #'muffle-warning))
@@ -50,17 +111,59 @@
            (*error-output* (make-string-output-stream)))
        ,@body)))
 
-(defmacro with-error-logging (stream &body body)
+(define-condition interface-timeout (error)
+  ((seconds :initarg :seconds :reader interface-timeout-seconds))
+  (:report (lambda (condition stream)
+             (format stream "Request cancelled after ~,3f seconds."
+                     (interface-timeout-seconds condition))))
+  (:documentation "Condition raised when a request exceeds its deadline."))
+
+(defmacro without-timeouts (&body body)
+  "Execute BODY deferring the `interface-timeout' of the request until it
+completes, so shared state is never left half updated by the timeout."
+  #+sbcl `(sb-sys:without-interrupts ,@body)
+  #-sbcl `(progn ,@body))
+
+(defmacro with-external-ast-lock ((oid) &body body)
+  "Execute BODY holding the lock in `*external-ast-locks*' for OID,
+without timeouts."
+  `(without-timeouts
+     (bt:with-lock-held ((svref *external-ast-locks*
+                                (mod ,oid (length *external-ast-locks*))))
+       ,@body)))
+
+(defmacro ensure-root-cache ((root key) &body body)
+  "Return the value cached under KEY for ROOT in *root-caches*, computing
+it by executing BODY on first use.  The cache of ROOT is found or created
+holding the lock of its oid, as `deallocate-ast' removes it, and only while
+ROOT is externally referenced, so it is never recreated for a deallocated
+root.  Otherwise BODY is executed without caching."
+  (with-gensyms (oid cache)
+    `(let* ((,oid (oid ,root))
+            (,cache (with-external-ast-lock (,oid)
+                      (when (gethash ,oid *external-asts*)
+                        (ensure-gethash ,oid *root-caches*
+                                        (make-shared-hash-table
+                                         :test #'equal))))))
+       (if ,cache
+           (ensure-gethash ,key ,cache (progn ,@body))
+           (progn ,@body)))))
+
+(defmacro with-error-logging ((stream &optional id) &body body)
   "Execute BODY in an environment where errors are caught and
-reported back to the client in JSON form over STREAM."
+reported back to the client in JSON form over STREAM, tagged with the
+value of ID when non-nil."
   `(handler-case
        (progn ,@body)
      (condition (c)
        (format ,stream "~a~%"
                (nest (encode-json-to-string)
-                     (list (cons :error
-                                 (with-output-to-string (s)
-                                   (print-condition c s)))))))))
+                     (append (when ,id (list (cons :id ,id))))
+                     (list* (cons :error
+                                  (with-output-to-string (s)
+                                    (print-condition c s)))
+                            (when (typep c 'interface-timeout)
+                              (list (cons :timeout t)))))))))
 
 (declaim (inline safe-intern))
 (defun safe-intern (string) (intern (string-upcase string) :sel/py/lisp/ts-int))
@@ -70,6 +173,12 @@ reported back to the client in JSON form over STREAM."
   "Return T if PAIR represents a potential pair in an alist."
   (and (consp pair) (atom (car pair)) (not (null (cdr pair)))))
 
+(-> tagged-request-p (t) boolean)
+(defun tagged-request-p (json)
+  "Return T if JSON is a request tagged with an id by an asynchronous
+client, which matches responses to its requests in flight by their id."
+  (and (consp json) (alist-pair-p (first json)) (assoc :id json) t))
+
 (-> function-string-to-symbol (string) symbol)
 (defun function-string-to-symbol (function-str)
   "Convert the python FUNCTION-STR to a symbol for the associated CL function."
@@ -92,9 +201,10 @@ reported back to the client in JSON form over STREAM."
 increment the reference counter to allow for its use externally without
 garbage collection, returning the key used in the *external-asts* hashtable.")
   (:method ((ast ast) &aux (oid (oid ast)))
-    (symbol-macrolet ((ast-refcount-pair (gethash oid *external-asts*)))
-      (when (not ast-refcount-pair) (setf ast-refcount-pair (cons ast 0)))
-      (incf (cdr ast-refcount-pair)))
+    (with-external-ast-lock (oid)
+      (symbol-macrolet ((ast-refcount-pair (gethash oid *external-asts*)))
+        (when (not ast-refcount-pair) (setf ast-refcount-pair (cons ast 0)))
+        (incf (cdr ast-refcount-pair))))
     oid))
 
 ;; (-> deallocate-ast (or ast integer) boolean)
@@ -105,10 +215,12 @@ was performed.")
   (:method ((ast ast))
     (deallocate-ast (oid ast)))
   (:method ((oid integer))
-    (when (gethash oid *external-asts*)
-      (let ((ref-count (decf (cdr (gethash oid *external-asts*)))))
-        (when (zerop ref-count)
-          (remhash oid *external-asts*))))))
+    (with-external-ast-lock (oid)
+      (when (gethash oid *external-asts*)
+        (let ((ref-count (decf (cdr (gethash oid *external-asts*)))))
+          (when (zerop ref-count)
+            (remhash oid *root-caches*)
+            (remhash oid *external-asts*)))))))
 
 ;; (-> serialize (t) t)
 (defgeneric serialize (it)
@@ -119,6 +231,10 @@ was performed.")
     `((:type . ,(cl-to-python-type (type-of it)))
       (:oid . ,(oid it))))
   (:method ((it list)) (mapcar-improper-list #'serialize it))
+  (:method ((it string))
+    (if (and *shared-memory-threshold* (> (length it) *shared-memory-threshold*))
+        `((:type . "shm") (:path . ,(write-shared-memory it)))
+        it))
   (:method ((it t)) it))
 
 ;; (-> deserialize (t) t)
@@ -128,6 +244,8 @@ was performed.")
     (match it
       ((alist (:oid . oid) (:type . "ast"))
        (car (gethash oid *external-asts*)))
+      ((alist (:path . path) (:type . "shm"))
+       (read-shared-memory path))
       ((guard it (every #'alist-pair-p it))
        (mapcar (lambda (pair)
                  (cons (deserialize (car pair)) (deserialize (cdr pair))))
@@ -135,10 +253,63 @@ was performed.")
       ((list* _) (mapcar #'deserialize it))))
   (:method ((it t)) it))
 
+(-> shared-memory-directory () (values pathname &optional))
+(defun shared-memory-directory ()
+  "Return the directory for shared memory files, /dev/shm/ if present."
+  (or (uiop:directory-exists-p #p"/dev/shm/") (uiop:temporary-directory)))
+
+(-> shared-memory-prefix () (values string &optional))
+(defun shared-memory-prefix ()
+  "Return the prefix of the shared memory files written by this process.
+The prefix includes the pid of the process so that the client may delete
+the files left unread when it kills the process."
+  #-windows (fmt "asts-~d-" (osicat-posix:getpid))
+  #+windows "asts-")
+
+(-> write-shared-memory (string) (values string &optional))
+(defun write-shared-memory (string)
+  "Write STRING to a fresh shared memory file, returning its path.  The
+file is deleted by its reader."
+  (namestring
+   (uiop:with-temporary-file (:stream out :pathname path :keep t
+                              :directory (shared-memory-directory)
+                              :prefix (shared-memory-prefix) :type "shm"
+                              :element-type '(unsigned-byte 8))
+     (write-sequence (flexi-streams:string-to-octets string
+                                                     :external-format :utf-8)
+                     out)
+     path)))
+
+(-> read-shared-memory (string) (values string &optional))
+(defun read-shared-memory (path)
+  "Return the string in the shared memory file at PATH, read by mapping
+the file into memory, and delete the file."
+  (unwind-protect
+       #-windows
+       (let ((fd (osicat-posix:open path osicat-posix:o-rdonly)))
+         (unwind-protect
+              (let ((size (osicat-posix:stat-size (osicat-posix:fstat fd))))
+                (if (zerop size)
+                    ""
+                    (let ((pointer (osicat-posix:mmap (cffi:null-pointer) size
+                                                      osicat-posix:prot-read
+                                                      osicat-posix:map-shared
+                                                      fd 0)))
+                      (unwind-protect
+                           (values (cffi:foreign-string-to-lisp
+                                    pointer :count size :encoding :utf-8))
+                        (osicat-posix:munmap pointer size)))))
+           (osicat-posix:close fd)))
+       #+windows
+       (read-file-into-string path :external-format :utf-8)
+    (delete-file path)))
+
 (-> handle-interface (list) t)
 (defun handle-interface (json)
   "Handle a JSON input from the INTERFACE.  The JSON list should start with a
 function name from the API followed by the arguments."
+  (bt:with-lock-held (*request-count-lock*)
+    (incf *request-count*))
   (destructuring-bind (function-str . arguments) json
     (serialize
      (with-suppressed-output
@@ -154,18 +325,192 @@ function name from the API followed by the arguments."
 
 (defgeneric handle-request (request output)
   (:documentation "Process the given REQUEST and write the response to OUTPUT.")
-  (:method ((request string) (stream stream))
-    (unwind-protect
-        (with-error-logging stream
-          (format stream "~a~%"
-                  (nest (encode-json-to-string)
-                        (handle-interface)
-                        (decode-json-from-string request))))
-      (finish-output stream)
-      (unless (eq stream *standard-output*) (close stream))))
+  (:method ((request string) (stream stream) &aux id)
+    (let ((response
+           (with-output-to-string (out)
+             (with-error-logging (out id)
+               (let ((json (decode-json-from-string request)))
+                 ;; Requests tagged with an id, {"id": ID, "request": [...]},
+                 ;; are answered with {"id": ID, "result": ...} so
+                 ;; asynchronous clients may have many requests in flight
+                 ;; at once.
+                 (when (tagged-request-p json)
+                   (setf id (cdr (assoc :id json))
+                         json (cdr (assoc :request json))))
+                 (format out "~a~%"
+                         (nest (encode-json-to-string)
+                               (if id
+                                   `((:id . ,id)
+                                     (:result . ,(handle-interface json)))
+                                   (handle-interface json)))))))))
+      ;; Responses are written whole so the responses of worker threads
+      ;; sharing an output stream are not interleaved.
+      (bt:with-lock-held (*output-lock*)
+        (unwind-protect (write-string response stream)
+          (finish-output stream)))))
   (:method ((request string) (socket usocket))
     (handle-request request (socket-stream socket))))
 
+;;;; Worker pool:
+(defclass worker-pool ()
+  ((jobs :initform (queue) :reader worker-pool-jobs
+         :documentation "Queue of functions waiting for a worker thread.")
+   (lock :initform (bt:make-lock "worker-pool") :reader worker-pool-lock
+         :documentation "Lock guarding the queue of jobs.")
+   (available :initform (bt:make-condition-variable)
+              :reader worker-pool-available
+              :documentation "Condition notified when a job is queued.")
+   (threads :initform nil :accessor worker-pool-threads
+            :documentation "The worker threads running queued jobs."))
+  (:documentation "Pool of worker threads handling requests concurrently.
+As ASTs are immutable, requests on any roots may run in parallel, with
+updates to the shared tables serialized by their locks."))
+
+(-> submit-job ((or worker-pool null) function) (values &optional))
+(defun submit-job (pool job)
+  "Queue the function JOB to be called by a worker thread of POOL, or
+call it immediately if POOL is nil."
+  (if pool
+      (bt:with-lock-held ((worker-pool-lock pool))
+        (enq job (worker-pool-jobs pool))
+        (bt:condition-notify (worker-pool-available pool)))
+      (funcall job))
+  (values))
+
+(-> run-worker (worker-pool) (values &optional))
+(defun run-worker (pool)
+  "Call the jobs queued in POOL until the :stop job is reached.  Errors
+escaping a job, such as a client disconnecting before its response is
+written, do not stop the worker."
+  (iter (for job = (bt:with-lock-held ((worker-pool-lock pool))
+                     (iter (while (queue-empty-p (worker-pool-jobs pool)))
+                           (bt:condition-wait (worker-pool-available pool)
+                                              (worker-pool-lock pool)))
+                     (deq (worker-pool-jobs pool))))
+        (until (eq job :stop))
+        (ignore-errors (funcall job)))
+  (values))
+
+(defmacro with-worker-pool ((pool threads) &body body)
+  "Execute BODY with POOL bound to a pool of THREADS worker threads, or to
+nil if THREADS is one, waiting for the queued jobs to finish on exit."
+  `(let ((,pool (when (> ,threads 1) (make-instance 'worker-pool))))
+     (when ,pool
+       (setf (worker-pool-threads ,pool)
+             (iter (repeat ,threads)
+                   (collect (bt:make-thread (lambda () (run-worker ,pool))
+                                            :name "interface-worker")))))
+     (unwind-protect (progn ,@body)
+       (when ,pool
+         (dolist (thread (worker-pool-threads ,pool))
+           (declare (ignorable thread))
+           (submit-job ,pool :stop))
+         (mapc #'bt:join-thread (worker-pool-threads ,pool))))))
+
+;;;; Multi-client daemon:
+(defclass interface-client ()
+  ((external-asts :initform (make-shared-hash-table)
+                  :reader client-external-asts
+                  :documentation "The client's own `*external-asts*' table.")
+   (root-caches :initform (make-shared-hash-table) :reader client-root-caches
+                :documentation "The client's own `*root-caches*' table."))
+  (:documentation "State for a client connected to a daemon, holding its
+own namespace of externally referenced ASTs."))
+
+(-> serve-client (interface-client usocket &optional (or worker-pool null) t)
+    (values &optional))
+(defun serve-client (client connection &optional pool lock)
+  "Handle the requests read from CLIENT on CONNECTION until the client
+quits or disconnects, using the worker threads of POOL if given, in the
+namespace of the client.  Without POOL, requests are handled holding LOCK
+if given.  Any error ends the connection of this client only."
+  (let ((shared-parses *shared-parses*)
+        (output-lock (bt:make-lock "client-output")))
+    (flet ((handle (request)
+             (let ((*external-asts* (client-external-asts client))
+                   (*root-caches* (client-root-caches client))
+                   (*shared-parses* shared-parses)
+                   ;; Responses to other clients are never held up by a
+                   ;; client slow to read its own.
+                   (*output-lock* output-lock))
+               (handle-request request connection))))
+      (handler-case
+          (iter (for request = (read-request connection))
+                (until (equalp request "quit"))
+                (submit-job pool
+                            (let ((request request))
+                              (lambda ()
+                                (if lock
+                                    (bt:with-lock-held (lock) (handle request))
+                                    (handle request))))))
+        (error () nil))))
+  (values))
+
+(-> serve-clients (usocket &optional (or worker-pool null)) (values &optional))
+(defun serve-clients (socket &optional pool)
+  "Serve persistent client connections accepted on SOCKET until the
+process is killed.  Each connection is read on its own thread, so a slow
+client never holds up the others, and its requests are handled by the
+worker threads of POOL, if given, or one at a time otherwise.  Each
+client has its own `*external-asts*' table so that on disconnect exactly
+the references held by that client are released.  Parsed trees are
+immutable and are shared between clients parsing identical source text."
+  (let ((shared-parses (make-shared-hash-table :test #'equal :weakness :value))
+        (lock (unless pool (bt:make-lock "interface-requests"))))
+    (iter (for connection = (handler-case (socket-accept socket)
+                              (error () nil)))
+          (when connection
+            (let ((connection connection))
+              (bt:make-thread
+               (lambda ()
+                 (let ((*shared-parses* shared-parses))
+                   (unwind-protect
+                        (serve-client (make-instance 'interface-client)
+                                      connection pool lock)
+                     (ignore-errors (socket-close connection)))))
+               :name "interface-client"))))))
+
+(-> serve-stream (stream stream &optional (or worker-pool null)) boolean)
+(defun serve-stream (input output &optional pool)
+  "Handle the requests read from INPUT, using the worker threads of POOL
+if given, writing the responses to OUTPUT.  Return t when quit is
+requested, or nil when INPUT is closed."
+  (iter (for request = (handler-case (read-request input)
+                         (end-of-file () (return nil))))
+        (when (equalp request "quit")
+          (return t))
+        (submit-job pool
+                    (let ((request request))
+                      (lambda () (handle-request request output))))))
+
+(-> serve-unix-socket (string &optional (or worker-pool null))
+    (values &optional))
+(defun serve-unix-socket (path &optional pool)
+  "Serve persistent connections accepted on a unix domain socket created
+at PATH, one after another, until quit is requested.  This avoids the
+TCP stack and the small buffers of pipes when passing large requests and
+responses between processes on the same host."
+  #+sbcl
+  (let ((socket (make-instance 'sb-bsd-sockets:local-socket :type :stream)))
+    (unwind-protect
+         (progn
+           (sb-bsd-sockets:socket-bind socket path)
+           (sb-bsd-sockets:socket-listen socket 1)
+           (iter (for connection = (sb-bsd-sockets:socket-accept socket))
+                 (for stream = (sb-bsd-sockets:socket-make-stream
+                                connection
+                                :input t :output t
+                                :element-type 'character
+                                :external-format :utf-8
+                                :buffering :full))
+                 (until (unwind-protect (serve-stream stream stream pool)
+                          (close stream)))))
+      (sb-bsd-sockets:socket-close socket)
+      (delete-file path)))
+  #-sbcl
+  (error "Unix domain sockets are not supported on ~a." (lisp-implementation-type))
+  (values))
+
 (define-command tree-sitter-interface (&spec (append +common-command-line-options+
                                                      +interactive-command-line-options+
                                                      +interface-command-line-options+))
@@ -176,25 +521,154 @@ function name from the API followed by the arguments."
             (lisp-implementation-type) (lisp-implementation-version))
   (declare (ignorable quiet verbose load eval language manual))
   (when help (show-help-for-tree-sitter-interface) (exit-command tree-sitter-interface 0))
-  (if port
-      (with-socket-listener (socket "localhost" port)
-        (iter (for connection = (socket-accept socket))
-              (unwind-protect
-                  (let ((request (read-request connection)))
-                    (until (equalp request "quit"))
-                    (handle-request request connection))
-                (socket-close connection))))
-      (iter (for request = (read-request *standard-input*))
-            (until (equalp request "quit"))
-            (handle-request request *standard-output*))))
+  (setf *shared-memory-threshold* shared-memory)
+  ;; Requests are read on this thread and, given more than one thread,
+  ;; handled by a pool of worker threads.
+  (with-worker-pool (pool threads)
+    (cond
+      ((and port daemon)
+       (with-socket-listener (socket "localhost" port)
+         (serve-clients socket pool)))
+      (port
+       (with-socket-listener (socket "localhost" port)
+         (iter (for connection = (socket-accept socket))
+               (for request = (handler-case (read-request connection)
+                                (stream-error () nil)))
+               (when (equalp request "quit")
+                 (socket-close connection)
+                 (finish))
+               (submit-job pool
+                           (let ((connection connection)
+                                 (request request))
+                             (lambda ()
+                               (unwind-protect
+                                    (when request
+                                      (handle-request request connection))
+                                 (socket-close connection))))))))
+      (socket
+       (serve-unix-socket socket pool))
+      (t
+       (serve-stream *standard-input* *standard-output* pool)))))
 
 ;;;; API:
 (-> int/from-string (string string boolean boolean) (values ast &optional))
 (defun int/from-string (source-text language deepest use-variation-point-tree)
-  (let ((*use-variation-point-tree* use-variation-point-tree))
-    (convert (language-to-ast-symbol language)
-             source-text
-             :deepest deepest)))
+  (flet ((parse ()
+           (let ((*use-variation-point-tree* use-variation-point-tree))
+             (convert (language-to-ast-symbol language)
+                      source-text
+                      :deepest deepest))))
+    (if *shared-parses*
+        (values (ensure-gethash (list source-text language deepest
+                                      use-variation-point-tree)
+                                *shared-parses*
+                                (parse)))
+        (parse))))
+
+(-> int/from-bytes (string) (values ast &optional))
+(defun int/from-bytes (string)
+  "Return a fresh copy of the AST serialized to the base64 STRING by
+`int/to-bytes', possibly in another process."
+  (tree-copy
+   (flexi-streams:with-input-from-sequence
+       (in (cl-base64:base64-string-to-usb8-array string))
+     (cl-store:restore in))))
+
+(-> int/to-bytes (ast) (values string &optional))
+(defun int/to-bytes (ast)
+  "Return a base64 string holding the cl-store binary serialization of AST."
+  (cl-base64:usb8-array-to-base64-string
+   (flexi-streams:with-output-to-sequence (out)
+     (cl-store:store ast out))))
+
+(-> int/with-timeout (real string &rest t) t)
+(defun int/with-timeout (seconds function-str &rest arguments)
+  "Apply the API function named by FUNCTION-STR to ARGUMENTS, cancelling
+it with an `interface-timeout' error if it has not completed in SECONDS.
+The timeout interrupts the request, so updates of shared state are wrapped
+in `without-timeouts'."
+  (flet ((call ()
+           (apply (function-string-to-symbol function-str) arguments)))
+    #+sbcl
+    (let* ((done nil)
+           (timer (sb-ext:make-timer
+                   (lambda ()
+                     (unless done
+                       (error 'interface-timeout :seconds seconds)))
+                   :name "interface-timeout"
+                   :thread sb-thread:*current-thread*)))
+      (sb-ext:schedule-timer timer seconds)
+      (unwind-protect (call)
+        (without-timeouts
+          (setf done t)
+          (sb-ext:unschedule-timer timer))))
+    #-sbcl
+    (call)))
+
+(-> int/interface-stats () (values list &optional))
+(defun int/interface-stats ()
+  "Return an alist of the number of requests handled, the bytes of heap
+in use and available, and the number of externally referenced ASTs."
+  `((:requests . ,*request-count*)
+    (:heap . ,#+sbcl (sb-vm::dynamic-usage) #-sbcl 0)
+    (:limit . ,#+sbcl (sb-ext:dynamic-space-size) #-sbcl 0)
+    (:asts . ,(hash-table-count *external-asts*))))
+
+(-> int/checkpoint (list) (values string &optional))
+(defun int/checkpoint (asts)
+  "Return a base64 string serializing ASTS for `int/restore' in a fresh
+interface process.  Only those ASTS not contained in another of ASTS are
+serialized whole, the others are recorded by their pre-order position in
+a containing AST to preserve the relationships between them.  The ASTs
+are stored at once so subtrees shared between them are stored once."
+  (let ((live (make-hash-table :test #'eq))
+        (positions (make-hash-table :test #'eq))
+        (tops nil))
+    (dolist (ast asts) (setf (gethash ast live) t))
+    (dolist (ast asts)
+      (unless (gethash ast positions)
+        (iter (for node in-tree ast)
+              (for index from 0)
+              (when (and (plusp index) (gethash node live))
+                (setf (gethash node positions) (cons ast index))))))
+    ;; ASTs without a position are top-level, positions of ASTs under
+    ;; them are taken relative to the top-level AST containing them.
+    (setf tops (remove-if {gethash _ positions} (remove-duplicates asts)))
+    (iter (for top in tops)
+          (for top-index from 0)
+          (iter (for node in-tree top)
+                (for index from 0)
+                (when (gethash node live)
+                  (setf (gethash node positions) (cons top-index index)))))
+    (cl-base64:usb8-array-to-base64-string
+     (flexi-streams:with-output-to-sequence (out)
+       (cl-store:store (list tops (mapcar {gethash _ positions} asts)) out)))))
+
+(defvar *tree-copies* nil
+  "When non-nil, a hash table memoizing `tree-copy' of ASTs so subtrees
+shared between the trees copied are copied once and remain shared.")
+
+(defmethod tree-copy :around ((ast ast))
+  (if *tree-copies*
+      (ensure-gethash ast *tree-copies* (call-next-method))
+      (call-next-method)))
+
+(-> int/restore (string) (values list &optional))
+(defun int/restore (string)
+  "Restore the ASTs serialized to STRING by `int/checkpoint', returning
+the oids of the restored ASTs after allocating each of them.  Subtrees
+shared between the checkpointed ASTs are restored shared."
+  (destructuring-bind (tops positions)
+      (flexi-streams:with-input-from-sequence
+          (in (cl-base64:base64-string-to-usb8-array string))
+        (cl-store:restore in))
+    (let* ((*tree-copies* (make-hash-table :test #'eq))
+           (nodes (iter (for top in tops)
+                        (collect (coerce (iter (for node in-tree (tree-copy top))
+                                               (collect node))
+                                         'vector)))))
+      (iter (for (top-index . index) in positions)
+            (collect (allocate-ast (aref (nth top-index nodes) index)))))))
 
 (-> int/--del-- (ast) t)
 (defun int/--del-- (ast)
@@ -236,7 +710,22 @@ function name from the API followed by the arguments."
   (lookup root (python-to-cl-ast-path path)))
 
 (-> int/source-text (ast) (values string &optional))
-(defun int/source-text (ast) (source-text ast))
+(defun int/source-text (ast) (cached-source-text ast))
+
+(-> int/source-text-changes (ast) (values list &optional))
+(defun int/source-text-changes (root)
+  "Return the changes from the source text of the root ROOT was derived
+from by a mutation to the source text of ROOT as a list of (START END
+TEXT) lists replacing the characters from START to END of the former
+with TEXT.  Return nil if the source text ROOT was derived from is not
+known."
+  (when-let ((base (gethash root *source-bases*)))
+    (let* ((text (cached-source-text root))
+           (start (or (mismatch base text) 0))
+           (end (or (mismatch base text :from-end t :start1 start :start2 start)
+                    start))
+           (suffix (- (length base) end)))
+      (list (list start end (subseq text start (- (length text) suffix)))))))
 
 (-> int/child-slots (ast) (values list &optional))
 (defun int/child-slots (ast)
@@ -247,11 +736,41 @@ function name from the API followed by the arguments."
 (defun int/child-slot (ast slot-name)
   (slot-value ast (safe-intern (python-to-cl-slot-name ast slot-name))))
 
+(-> int/slots (ast) (values list &optional))
+(defun int/slots (ast)
+  "Return a (NAME ARITY VALUE) list for each of the child slots of AST."
+  (mapcar (lambda (slot)
+            (destructuring-bind (name . arity) slot
+              (list (cl-to-python-slot-name ast name)
+                    arity
+                    (slot-value ast name))))
+          (remove-if #'internal-child-slot-p (child-slots ast))))
+
 (-> int/ast-at-point (ast integer integer) (values (or ast null) &optional))
 (defun int/ast-at-point (ast line column)
-  (lastcar (asts-containing-source-location ast
-                                            (make-instance 'source-location
-                                              :line line :column column))))
+  (source-range-index-ast-at-point (source-range-index ast)
+                                   (make-instance 'source-location
+                                     :line line :column column)))
+
+(-> int/asts-at-points (ast list) (values list &optional))
+(defun int/asts-at-points (ast points)
+  (let ((index (source-range-index ast)))
+    (mapcar (lambda (point)
+              (destructuring-bind (line column) point
+                (source-range-index-ast-at-point
+                 index
+                 (make-instance 'source-location :line line :column column))))
+            points)))
+
+(-> int/asts-in-range (ast list list) (values list &optional))
+(defun int/asts-in-range (ast start end)
+  (source-range-index-asts-in-range
+   (source-range-index ast)
+   (make-instance 'source-range
+     :begin (make-instance 'source-location
+              :line (first start) :column (second start))
+     :end (make-instance 'source-location
+            :line (first end) :column (second end)))))
 
 (-> int/language (ast) string)
 (defun int/language (ast)
@@ -259,7 +778,11 @@ function name from the API followed by the arguments."
 
 (-> int/imports (ast ast) (values list &optional))
 (defun int/imports (root ast)
-  (imports root ast))
+  (first (cached-attributes root (list ast) :imports #'imports)))
+
+(-> int/imports-many (ast list) (values list &optional))
+(defun int/imports-many (root asts)
+  (cached-attributes root asts :imports #'imports))
 
 (-> int/function-name (ast) (values string &optional))
 (defun int/function-name (ast) (function-name ast))
@@ -271,7 +794,12 @@ function name from the API followed by the arguments."
 (defun int/function-body (ast) (function-body ast))
 
 (-> int/provided-by (ast ast) (values (or string null) &optional))
-(defun int/provided-by (root ast) (provided-by root ast))
+(defun int/provided-by (root ast)
+  (first (cached-attributes root (list ast) :provided-by #'provided-by)))
+
+(-> int/provided-by-many (ast list) (values list &optional))
+(defun int/provided-by-many (root asts)
+  (cached-attributes root asts :provided-by #'provided-by))
 
 (-> int/call-function (ast) (values ast &optional))
 (defun int/call-function (ast) (call-function ast))
@@ -285,31 +813,73 @@ function name from the API followed by the arguments."
 
 (-> int/get-vars-in-scope (ast ast boolean) (values list &optional))
 (defun int/get-vars-in-scope (root ast keep-globals)
-  (get-vars-in-scope (make-instance (safe-intern (ast-language ast))
-                                    :genome root)
-                     ast
-                     keep-globals))
+  (vars-in-scope root ast keep-globals))
+
+(-> int/get-vars-in-scope-many (ast list boolean) (values list &optional))
+(defun int/get-vars-in-scope-many (root asts keep-globals)
+  (mapcar (lambda (ast) (vars-in-scope root ast keep-globals)) asts))
 
 (-> int/ast-source-ranges (ast) list)
 (defun int/ast-source-ranges (root)
-  (iter (for (ast . range) in (ast-source-ranges root))
-        (collect (list ast
-                       (list (list (line (begin range))
-                                   (column (begin range)))
-                             (list (line (end range))
-                                   (column (end range))))))))
+  (with-slots (asts ranges) (source-range-index root)
+    (iter (for ast in-vector asts)
+          (for range in-vector ranges)
+          (collect (list ast (cl-to-python-source-range range))))))
+
+(-> int/ast-source-ranges-chunk (ast integer integer) list)
+(defun int/ast-source-ranges-chunk (root start count)
+  (with-slots (asts ranges) (source-range-index root)
+    (iter (for i from start below (min (length asts) (+ start count)))
+          (collect (list (svref asts i)
+                         (cl-to-python-source-range (svref ranges i)))))))
+
+(-> int/traverse-chunk (ast string integer integer) (values list &optional))
+(defun int/traverse-chunk (root order start count)
+  (traversal-chunk root (make-keyword (string-upcase order)) start count))
 
 (-> int/cut (ast ast) (values ast &optional))
 (defun int/cut (root pt)
-  (less root (ast-path root pt)))
+  (note-source-base root (less root (ast-path root pt))))
 
 (-> int/insert (ast ast ast) (values ast &optional))
 (defun int/insert (root pt ast)
-  (insert root (ast-path root pt) (tree-copy ast)))
+  (note-source-base root (insert root (ast-path root pt) (tree-copy ast))))
 
 (-> int/replace (ast ast ast) (values ast &optional))
 (defun int/replace (root pt ast)
-  (with root (ast-path root pt) (tree-copy ast)))
+  (note-source-base root (with root (ast-path root pt) (tree-copy ast))))
+
+(-> int/apply-edits (ast list) (values ast &optional))
+(defun int/apply-edits (root edits)
+  "Apply EDITS, a list of (OPERATION PT [VALUE]) lists recorded against
+ROOT, in a single pass returning the new root.  String values are parsed
+as ASTs in the language of ROOT."
+  (let* ((class (safe-intern (concatenate 'string (ast-language root) "-AST")))
+         (edits
+          (iter (for (operation pt value) in edits)
+                (for position from 0)
+                (for path = (ast-path root pt))
+                (unless path
+                  (error "Cannot edit ~a, which is not a proper subtree of ~a."
+                         pt root))
+                (collect (list (make-keyword (string-upcase operation))
+                               path
+                               (if (stringp value)
+                                   (convert class value :deepest t)
+                                   value)
+                               position)))))
+    (check-edit-conflicts edits)
+    (note-source-base
+     root
+     (reduce (lambda (root edit)
+               (destructuring-bind (operation path value position) edit
+                 (declare (ignore position))
+                 (ecase operation
+                   (:cut (less root path))
+                   (:insert (insert root path (tree-copy value)))
+                   (:replace (with root path (tree-copy value))))))
+             (sort edits #'edit-precedes-p)
+             :initial-value root))))
 
 (-> int/ast-template (string string &rest list) (values ast &optional))
 (defun int/ast-template (template language &rest args)
@@ -320,6 +890,72 @@ function name from the API followed by the arguments."
              (mappend #'handle-keyword-argument args)
              args)))
 
+(-> int/compile-template (string string) (values list &optional))
+(defun int/compile-template (template language)
+  "Compile TEMPLATE in LANGUAGE for repeated instantiation, returning the
+python keyword names of its metavariables."
+  (mapcar (lambda (name)
+            (nest (string-downcase)
+                  (substitute #\_ #\-)
+                  (drop-prefix "@")
+                  (string name)))
+          (compiled-template-names (compile-template template language))))
+
+(-> int/instantiate (string string &rest list) (values ast &optional))
+(defun int/instantiate (template language &rest args)
+  (instantiate-template (compile-template template language) args))
+
+(-> int/instantiate-many (string string list) (values list &optional))
+(defun int/instantiate-many (template language bindings)
+  (let ((compiled (compile-template template language)))
+    (mapcar {instantiate-template compiled} bindings)))
+
+(-> int/match (ast string string) (values list &optional))
+(defun int/match (root template language)
+  "Return a list of (AST BINDINGS) pairs for every subtree of ROOT matching
+TEMPLATE, where BINDINGS is a list of (NAME VALUE) metavariable bindings."
+  (let ((matcher (template-matcher template language)))
+    (iter (for ast in-tree root)
+          (multiple-value-bind (matchp bindings) (funcall matcher ast)
+            (when matchp (collect (list ast bindings)))))))
+
+(-> int/diff (ast ast) (values list &optional))
+(defun int/diff (old new)
+  "Return a structural edit script from the tree OLD to the tree NEW as a
+list of (OPERATION OLD-AST NEW-AST) lists.  OPERATION is one of \"insert\"
+\(of NEW-AST), \"delete\" (of OLD-AST), \"move\" (of OLD-AST to the
+position of NEW-AST), or \"update\" (of the text of the leaf OLD-AST to
+that of NEW-AST).  Only the topmost inserted, deleted, or moved subtree
+of any subtree is listed."
+  (let ((old-parents (parent-table old))
+        (new-parents (parent-table new)))
+    (mvlet* ((old-partners new-partners
+              (match-trees old new old-parents new-parents))
+             (reordered (reordered-subtrees old old-partners new-parents)))
+      (flet ((matched-parent-p (ast parents partners)
+               (gethash (gethash ast parents) partners)))
+        (append
+         (iter (for ast in-tree old)
+               (for partner = (gethash ast old-partners))
+               (for parent = (gethash ast old-parents))
+               (cond
+                 ((null parent))
+                 ((null partner)
+                  (when (matched-parent-p ast old-parents old-partners)
+                    (collect (list "delete" ast nil))))
+                 ((or (gethash ast reordered)
+                      (not (eq (gethash parent old-partners)
+                               (gethash partner new-parents))))
+                  (collect (list "move" ast partner)))
+                 ((and (null (children ast))
+                       (null (children partner))
+                       (string/= (source-text ast) (source-text partner)))
+                  (collect (list "update" ast partner)))))
+         (iter (for ast in-tree new)
+               (unless (or (gethash ast new-partners)
+                           (not (matched-parent-p ast new-parents new-partners)))
+                 (collect (list "insert" nil ast)))))))))
+
 (-> int/asts-from-template (string string &rest list) (values list &optional))
 (defun int/asts-from-template (template language &rest args)
   (handler-bind ((trivia.level2.impl::wildcard
@@ -340,6 +976,376 @@ function name from the API followed by the arguments."
                             (string-upcase (python-to-cl-ast-language language))
                             "-AST")))
 
+(-> language-to-software-symbol (string) symbol)
+(defun language-to-software-symbol (language)
+  "Convert the given language string to the associated software type symbol."
+  (safe-intern (python-to-cl-ast-language language)))
+
+(-> template-matcher (string string) (values function &optional))
+(defun template-matcher (template language)
+  "Return a compiled function matching an AST against the pattern described
+by TEMPLATE in LANGUAGE.  The function returns non-NIL and a list of
+(NAME VALUE) metavariable bindings on a successful match.  Matchers are
+compiled once and cached in *template-matchers*."
+  (ensure-gethash
+   (cons template language) *template-matchers*
+   (handler-bind ((trivia.level2.impl::wildcard
+                    (lambda (c)
+                      (declare (ignorable c))
+                      (invoke-restart 'continue))))
+     (let* ((pattern (convert 'match template
+                              :language (language-to-software-symbol language)))
+            (wildcards (nest (remove-duplicates)
+                             (remove-if-not #'wildcard?)
+                             (flatten pattern)))
+            ;; If the same metavariable occurs more than once in the
+            ;; pattern, ignore all but the first occurrence.
+            (pattern
+             (map-tree
+              (let ((seen (make-hash-table)))
+                (lambda (node)
+                  (cond ((not (wildcard? node)) node)
+                        ((gethash node seen) '_)
+                        (t (setf (gethash node seen) t) node))))
+              (sublis '((ellipsis-match . _)) pattern)
+              :traversal :inorder)))
+       (compile nil
+                `(lambda (ast)
+                   (match ast
+                     (,pattern
+                      (values t
+                              (list ,@(mapcar (lambda (wildcard)
+                                                `(list ,(wildcard-name wildcard)
+                                                       ,wildcard))
+                                              wildcards)))))))))))
+
+(defclass compiled-template ()
+  ((class :initarg :class :reader compiled-template-class :type symbol
+          :documentation "AST class of the template.")
+   (template :initarg :template :reader compiled-template-template
+             :type string
+             :documentation "Template text with placeholders substituted
+for metavariables.")
+   (names :initarg :names :reader compiled-template-names :type list
+          :documentation "Canonical metavariable names in the template.")
+   (placeholders :initarg :placeholders
+                 :reader compiled-template-placeholders :type list
+                 :documentation "Placeholders for the metavariable names.")
+   (skeleton :initform nil :accessor compiled-template-skeleton :type list
+             :documentation "Cached (AST NAME-PATHS) list for the parsed
+template, reused by instantiations without inlined literals."))
+  (:documentation "AST template parsed once for repeated instantiation."))
+
+;; Sigils inside strings and comments are not metavariables: only keep
+;; the candidates whose placeholders parse as ASTs of their own.
+(-> template-metavariable-names (string symbol) (values list &optional))
+(defun template-metavariable-names (template class)
+  "Return the canonical names of the metavariables in TEMPLATE, a template
+for CLASS, as found in the parsed template."
+  (mvlet* ((candidates
+            (remove-duplicates
+             (all-matches-as-strings "(?<=[$@])[A-Z0-9_]+" template)
+             :test #'equal))
+           (kwargs (mappend (lambda (name)
+                              (list (make-keyword (substitute #\- #\_ name))
+                                    nil))
+                            candidates))
+           (template names placeholders
+            (parse-ast-template template class kwargs))
+           (ast name-paths
+            (ast-template-skeleton template class placeholders
+                                   (mapcar (op (cons _ nil)) names))))
+    (declare (ignore ast))
+    (iter (for (name . paths) in name-paths)
+          (when paths (collect name)))))
+
+(-> compile-template (string string) (values compiled-template &optional))
+(defun compile-template (template language)
+  "Return the compiled AST template for TEMPLATE in LANGUAGE.  Compiled
+templates are cached in *compiled-templates*."
+  (ensure-gethash
+   (cons template language) *compiled-templates*
+   (let* ((class (language-to-ast-symbol language))
+          (kwargs (mappend (op (list _ nil))
+                           (template-metavariable-names template class))))
+     (mvlet ((template names placeholders
+              (parse-ast-template template class kwargs)))
+       (make-instance 'compiled-template
+         :class class
+         :template template
+         :names names
+         :placeholders placeholders)))))
+
+(-> instantiate-template (compiled-template list) (values ast &optional))
+(defun instantiate-template (compiled args)
+  "Build an AST from the COMPILED template using the python positional or
+keyword ARGS.  The parsed template is reused unless literal arguments must
+be inlined into the template text and parsed in context."
+  (with-slots (class template names placeholders skeleton) compiled
+    (let* ((args (if (keyword-arguments-p args)
+                     (mappend #'handle-keyword-argument args)
+                     (iter (for arg in args)
+                           (for i from 1)
+                           (collect (make-keyword (princ-to-string i)))
+                           (collect arg))))
+           (dummy (allocate-instance (find-class class)))
+           (subs
+            (iter (for name in names)
+                  (for key = (make-keyword (drop-prefix "@" (string name))))
+                  (for value = (getf args key args))
+                  (when (eq value args)
+                    (error "No value given for metavariable ~a" key))
+                  (collect (cons name (template-subtree dummy value))))))
+      (iter (for key in args by #'cddr)
+            (unless (find key names
+                          :key [#'make-keyword {drop-prefix "@"} #'string])
+              (error "~a does not occur in template" key)))
+      (destructuring-bind (ast name-paths)
+          (if (some [#'stringp #'cdr] subs)
+              (multiple-value-list
+               (ast-template-skeleton template class placeholders subs))
+              (or skeleton
+                  (setf skeleton
+                        (multiple-value-list
+                         (ast-template-skeleton template class
+                                                placeholders subs)))))
+        (insert-template-subtrees ast name-paths subs)))))
+
+(defclass source-range-index ()
+  ((asts :initarg :asts :reader source-range-index-asts :type simple-vector
+         :documentation "ASTs in pre-order, sorted by beginning location.")
+   (ranges :initarg :ranges :reader source-range-index-ranges
+           :type simple-vector
+           :documentation "Source range of each AST.")
+   (parents :initarg :parents :reader source-range-index-parents
+            :type simple-vector
+            :documentation "Position of the nearest preceding entry whose
+range contains the range of each entry, or NIL."))
+  (:documentation "Index of the source ranges of the ASTs in a tree
+supporting logarithmic point and range queries."))
+
+(-> source-range-index (ast) (values source-range-index &optional))
+(defun source-range-index (root)
+  "Return the source range index for ROOT, building it on first use."
+  (ensure-root-cache (root :source-range-index)
+    (let* ((pairs (ast-source-ranges root))
+           (ranges (map 'simple-vector #'cdr pairs))
+           (parents (make-array (length ranges) :initial-element nil))
+           (stack nil))
+      (dotimes (i (length ranges))
+        (iter (while (and stack
+                          (not (contains (svref ranges (car stack))
+                                         (svref ranges i)))))
+              (pop stack))
+        (setf (svref parents i) (car stack))
+        (push i stack))
+      (make-instance 'source-range-index
+        :asts (map 'simple-vector #'car pairs)
+        :ranges ranges
+        :parents parents))))
+
+(-> source-range-index-partition
+    (source-range-index source-location function)
+    (values fixnum &optional))
+(defun source-range-index-partition (index location test)
+  "Return the number of leading entries in INDEX whose beginning satisfies
+TEST when compared against LOCATION using a binary search."
+  (let ((ranges (source-range-index-ranges index)))
+    (iter (with low = 0)
+          (with high = (length ranges))
+          (while (< low high))
+          (for middle = (floor (+ low high) 2))
+          (if (funcall test (begin (svref ranges middle)) location)
+              (setf low (1+ middle))
+              (setf high middle))
+          (finally (return low)))))
+
+(-> source-range-index-ast-at-point (source-range-index source-location)
+    (values (or ast null) &optional))
+(defun source-range-index-ast-at-point (index location)
+  "Return the most specific AST in INDEX containing LOCATION.  This is the
+last AST in pre-order containing LOCATION, found by walking up from the
+last AST beginning at or before LOCATION."
+  (with-slots (asts ranges parents) index
+    (iter (for i initially (1- (source-range-index-partition index location
+                                                             #'source-<=))
+               then (svref parents i))
+          (while (and i (>= i 0)))
+          (when (contains (svref ranges i) location)
+            (return (svref asts i))))))
+
+(-> source-range-index-asts-in-range (source-range-index source-range)
+    (values list &optional))
+(defun source-range-index-asts-in-range (index range)
+  "Return the ASTs in INDEX contained in RANGE in pre-order."
+  (with-slots (asts ranges) index
+    (iter (for i from (source-range-index-partition index (begin range)
+                                                    #'source-<)
+               below (length asts))
+          (while (source-<= (begin (svref ranges i)) (end range)))
+          (when (contains range (svref ranges i))
+            (collect (svref asts i))))))
+
+(-> wildcard-name (symbol) string)
+(defun wildcard-name (wildcard)
+  "Return the metavariable name (without sigil) for the given pattern WILDCARD."
+  (drop-prefix "LIST_" (drop-prefix "WILD-" (symbol-name wildcard))))
+
+(-> root-software (ast) (values software &optional))
+(defun root-software (root)
+  "Return a software object with ROOT as its genome, creating it on first
+use so any symbol table or scope computations on the software object are
+shared between requests on ROOT."
+  (ensure-root-cache (root :software)
+    (make-instance (safe-intern (ast-language root)) :genome root)))
+
+(-> vars-in-scope (ast ast boolean) (values list &optional))
+(defun vars-in-scope (root ast keep-globals)
+  "Return the variables in scope at AST in ROOT, caching the result until
+ROOT is deallocated."
+  (ensure-root-cache (root (list :vars-in-scope (oid ast) keep-globals))
+    (get-vars-in-scope (root-software root) ast keep-globals)))
+
+(-> cached-attributes (ast list keyword function) (values list &optional))
+(defun cached-attributes (root asts key function)
+  "Return the result of calling FUNCTION with ROOT and each of ASTS.
+The calls share a single attribute table for ROOT so attributes such as
+the imports propagated through the tree are computed once, and each
+result is cached under KEY until ROOT is deallocated."
+  (with-attr-table root
+    (mapcar (lambda (ast)
+              (ensure-root-cache (root (list key (oid ast)))
+                (funcall function root ast)))
+            asts)))
+
+(-> check-edit-conflicts (list) (values null &optional))
+(defun check-edit-conflicts (edits)
+  "Signal an error if any of the (OPERATION PATH VALUE POSITION) EDITS
+conflict.  Edits conflict if they cut or replace the same subtree, or if
+one edit targets a subtree which another cuts or replaces."
+  (let ((removed (make-hash-table :test #'equal)))
+    (iter (for (operation path) in edits)
+          (unless (eql operation :insert)
+            (when (gethash path removed)
+              (error "Conflicting edits: multiple cut or replace edits at ~a."
+                     path))
+            (setf (gethash path removed) operation)))
+    (iter (for (operation path) in edits)
+          (iter (for i from 1 below (length path))
+                (when-let ((ancestor (gethash (subseq path 0 i) removed)))
+                  (error "Conflicting edits: ~(~a~) at ~a is within the ~
+                          target of a ~(~a~) edit."
+                         operation path ancestor))))))
+
+(-> edit-precedes-p (list list) boolean)
+(defun edit-precedes-p (edit1 edit2)
+  "Return T if the (OPERATION PATH VALUE POSITION) EDIT1 must be applied
+before EDIT2 to keep the paths of both valid.  Edits are applied from the
+end of the tree to the beginning, edits within a subtree before edits at
+the subtree, and cuts and replacements before insertions at the same path.
+Insertions at the same path are applied in reverse order of recording."
+  (labels ((element-key (element)
+             "Return the slot name and offset of the path ELEMENT."
+             (etypecase element
+               (cons (values (symbol-name (car element)) (cdr element)))
+               (integer (values "" element))
+               (symbol (values (symbol-name element) -1)))))
+    (destructuring-bind (operation1 path1 value1 position1) edit1
+      (declare (ignore value1))
+      (destructuring-bind (operation2 path2 value2 position2) edit2
+        (declare (ignore value2))
+        (iter (for element1 = (pop path1))
+              (for element2 = (pop path2))
+              (cond ((and (null element1) (null element2))
+                     (return
+                       (if (eql (eql operation1 :insert)
+                                (eql operation2 :insert))
+                           (> position1 position2)
+                           (eql operation2 :insert))))
+                    ((null element2) (return t))
+                    ((null element1) (return nil))
+                    ((not (equal element1 element2))
+                     (mvlet ((name1 offset1 (element-key element1))
+                             (name2 offset2 (element-key element2)))
+                       (return (if (string= name1 name2)
+                                   (> offset1 offset2)
+                                   (and (string> name1 name2) t)))))))))))
+
+(defclass traversal ()
+  ((asts :initform (make-array 0 :adjustable t :fill-pointer 0)
+         :reader traversal-asts :type vector
+         :documentation "Subtrees visited so far, in order.")
+   (next :initarg :next :reader traversal-next :type function
+         :documentation "Function visiting and returning the next subtree,
+or returning nil once every subtree has been visited.")
+   (lock :initform (bt:make-lock "traversal") :reader traversal-lock
+         :documentation "Lock serializing the visits of worker threads."))
+  (:documentation "Traversal of the subtrees of an AST which is resumed,
+rather than restarted, for each chunk retrieved."))
+
+(-> make-traversal (ast keyword) (values traversal &optional))
+(defun make-traversal (root order)
+  "Return a traversal of the subtrees of ROOT in the given ORDER, one of
+:PRE, :POST, or :LEVEL."
+  (make-instance 'traversal
+    :next
+    (ecase order
+      (:pre
+       (let ((stack (list root)))
+         (lambda ()
+           (when-let (ast (pop stack))
+             (setf stack (append (children ast) stack))
+             ast))))
+      (:post
+       ;; Entries are (AST . EXPANDED), where the children of AST have
+       ;; been pushed above it once EXPANDED.
+       (let ((stack (list (cons root nil))))
+         (lambda ()
+           (iter (for entry = (pop stack))
+                 (while entry)
+                 (destructuring-bind (ast . expanded) entry
+                   (if (or expanded (null (children ast)))
+                       (return ast)
+                       (setf stack (append (mapcar (op (cons _ nil))
+                                                   (children ast))
+                                           (cons (cons ast t) stack)))))))))
+      (:level
+       (let ((pending (queue root)))
+         (lambda ()
+           (unless (queue-empty-p pending)
+             (let ((ast (deq pending)))
+               (qappend pending (children ast))
+               ast))))))))
+
+(-> traversal-chunk (ast keyword integer integer) (values list &optional))
+(defun traversal-chunk (root order start count)
+  "Return the COUNT subtrees of ROOT from position START in the given
+ORDER, one of :PRE, :POST, or :LEVEL.  The traversal is cached for ROOT,
+while it is externally referenced, and resumed from where the previous
+chunk ended, so only as many subtrees as retrieved are ever visited and
+paging through the subtrees of any AST takes linear time."
+  (let ((traversal (ensure-root-cache (root (list :traversal order))
+                     (make-traversal root order))))
+    (with-slots (asts next lock) traversal
+      (bt:with-lock-held (lock)
+        (iter (while (< (length asts) (+ start count)))
+              ;; A subtree visited is never lost to a timeout.
+              (for ast = (without-timeouts
+                           (when-let (ast (funcall next))
+                             (vector-push-extend ast asts)
+                             ast)))
+              (while ast))
+        (coerce (subseq asts
+                        (min start (length asts))
+                        (min (+ start count) (length asts)))
+                'list)))))
+
+(-> cl-to-python-source-range (source-range) (values list &optional))
+(defun cl-to-python-source-range (range)
+  "Translate the Lisp source RANGE to a python representation."
+  (list (list (line (begin range)) (column (begin range)))
+        (list (line (end range)) (column (end range)))))
+
 (-> keyword-arguments-p (list) (values boolean &optional))
 (defun keyword-arguments-p (args)
   "Returns true if ARGS represents a list of keyword arguments (kwargs)."
@@ -372,3 +1378,177 @@ function name from the API followed by the arguments."
                                              :sel/sw/tree-sitter)))
                (list (cons (helper (car part)) (helper (lastcar part)))))))
     (mapcar #'helper path)))
+
+(-> parent-table (ast) (values hash-table &optional))
+(defun parent-table (root)
+  "Return a hash table mapping each subtree of ROOT to its parent."
+  (lret ((parents (make-hash-table :test #'eq)))
+    (iter (for ast in-tree root)
+          (dolist (child (children ast))
+            (setf (gethash child parents) ast)))))
+
+(-> match-trees (ast ast hash-table hash-table)
+    (values hash-table hash-table &optional))
+(defun match-trees (old new old-parents new-parents)
+  "Return hash tables mapping the subtrees of OLD to the matching subtrees
+of NEW and the reverse.  Identical subtrees are matched top-down using
+their `ast-hash', unmatched subtrees are then matched bottom-up to the
+subtree of NEW of the same type holding the most of their matched
+children, and finally remaining children of matched subtrees are matched
+in order by type.  Each phase is linear in the size of the trees."
+  (let ((old-partners (make-hash-table :test #'eq))
+        (new-partners (make-hash-table :test #'eq))
+        ;; Queues of the subtrees of NEW with children by hash and type,
+        ;; and by parent and hash.
+        (candidates (make-hash-table :test #'equal))
+        (sibling-candidates (make-hash-table :test #'equal)))
+    (labels ((pair (old-ast new-ast)
+               (setf (gethash old-ast old-partners) new-ast
+                     (gethash new-ast new-partners) old-ast))
+             (pair-subtrees (old-ast new-ast)
+               "Pair the identical OLD-AST and NEW-AST and their descendants."
+               (iter (for old-child in-tree old-ast)
+                     (for new-child in-tree new-ast)
+                     (unless (or (gethash old-child old-partners)
+                                 (gethash new-child new-partners))
+                       (pair old-child new-child))))
+             (next-candidate (key table)
+               "Return the first unmatched subtree of NEW queued under KEY
+                in TABLE, dropping the matched subtrees queued before it."
+               (symbol-macrolet ((queue (gethash key table)))
+                 (iter (while (and queue (gethash (first queue) new-partners)))
+                       (pop queue))
+                 (first queue)))
+             (candidate (ast)
+               "Return an unmatched subtree of NEW identical to AST, if any,
+                preferring a subtree under the partner of the parent of AST."
+               (let ((parent (gethash (gethash ast old-parents) old-partners)))
+                 (or (and parent
+                          (next-candidate (cons parent (ast-hash ast))
+                                          sibling-candidates))
+                     (next-candidate (cons (ast-hash ast) (type-of ast))
+                                     candidates))))
+             (top-down (ast)
+               (if-let ((match (and (children ast) (candidate ast))))
+                 (pair-subtrees ast match)
+                 (mapc #'top-down (children ast))))
+             (bottom-up (ast)
+               (unless (gethash ast old-partners)
+                 (mapc #'bottom-up (children ast))
+                 (when-let ((match (vote ast)))
+                   (pair ast match))))
+             (vote (ast)
+               "Return the unmatched subtree of NEW of the same type as AST
+                which is the parent of the most partners of its children."
+               (let ((votes (make-hash-table :test #'eq)))
+                 (dolist (child (children ast))
+                   (when-let* ((partner (gethash child old-partners))
+                               (parent (gethash partner new-parents)))
+                     (unless (or (gethash parent new-partners)
+                                 (not (eq (type-of parent) (type-of ast))))
+                       (incf (gethash parent votes 0)))))
+                 (iter (for (parent count) in-hashtable votes)
+                       (finding parent maximizing count))))
+             (recover (old-ast new-ast)
+               "Match the unmatched children of the matched OLD-AST and
+                NEW-AST in order by type."
+               (let ((unmatched (make-hash-table)))
+                 (dolist (child (reverse (children new-ast)))
+                   (unless (gethash child new-partners)
+                     (push child (gethash (type-of child) unmatched))))
+                 (dolist (child (children old-ast))
+                   (unless (gethash child old-partners)
+                     (when-let ((match (pop (gethash (type-of child) unmatched))))
+                       (pair child match)))))))
+      (iter (for ast in-tree new)
+            (when (children ast)
+              (let ((hash (ast-hash ast)))
+                (push ast (gethash (cons hash (type-of ast)) candidates))
+                (push ast (gethash (cons (gethash ast new-parents) hash)
+                                   sibling-candidates)))))
+      (dolist (table (list candidates sibling-candidates))
+        (iter (for (key asts) in-hashtable table)
+              (setf (gethash key table) (reverse asts))))
+      (pair old new)
+      (mapc #'top-down (children old))
+      (mapc #'bottom-up (children old))
+      ;; Visiting in pre-order, children matched here are visited later.
+      (iter (for ast in-tree old)
+            (when-let ((partner (gethash ast old-partners)))
+              (recover ast partner)))
+      (values old-partners new-partners))))
+
+(-> reordered-subtrees (ast hash-table hash-table) (values hash-table &optional))
+(defun reordered-subtrees (old old-partners new-parents)
+  "Return a hash table holding the subtrees of OLD whose partners remain
+under the partner of their parent but which have been reordered relative
+to their siblings.  The siblings outside of a longest increasing run of
+partner positions are considered reordered."
+  (lret ((reordered (make-hash-table :test #'eq)))
+    (iter (for ast in-tree old)
+          (for partner = (gethash ast old-partners))
+          (when partner
+            (let* ((positions (make-hash-table :test #'eq))
+                   (children (remove-if-not
+                              (lambda (child)
+                                (eq partner
+                                    (gethash (gethash child old-partners)
+                                             new-parents)))
+                              (children ast))))
+              (iter (for child in (children partner))
+                    (for position from 0)
+                    (setf (gethash child positions) position))
+              (let* ((children (coerce children 'vector))
+                     (kept (make-array (length children)
+                                       :element-type 'bit
+                                       :initial-element 0)))
+                (dolist (position (increasing-subsequence-positions
+                                   (map 'vector
+                                        (lambda (child)
+                                          (gethash (gethash child old-partners)
+                                                   positions))
+                                        children)))
+                  (setf (aref kept position) 1))
+                (iter (for child in-vector children)
+                      (for position from 0)
+                      (when (zerop (aref kept position))
+                        (setf (gethash child reordered) t)))))))))
+
+(-> increasing-subsequence-positions (vector) (values list &optional))
+(defun increasing-subsequence-positions (keys)
+  "Return the positions in KEYS, a vector of integers, of the elements of
+a longest strictly increasing subsequence in O(n log n) time."
+  (let* ((length (length keys))
+         (tails (make-array length :fill-pointer 0))
+         (previous (make-array length :initial-element nil)))
+    (dotimes (i length)
+      (let ((start 0)
+            (end (fill-pointer tails)))
+        (iter (while (< start end))
+              (let ((middle (floor (+ start end) 2)))
+                (if (< (aref keys (aref tails middle)) (aref keys i))
+                    (setf start (1+ middle))
+                    (setf end middle))))
+        (when (plusp start)
+          (setf (aref previous i) (aref tails (1- start))))
+        (if (= start (fill-pointer tails))
+            (vector-push i tails)
+            (setf (aref tails start) i))))
+    (iter (for i initially (and (plusp (fill-pointer tails))
+                                (aref tails (1- (fill-pointer tails))))
+               then (aref previous i))
+          (while i)
+          (collect i))))
+
+(-> cached-source-text (ast) (values string &optional))
+(defun cached-source-text (ast)
+  "Return the source text of AST, generating it only once for each AST."
+  (values (ensure-gethash ast *source-texts* (source-text ast))))
+
+(-> note-source-base (ast ast) (values ast &optional))
+(defun note-source-base (root new-root)
+  "Record the generated source text of ROOT, if any, as the text NEW-ROOT
+was derived from, returning NEW-ROOT."
+  (when-let ((text (gethash root *source-texts*)))
+    (setf (gethash new-root *source-bases*) text))
+  new-root)
@@ -1,7 +1,27 @@
+import asyncio
 import unittest
 import copy
-
-from asts.asts import AST, ASTException, ASTLanguage, LiteralOrAST
+import pickle
+import json
+import multiprocessing
+import socket
+import subprocess
+import time
+
+from asts import aio
+from asts.asts import (
+    AST,
+    ASTException,
+    ASTLanguage,
+    ASTTimeout,
+    Editor,
+    LiteralOrAST,
+    Template,
+    deadline,
+    rewrite_many,
+    _interface,
+    _rewrite_one,
+)
 from asts.types import *  # noqa: F403
 from pathlib import Path
 from typing import Optional, Text
@@ -20,6 +40,12 @@ def contains_type(ast, type):
     return any(isinstance(c, type) for c in ast)
 
 
+def x_to_y(ast: AST) -> Optional[LiteralOrAST]:
+    """Convert 'x' identifier ASTs to 'y'."""
+    if isinstance(ast, IdentifierAST) and "x" == ast.source_text:
+        return "y"
+
+
 class BinaryOperationTestDriver(unittest.TestCase):
     def setUp(self):
         self.root = AST.from_string("x + 88", ASTLanguage.Python)
@@ -30,6 +56,16 @@ class BinaryOperationTestDriver(unittest.TestCase):
     def test_ast_at_point(self):
         self.assertEqual("88", self.root.ast_at_point(1, 5).source_text)
 
+    # ASTs at points
+    def test_asts_at_points(self):
+        asts = self.root.asts_at_points([(1, 1), (1, 5)])
+        self.assertEqual(["x", "88"], [ast.source_text for ast in asts])
+
+    # ASTs in range
+    def test_asts_in_range(self):
+        asts = self.root.asts_in_range((1, 4), (1, 7))
+        self.assertEqual(["88"], [ast.source_text for ast in asts])
+
     # AST source ranges
     def test_ast_source_ranges(self):
         ranges = [rnge for ast, rnge in self.root.ast_source_ranges()]
@@ -40,6 +76,18 @@ class BinaryOperationTestDriver(unittest.TestCase):
         self.assertEqual([[1, 2], [1, 4]], ranges[4])
         self.assertEqual([[1, 4], [1, 7]], ranges[5])
 
+    # AST source ranges in chunks
+    def test_iter_ast_source_ranges(self):
+        ranges = list(self.root.ast_source_ranges())
+        chunked = list(self.root.iter_ast_source_ranges(chunk_size=4))
+        self.assertEqual(ranges, chunked)
+
+    def test_iter_ast_source_ranges_early_stop(self):
+        ranges = self.root.iter_ast_source_ranges(chunk_size=2)
+        ast, rnge = next(ranges)
+        self.assertEqual(self.root, ast)
+        self.assertEqual([[1, 1], [1, 7]], rnge)
+
     # AST path
     def test_ast_path(self):
         self.assertEqual(
@@ -92,6 +140,19 @@ class BinaryOperationTestDriver(unittest.TestCase):
     def test_child_slot_property(self):
         self.assertEqual("88", self.binop.right.source_text)
 
+    # AST slots
+    def test_slots(self):
+        slots = self.binop.slots()
+        self.assertEqual(4, len(slots))
+        self.assertEqual("88", slots["RIGHT"].source_text)
+        self.assertIn("CHILDREN", slots)
+
+    def test_slots_fill_child_slot_properties(self):
+        slots = self.binop.slots()
+        self.assertIs(slots["LEFT"], self.binop.__dict__["left"])
+        self.assertIs(slots["RIGHT"], self.binop.right)
+        self.assertNotIn("children", self.binop.__dict__)
+
     # AST type
     def test_ast_type(self):
         integer = self.binop.right
@@ -159,6 +220,37 @@ class BinaryOperationTestDriver(unittest.TestCase):
             [type(ast) for ast in asts],
         )
 
+    def test_ast_level_traverse(self):
+        asts = list(self.root.level_traverse())
+        self.assertEqual(6, len(asts))
+        self.assertEqual(
+            [
+                PythonModule,
+                PythonExpressionStatement0,
+                PythonBinaryOperator,
+                PythonIdentifier,
+                PythonAdd,
+                PythonInteger,
+            ],
+            [type(ast) for ast in asts],
+        )
+
+    def test_subtree_traverse_in_chunks(self):
+        binop = self.binop
+        for order, types in [
+            ("pre", [PythonBinaryOperator, PythonIdentifier, PythonAdd]),
+            ("post", [PythonIdentifier, PythonAdd, PythonInteger]),
+            ("level", [PythonBinaryOperator, PythonIdentifier, PythonAdd]),
+        ]:
+            chunks = _interface.dispatch_chunks(
+                "traverse_chunk", binop, order, chunk_size=1
+            )
+            asts = list(chunks)
+            self.assertEqual(4, len(asts))
+            self.assertEqual(types, [type(ast) for ast in asts[:3]])
+            whole = _interface.dispatch("traverse_chunk", binop, order, 0, 8)
+            self.assertEqual(whole, asts)
+
     # AST __iter__
     def test_ast_iter(self):
         asts = list(self.root)
@@ -220,6 +312,65 @@ class ASTTemplatesTestDriver(unittest.TestCase):
         self.assertIsInstance(asts[1], PythonInteger)
 
 
+class CompiledTemplateTestDriver(unittest.TestCase):
+    def test_template_parameters(self):
+        template = Template("$LEFT_HAND_SIDE = @RIGHT", ASTLanguage.Python)
+        self.assertEqual(
+            sorted(["left_hand_side", "right"]), sorted(template.parameters)
+        )
+
+    def test_template_parameters_ignore_strings_and_comments(self):
+        template = Template('$ID = "$NAME"  # @ARGS', ASTLanguage.Python)
+        self.assertEqual(["id"], template.parameters)
+
+        a = Template('$ID = "$NAME"', ASTLanguage.Python).instantiate(id="x")
+        self.assertEqual(a.source_text, 'x = "$NAME"')
+
+    def test_template_instantiate(self):
+        template = Template("$ID = 1", ASTLanguage.Python)
+        a = template.instantiate(id="x")
+        self.assertEqual(a.source_text, "x = 1")
+        self.assertIsInstance(a, PythonAssignment0)
+
+        rhs = AST.from_string("2", ASTLanguage.Python, deepest=True)
+        a = Template("$1 = $2", ASTLanguage.Python).instantiate("y", rhs)
+        self.assertEqual(a.source_text, "y = 2")
+
+    def test_template_instantiate_many(self):
+        template = Template("fn(@ARGS)", ASTLanguage.Python)
+        calls = template.instantiate_many([{"args": [1, 2]}, {"args": ["a"]}])
+        self.assertEqual(["fn(1, 2)", "fn(a)"], [c.source_text for c in calls])
+
+        template = Template("$1 = $2", ASTLanguage.Python)
+        asts = template.instantiate_many([["x", 1], ["y", 2]])
+        self.assertEqual(["x = 1", "y = 2"], [a.source_text for a in asts])
+
+    def test_template_instantiate_missing_argument(self):
+        with self.assertRaises(ASTException):
+            Template("$1 = $2", ASTLanguage.Python).instantiate("x")
+
+
+class MatchTestDriver(unittest.TestCase):
+    def setUp(self):
+        text = "a = x + 0\nb = y + 1\nprint(z + 0)\nprint(a, b)\n"
+        self.root = AST.from_string(text, ASTLanguage.Python)
+
+    def test_match_scalar_metavariable(self):
+        matches = self.root.match("$X + 0")
+        self.assertEqual(2, len(matches))
+        self.assertEqual(["x + 0", "z + 0"], [m.source_text for m, _ in matches])
+        self.assertEqual(["x", "z"], [b["X"].source_text for _, b in matches])
+
+    def test_match_list_metavariable(self):
+        matches = self.root.match("print(@ARGS)")
+        self.assertEqual(2, len(matches))
+        args = [[a.source_text for a in b["ARGS"]] for _, b in matches]
+        self.assertEqual([["z + 0"], ["a", "b"]], args)
+
+    def test_no_match(self):
+        self.assertEqual([], self.root.match("$X * 2"))
+
+
 class CopyTestDriver(unittest.TestCase):
     def setUp(self):
         self.root = AST.from_string("x + 1", ASTLanguage.Python, deepest=True)
@@ -256,6 +407,31 @@ class CopyTestDriver(unittest.TestCase):
         self.assertNotEqual(copy.oid, self.root.oid)
 
 
+class PickleTestDriver(unittest.TestCase):
+    def setUp(self):
+        self.root = AST.from_string("x = 1\nprint(x)\n", ASTLanguage.Python)
+
+    def test_bytes_round_trip(self):
+        data = self.root.to_bytes()
+        self.assertIsInstance(data, bytes)
+        new = AST.from_bytes(data)
+        self.assertIsInstance(new, PythonModule)
+        self.assertEqual(new.source_text, self.root.source_text)
+        self.assertNotEqual(new.oid, self.root.oid)
+        self.assertNotEqual(new.children[0].oid, self.root.children[0].oid)
+
+    def test_pickle_round_trip(self):
+        new = pickle.loads(pickle.dumps(self.root))
+        self.assertEqual(new.source_text, self.root.source_text)
+        self.assertNotEqual(new.oid, self.root.oid)
+        self.assertEqual(1, new.refcount())
+
+    def test_pickle_subtree(self):
+        stmt = pickle.loads(pickle.dumps(self.root.children[1]))
+        self.assertIsInstance(stmt, PythonExpressionStatement0)
+        self.assertEqual("print(x)", stmt.source_text.strip())
+
+
 class MutationTestDriver(unittest.TestCase):
     def setUp(self):
         self.root = AST.from_string("x = 88\n", ASTLanguage.Python)
@@ -289,6 +465,69 @@ class MutationTestDriver(unittest.TestCase):
         self.assertEqual("y = 88\n", new_root.source_text)
 
 
+class SourceTextChangesTestDriver(unittest.TestCase):
+    def setUp(self):
+        self.root = AST.from_string("x = 1\ny = 2\n", ASTLanguage.Python)
+        self.literal = self.root.children[1].children[0].children[-1]
+
+    def test_no_changes_without_mutation(self):
+        self.assertIsNone(AST.source_text_changes(self.root))
+
+    def test_changes_after_mutation(self):
+        self.assertEqual("x = 1\ny = 2\n", self.root.source_text)
+        new_root = AST.replace(self.root, self.literal, 3)
+        self.assertEqual([(10, 11, "3")], AST.source_text_changes(new_root))
+        self.assertEqual("x = 1\ny = 3\n", new_root.source_text)
+
+    def test_changes_after_successive_mutations(self):
+        root = self.root
+        root.source_text
+        for value in range(3, 6):
+            literal = root.children[1].children[0].children[-1]
+            root = AST.replace(root, literal, value)
+            self.assertEqual(f"x = 1\ny = {value}\n", root.source_text)
+        root = AST.cut(root, root.children[0])
+        self.assertEqual("y = 5\n", root.source_text)
+
+
+class EditorTestDriver(unittest.TestCase):
+    def setUp(self):
+        self.root = AST.from_string("x = 2\ny = 3\nz = 4\n", ASTLanguage.Python)
+        self.x, self.y, self.z = self.root.children
+        return
+
+    def test_no_edits(self):
+        editor = Editor(self.root)
+        self.assertEqual(0, len(editor))
+        self.assertEqual(self.root, editor.commit())
+
+    def test_multiple_edits(self):
+        editor = Editor(self.root)
+        editor.cut(self.x).replace(self.y, "y = 5\n").insert(self.z, "w = 1\n")
+        self.assertEqual(3, len(editor))
+        new_root = editor.commit()
+        self.assertNotEqual(new_root.oid, self.root.oid)
+        self.assertEqual("y = 5\nw = 1\nz = 4\n", new_root.source_text)
+        self.assertEqual("x = 2\ny = 3\nz = 4\n", self.root.source_text)
+
+    def test_edits_within_subtree(self):
+        lhs = self.x.children[0].children[0]
+        rhs = self.x.children[0].children[-1]
+        new_root = Editor(self.root).replace(lhs, "a").replace(rhs, 8).commit()
+        self.assertEqual("a = 8\ny = 3\nz = 4\n", new_root.source_text)
+
+    def test_multiple_inserts_preserve_order(self):
+        editor = Editor(self.root)
+        editor.insert(self.y, "a = 0\n").insert(self.y, "b = 1\n")
+        new_root = editor.commit()
+        self.assertEqual("x = 2\na = 0\nb = 1\ny = 3\nz = 4\n", new_root.source_text)
+
+    def test_conflicting_edits(self):
+        lhs = self.x.children[0].children[0]
+        with self.assertRaises(ASTException):
+            Editor(self.root).cut(self.x).replace(lhs, "a").commit()
+
+
 class TransformTestDriver(unittest.TestCase):
     def setUp(self):
         text = slurp(DATA_DIR / "transform" / "original.py")
@@ -356,6 +595,97 @@ class CCastExpressionTransformTestDriver(unittest.TestCase):
         self.assertEqual(transformed.source_text, expected)
 
 
+class RewriteManyTestDriver(unittest.TestCase):
+    def setUp(self):
+        self.path = DATA_DIR / "transform" / "original.py"
+        self.expected = slurp(DATA_DIR / "transform" / "transform_x_to_y.py")
+
+    def test_rewrite_many_in_process(self):
+        root = AST.from_string(slurp(self.path), ASTLanguage.Python)
+        results = rewrite_many(
+            [self.path, root], x_to_y, language=ASTLanguage.Python, workers=0
+        )
+        results = list(results)
+        self.assertEqual(2, len(results))
+        for result in results:
+            self.assertIsNone(result.error)
+            self.assertEqual(self.expected, result.source)
+
+    def test_rewrite_many_workers(self):
+        inputs = [self.path] * 4
+        progress = []
+        results = rewrite_many(
+            inputs,
+            x_to_y,
+            language=ASTLanguage.Python,
+            workers=2,
+            diff=True,
+            progress=lambda completed, total: progress.append((completed, total)),
+        )
+        results = sorted(results, key=lambda result: result.index)
+        self.assertEqual([0, 1, 2, 3], [result.index for result in results])
+        self.assertEqual([(i, 4) for i in range(1, 5)], progress)
+        for result in results:
+            self.assertIsNone(result.error)
+            self.assertEqual(self.expected, result.source)
+            self.assertIn("+y = 1", result.diff)
+
+    def test_rewrite_many_error_isolation(self):
+        inputs = [DATA_DIR / "transform" / "does-not-exist.py", self.path]
+        results = rewrite_many(inputs, x_to_y, language=ASTLanguage.Python, workers=0)
+        results = list(results)
+        self.assertIsNotNone(results[0].error)
+        self.assertIsNone(results[1].error)
+        self.assertEqual(self.expected, results[1].source)
+
+    def test_rewrite_many_corrupt_ast(self):
+        root = AST.from_string(slurp(self.path), ASTLanguage.Python)
+        tasks = [
+            (0, "<corrupt>", b"corrupt", None, x_to_y, False),
+            (1, "<ast>", root.to_bytes(), None, x_to_y, False),
+        ]
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(2) as pool:
+            results = pool.map(_rewrite_one, tasks)
+        self.assertIsNotNone(results[0].error)
+        self.assertIsNone(results[1].error)
+        self.assertEqual(self.expected, results[1].source)
+
+
+class DiffTestDriver(unittest.TestCase):
+    def parse(self, text: str) -> AST:
+        return AST.from_string(text, ASTLanguage.Python)
+
+    def test_diff_identical(self):
+        old = self.parse("x = 1\ny = 2\n")
+        new = self.parse("x = 1\ny = 2\n")
+        self.assertEqual([], AST.diff(old, new))
+
+    def test_diff_update(self):
+        old = self.parse("x = 1\ny = 2\n")
+        new = self.parse("x = 1\ny = 3\n")
+        [(operation, old_ast, new_ast)] = AST.diff(old, new)
+        self.assertEqual("update", operation)
+        self.assertEqual("2", old_ast.source_text)
+        self.assertEqual("3", new_ast.source_text)
+
+    def test_diff_insert(self):
+        old = self.parse("x = 1\n")
+        new = self.parse("x = 1\ny = 2\n")
+        edits = AST.diff(old, new)
+        inserts = [new_ast for operation, _, new_ast in edits if operation == "insert"]
+        self.assertEqual(["y = 2"], [ast.source_text.strip() for ast in inserts])
+        self.assertNotIn("delete", [operation for operation, _, _ in edits])
+
+    def test_diff_delete(self):
+        old = self.parse("x = 1\ny = 2\n")
+        new = self.parse("x = 1\n")
+        edits = AST.diff(old, new)
+        deletes = [old_ast for operation, old_ast, _ in edits if operation == "delete"]
+        self.assertEqual(["y = 2"], [ast.source_text.strip() for ast in deletes])
+        self.assertNotIn("insert", [operation for operation, _, _ in edits])
+
+
 class FunctionTestDriver(unittest.TestCase):
     # Function asts
     # Function name
@@ -422,6 +752,13 @@ class CallsiteTestDriver(unittest.TestCase):
         call = root.call_asts()[0]
         self.assertEqual("os.path", call.provided_by(root))
 
+    def test_provided_by_many(self):
+        text = "import os\nimport json\nos.path.join(a, b)\njson.dumps(c)\nfoo()"
+        root = AST.from_string(text, ASTLanguage.Python)
+        calls = root.call_asts()
+        self.assertEqual(3, len(calls))
+        self.assertEqual(["os.path", "json", None], AST.provided_by_many(root, calls))
+
 
 class ErrorTestDriver(unittest.TestCase):
     def test_error_handling(self):
@@ -471,6 +808,19 @@ class VarsInScopeTestDriver(unittest.TestCase):
         self.assertIsInstance(decls[0], PythonIdentifier)
         self.assertIsInstance(decls[1], PythonIdentifier)
 
+    def test_vars_in_scope_many(self):
+        root = AST.from_string("def bar(a, b): return a*b", ASTLanguage.Python)
+        ast = root.children[-1].children[-1].children[-1]
+        vars_in_scope = AST.get_vars_in_scope_many(root, [ast, ast])
+
+        self.assertEqual(2, len(vars_in_scope))
+        for var_list in vars_in_scope:
+            names = [var["name"] for var in var_list]
+            self.assertEqual(["a", "b", "bar"], names)
+
+        vars_in_scope = AST.get_vars_in_scope_many(root, [ast], keep_globals=False)
+        self.assertEqual(["a", "b"], [var["name"] for var in vars_in_scope[0]])
+
 
 class ImportsTestDriver(unittest.TestCase):
     def test_no_imports(self):
@@ -484,6 +834,401 @@ class ImportsTestDriver(unittest.TestCase):
         imports = ast.imports(root)
         self.assertEqual([["os"], ["sys", "s"], ["json", None, "dump"]], imports)
 
+    def test_imports_many(self):
+        code = "import os\nprint('Hello')\nimport sys as s\nprint('World')"
+        root = AST.from_string(code, ASTLanguage.Python)
+        asts = [root.children[1], root.children[-1]]
+        imports = AST.imports_many(root, asts)
+        self.assertEqual([[["os"]], [["os"], ["sys", "s"]]], imports)
+
+
+class InterfaceRestartTestDriver(unittest.TestCase):
+    def setUp(self):
+        self.root = AST.from_string("x = 1\nprint(x)\n", ASTLanguage.Python)
+
+    def test_interface_stats(self):
+        stats = _interface.stats()
+        self.assertGreater(stats["requests"], 0)
+        self.assertGreater(stats["heap"], 0)
+        self.assertGreaterEqual(stats["asts"], 1)
+
+    def test_restart_restores_live_asts(self):
+        stmt = self.root.children[1]
+        _interface.restart()
+        self.assertEqual("x = 1\nprint(x)\n", self.root.source_text)
+        self.assertEqual(1, self.root.refcount())
+        self.assertEqual(stmt, self.root.children[1])
+        self.assertEqual(stmt.parent(self.root), self.root)
+        self.assertEqual("print(x)", stmt.source_text.strip())
+
+    def test_restart_keeps_hashes(self):
+        stmt = self.root.children[1]
+        asts = {self.root, stmt}
+        _interface.restart()
+        self.assertIn(self.root, asts)
+        self.assertIn(stmt, asts)
+        self.assertIn(self.root.children[1], asts)
+
+    def test_restart_keeps_shared_subtrees(self):
+        new_root = AST.cut(self.root, self.root.children[0])
+        stmt = self.root.children[1]
+        _interface.restart()
+        self.assertEqual(stmt, new_root.children[0])
+        self.assertEqual(new_root, stmt.parent(new_root))
+        self.assertEqual(self.root, stmt.parent(self.root))
+
+
+class QueryCacheTestDriver(unittest.TestCase):
+    def setUp(self):
+        self.size = _interface._query_cache_size
+        _interface._query_cache_size = 2
+        _interface._query_cache_clear()
+        self.root = AST.from_string("x = 1\nprint(x)\n", ASTLanguage.Python)
+
+    def tearDown(self):
+        _interface._query_cache_size = self.size
+        _interface._query_cache_clear()
+
+    def test_pure_queries_are_cached(self):
+        stmt = self.root.children[1]
+        before = _interface.query_cache_stats()
+        path = self.root.ast_path(stmt)
+        self.assertEqual(path, self.root.ast_path(stmt))
+        self.assertEqual(stmt, stmt.parent(self.root).children[1])
+        self.assertEqual(self.root, stmt.parent(self.root))
+        after = _interface.query_cache_stats()
+        self.assertEqual(2, after["hits"] - before["hits"])
+        self.assertEqual(2, after["misses"] - before["misses"])
+
+    def test_cached_results_are_copies(self):
+        stmt = self.root.children[1]
+        self.root.ast_path(stmt).append("extra")
+        self.assertEqual([["CHILDREN", 1]], self.root.ast_path(stmt))
+
+    def test_cache_is_bounded(self):
+        for child in self.root.children:
+            child.parent(self.root)
+        self.root.lookup([])
+        self.assertEqual(2, _interface.query_cache_stats()["entries"])
+
+    def test_entries_invalidated_on_gc(self):
+        stmt = self.root.ast_at_point(2, 1)
+        stmt.parent(self.root)
+        del stmt
+        self.root.lookup([])
+        self.assertEqual(1, _interface.query_cache_stats()["entries"])
+
+    def test_watchdog_restart_before_query(self):
+        stmt = self.root.children[1]
+        oid = self.root.oid
+        limits = (
+            _interface._DEFAULT_MAX_REQUESTS,
+            _interface._DEFAULT_WATCHDOG_INTERVAL,
+            _interface._requests,
+        )
+        _interface._DEFAULT_MAX_REQUESTS = 1
+        _interface._DEFAULT_WATCHDOG_INTERVAL = 2
+        _interface._requests = 1
+        try:
+            parent = stmt.parent(self.root)
+        finally:
+            (
+                _interface._DEFAULT_MAX_REQUESTS,
+                _interface._DEFAULT_WATCHDOG_INTERVAL,
+                _interface._requests,
+            ) = limits
+        self.assertNotEqual(oid, self.root.oid)
+        self.assertEqual(self.root, parent)
+        hits = _interface.query_cache_stats()["hits"]
+        self.assertEqual(self.root, stmt.parent(self.root))
+        self.assertEqual(hits + 1, _interface.query_cache_stats()["hits"])
+
+    def test_no_stale_oids_when_disabled(self):
+        _interface._query_cache_size = None
+        stmt = self.root.ast_at_point(2, 1)
+        del stmt
+        self.assertEqual([], _interface._query_cache_stale)
+
+
+class SharedMemoryTestDriver(unittest.TestCase):
+    def setUp(self):
+        self.threshold = _interface._DEFAULT_SHARED_MEMORY
+        _interface._DEFAULT_SHARED_MEMORY = 16
+
+    def tearDown(self):
+        _interface._DEFAULT_SHARED_MEMORY = self.threshold
+
+    def test_shared_memory_roundtrip(self):
+        text = "print('反复请求多次')\n" * 4
+        path = _interface._write_shared_memory(text)
+        self.assertEqual(text, _interface._read_shared_memory(path))
+        self.assertFalse(Path(path).exists())
+
+    def test_large_source_in_shared_memory(self):
+        text = "".join(f"x{i} = {i}\n" for i in range(64))
+        root = AST.from_string(text, ASTLanguage.Python)
+        self.assertEqual(text, root.source_text)
+        self.assertEqual(64, len(root.children))
+        self.assertEqual(set(), _interface._shm_paths)
+
+    def test_release_unread_shared_memory(self):
+        path = _interface._write_shared_memory("x = 1\n" * 4)
+        self.assertIn(path, _interface._shm_paths)
+        _interface._release_shared_memory([path])
+        self.assertFalse(Path(path).exists())
+        self.assertNotIn(path, _interface._shm_paths)
+
+
+class UnixSocketTestDriver(unittest.TestCase):
+    def setUp(self):
+        self.settings = (
+            _interface._DEFAULT_UNIX_SOCKET,
+            _interface._DEFAULT_SHARED_MEMORY,
+        )
+        _interface._DEFAULT_UNIX_SOCKET = True
+        _interface._DEFAULT_SHARED_MEMORY = 16
+        _interface._reset()
+
+    def tearDown(self):
+        (
+            _interface._DEFAULT_UNIX_SOCKET,
+            _interface._DEFAULT_SHARED_MEMORY,
+        ) = self.settings
+        _interface._reset()
+
+    def test_unix_socket_roundtrip(self):
+        self.assertIsNotNone(_interface._socket)
+        self.assertEqual(socket.AF_UNIX, _interface._socket.family)
+        root = AST.from_string("x = 1\n", ASTLanguage.Python)
+        self.assertEqual("x = 1\n", root.source_text)
+
+    def test_unix_socket_shared_memory(self):
+        text = "".join(f"x{i} = {i}\n" for i in range(64))
+        root = AST.from_string(text, ASTLanguage.Python)
+        self.assertEqual(text, root.source_text)
+        self.assertEqual(64, len(root.children))
+        self.assertEqual(set(), _interface._shm_paths)
+
+    def test_port_takes_precedence(self):
+        self.assertTrue(_interface._uses_unix_socket())
+        port = _interface._DEFAULT_PORT
+        _interface._DEFAULT_PORT = 9999
+        try:
+            self.assertFalse(_interface._uses_unix_socket())
+        finally:
+            _interface._DEFAULT_PORT = port
+
+
+class DeadlineTestDriver(unittest.TestCase):
+    def test_within_deadline(self):
+        with deadline(60):
+            root = AST.from_string("x = 1\n", ASTLanguage.Python)
+            self.assertEqual("x = 1\n", root.source_text)
+
+    def test_deadline_passed(self):
+        root = AST.from_string("x = 1\n", ASTLanguage.Python)
+        with self.assertRaises(ASTTimeout):
+            with deadline(0):
+                root.children
+        self.assertEqual(1, len(root.children))
+
+    def test_nested_deadlines(self):
+        with self.assertRaises(ASTTimeout):
+            with deadline(0):
+                with deadline(60):
+                    AST.from_string("x = 1\n", ASTLanguage.Python)
+
+    def test_reset_invalidates_keeping_hashes(self):
+        root = AST.from_string("x = 1\n", ASTLanguage.Python)
+        code = hash(root)
+        _interface._reset()
+        self.assertIsNone(root.oid)
+        self.assertEqual(code, hash(root))
+        self.assertIn(root, {root})
+
+
+class DaemonTestDriver(unittest.TestCase):
+    text = "x = 1\n"
+
+    @classmethod
+    def setUpClass(cls):
+        with socket.socket() as s:
+            s.bind(("localhost", 0))
+            cls.port = s.getsockname()[1]
+        cmdline = [_interface._command(), "--port", str(cls.port), "--daemon"]
+        cls.proc = subprocess.Popen(
+            cmdline,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.proc.kill()
+        cls.proc.wait()
+
+    def connect(self):
+        """Open a persistent connection to the daemon as a new client."""
+        for _ in range(_interface._DEFAULT_STARTUP_WAIT * 10):
+            try:
+                client = socket.create_connection(("localhost", self.port))
+                break
+            except ConnectionRefusedError:
+                time.sleep(0.1)
+        else:
+            self.fail("Daemon did not start.")
+        self.addCleanup(client.close)
+        return client
+
+    def request(self, client, *request):
+        """Send request from client and return the decoded response."""
+        client.sendall(f"{json.dumps(request)}\n".encode())
+        with client.makefile("rb") as f:
+            return json.loads(f.readline().decode())
+
+    def parse(self, client):
+        return self.request(client, "from_string", self.text, "Python", False, True)
+
+    def refcount(self, client, oid):
+        return self.request(client, "refcount", {"type": "ast", "oid": oid})
+
+    def test_clients_share_identical_parses(self):
+        a, b = self.connect(), self.connect()
+        self.assertEqual(self.parse(a)["oid"], self.parse(b)["oid"])
+
+    def test_clients_have_own_references(self):
+        a, b = self.connect(), self.connect()
+        oid = self.parse(a)["oid"]
+        self.parse(a)
+        self.parse(b)
+        self.assertEqual(2, self.refcount(a, oid))
+        self.assertEqual(1, self.refcount(b, oid))
+        self.assertEqual(0, self.refcount(self.connect(), oid))
+
+    def test_disconnect_releases_own_references(self):
+        a, b = self.connect(), self.connect()
+        oid = self.parse(a)["oid"]
+        self.parse(b)
+        a.close()
+        self.assertEqual(1, self.refcount(b, oid))
+        ast = {"type": "ast", "oid": oid}
+        self.assertEqual(self.text, self.request(b, "source_text", ast))
+
+
+class AsyncTestDriver(unittest.TestCase):
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.run_async(aio.stop())
+        self.loop.close()
+
+    def test_from_string(self):
+        async def main():
+            root = await aio.AST.from_string("x = 1\n", ASTLanguage.Python)
+            return root.type_name, await root.source_text()
+
+        self.assertEqual(("PythonModule", "x = 1\n"), self.run_async(main()))
+
+    def test_requests_in_flight(self):
+        async def main():
+            texts = [f"x = {i}\n" for i in range(16)]
+            roots = await asyncio.gather(
+                *[aio.AST.from_string(text, ASTLanguage.Python) for text in texts]
+            )
+            sources = await asyncio.gather(*[root.source_text() for root in roots])
+            return texts, sources
+
+        texts, sources = self.run_async(main())
+        self.assertEqual(texts, sources)
+
+    def test_worker_threads(self):
+        async def main():
+            texts = [f"x = {i}\n" for i in range(16)]
+            roots = await asyncio.gather(
+                *[aio.AST.from_string(text, ASTLanguage.Python) for text in texts]
+            )
+            return await asyncio.gather(*[root.source_text() for root in roots])
+
+        threads = aio._interface._threads
+        aio._interface._threads = 4
+        try:
+            texts = [f"x = {i}\n" for i in range(16)]
+            self.assertEqual(texts, self.run_async(main()))
+        finally:
+            self.run_async(aio.stop())
+            aio._interface._threads = threads
+
+    def test_queries_and_traversal(self):
+        async def main():
+            root = await aio.AST.from_string("x = 1\n", ASTLanguage.Python)
+            asts = [ast async for ast in root.traverse()]
+            self.assertEqual(root, asts[0])
+            self.assertEqual(root, await asts[1].parent(root))
+            self.assertEqual(asts[1], await root.lookup(await root.ast_path(asts[1])))
+
+        self.run_async(main())
+
+    def test_errors(self):
+        async def main():
+            root = await aio.AST.from_string("x = 1\n", ASTLanguage.Python)
+            with self.assertRaises(ASTException):
+                await root.child_slot("NOT-A-SLOT")
+            self.assertEqual("x = 1\n", await root.source_text())
+
+        self.run_async(main())
+
+    def test_malformed_responses(self):
+        async def main():
+            reader = asyncio.StreamReader()
+            response = asyncio.get_event_loop().create_future()
+            aio._interface._reader = reader
+            aio._interface._pending = {1: response}
+            reader.feed_data(b'{"error": "Malformed request"}\n')
+            reader.feed_data(b"not json\n")
+            reader.feed_eof()
+            await aio._interface._receive()
+            with self.assertRaisesRegex(ASTException, "Malformed request"):
+                response.result()
+
+        reader = aio._interface._reader
+        try:
+            self.run_async(main())
+        finally:
+            aio._interface._reader = reader
+
+    def test_long_responses(self):
+        async def main():
+            reader = asyncio.StreamReader()
+            response = asyncio.get_event_loop().create_future()
+            aio._interface._reader = reader
+            aio._interface._pending = {1: response}
+            text = "x" * 2**17
+            reader.feed_data(json.dumps({"id": 1, "result": text}).encode())
+            reader.feed_data(b"\n")
+            reader.feed_eof()
+            await aio._interface._receive()
+            self.assertEqual(text, response.result()["result"])
+
+        reader = aio._interface._reader
+        try:
+            self.run_async(main())
+        finally:
+            aio._interface._reader = reader
+
+    def test_long_source_text(self):
+        async def main():
+            text = "".join(f"x{i} = {i}\n" for i in range(2**14))
+            root = await aio.AST.from_string(text, ASTLanguage.Python)
+            return text, await root.source_text()
+
+        text, source = self.run_async(main())
+        self.assertEqual(text, source)
+
 
 class UTF8TestDriver(unittest.TestCase):
     def test_utf8_multibyte_characters(self):
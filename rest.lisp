@@ -92,7 +92,8 @@
 (defun start-server (&optional (port *default-rest-port*))
   (if *server*
       (stop-server))
-  (setf *server* (clack:clackup (snooze:make-clack-app) :port port)))
+  (setf *server* (clack:clackup (wrap-gzip (snooze:make-clack-app))
+                                :port port)))
 
 (defun stop-server ()
   (when *server*
@@ -115,7 +116,8 @@
            (stop handler)
            (exit-command rest-server errno)))
     (when help (show-help-for-rest-server) (exit-command rest-server 0))
-    (setf handler (clackup (make-clack-app) :port (parse-integer port)))
+    (setf handler (clackup (wrap-gzip (make-clack-app))
+                           :port (parse-integer port)))
     ;; From https://github.com/LispCookbook/cl-cookbook/blob/master/scripting.md
     (handler-case
         (iter (for char = (read-char))
@@ -50,6 +50,17 @@
 ;;;     Allows some control of the task, such as stopping the task.
 ;;;     (Currently not implemented.)
 ;;;
+;;; Async-Wait:
+;;;
+;;;  GET
+;;;     @code{<service-base>/async-wait?cid=<cid>&name=<Job-ID>&timeout=<secs>}
+;;;     Blocks until the job has finished or until timeout seconds
+;;;     have passed, then returns the same JSON as the async GET.
+;;;     The finished field of the result tells which of the two
+;;;     happened.  The wait is capped at @code{*async-wait-timeout*}
+;;;     seconds, which is also used when no timeout is given, so
+;;;     clients waiting longer repeat the request.
+;;;
 ;;; @texi{rest-async-jobs}
 (defpackage :software-evolution-library/rest/async-jobs
   (:nicknames :sel/rest/async-jobs)
@@ -70,11 +81,13 @@
   (:export :apply-async-job-func
            :async-job
            :async-job-name
+           :*async-wait-timeout*
            :define-async-job
            :lookup-job-func
            :lookup-session-job
            :lookup-session-job-status
-           :session-jobs))
+           :session-jobs
+           :wait-session-job))
 (in-package :software-evolution-library/rest/async-jobs)
 (in-readtable :curry-compose-reader-macros)
 
@@ -189,6 +202,7 @@
      (task-runner-remaining-jobs (async-job-task-runner async-job))
      :arguments (async-job-args async-job)
      :completed-tasks (task-runner-completed-tasks task-runner)
+     :finished (zerop (task-runner-workers-count task-runner))
      :results (task-runner-results task-runner))))
 
 (defun lookup-session-job (session name)
@@ -267,3 +281,26 @@
 (defroute
     async (:get "application/json" &key cid name)
   (lookup-session-job-status (lookup-session cid) name))
+
+(defvar *async-wait-timeout* 30
+  "Maximum number of seconds an async-wait request blocks before returning.")
+
+(defun wait-session-job (session name &optional timeout)
+  "Block until the named job of SESSION has finished, or until TIMEOUT
+seconds (at most `*async-wait-timeout*') have passed.  Returns the job status
+as LOOKUP-SESSION-JOB-STATUS.  TIMEOUT is a query parameter, and signals a
+400 error unless it is a non-negative integer."
+  (let ((timeout (if timeout
+                     (min (integer-parameter timeout) *async-wait-timeout*)
+                     *async-wait-timeout*)))
+    (when-let ((job (lookup-session-job session name)))
+      (task-runner-wait (async-job-task-runner job) timeout)))
+  (lookup-session-job-status session name))
+
+(defroute
+    async-wait (:get :text/* &key cid name timeout)
+  (wait-session-job (lookup-session cid) name timeout))
+
+(defroute
+    async-wait (:get "application/json" &key cid name timeout)
+  (wait-session-job (lookup-session cid) name timeout))
@@ -67,6 +67,13 @@
 ;;;     software-id] are passed as keyword parameters to
 ;;;     (MAKE-INSTANCE '<software-type> &key).  Returns a software
 ;;;     object ID of newly created software.
+;;;  POST
+;;;     @code{<service-base>/soft-many?cid=<cid>&type=<software-type>}
+;;;     Body, JSON format, is an array of software bodies as accepted
+;;;     by the soft POST above, each creating one software object of
+;;;     the passed type.  Returns a JSON array of the software object
+;;;     IDs of the newly created software, in order.  If any software
+;;;     cannot be created, none is and an error is returned.
 ;;;  GET
 ;;;     @code{<service-base>/soft?cid=<cid>&sid=<software
 ;;;     ID>} Returns JSON describing software object (differs
@@ -77,6 +84,14 @@
 ;;;  GET
 ;;;     @code{<service-base>/soft?cid=<cid>} Return IDs of all live
 ;;;     software objects owned by the client.
+;;;
+;;;     Both of the above take optional @code{offset} and @code{limit}
+;;;     parameters returning only @code{limit} software objects from
+;;;     @code{offset} on, in order of their IDs so pages stay stable
+;;;     as software is created, and a @code{fields} parameter, a comma
+;;;     separated list of oid, class, size and fitness, returning an
+;;;     object of those fields for each software object instead of
+;;;     its ID, e.g. @code{fields=oid,fitness}.
 ;;;  PUT
 ;;;     @code{<service-base>/soft?cid=<cid>&sid=<software ID>} Update a
 ;;;     software object.  Body (JSON) contains slots to update, new
@@ -110,7 +125,13 @@
 ;;;  GET
 ;;;     @code{<service-base>/cid=<cid>&pop?pid=<Population-ID>} Retrieves
 ;;;     information about the population, including list of
-;;;     Software IDs and software type.
+;;;     Software IDs and software type.  Takes the same @code{offset},
+;;;     @code{limit} and @code{fields} parameters as the software GET,
+;;;     which apply to the listed members; with @code{fields} they are
+;;;     listed as objects in a members field instead of the sids.
+;;;
+;;; Responses of 1KB or more are gzip compressed for clients sending
+;;; an @code{Accept-Encoding} header including gzip.
 ;;;  DELETE
 ;;;     @code{<service-base>/cid=<cid>&pop?pid=<Population-ID>} Delete
 ;;;     the population.  (work in progress)
@@ -120,6 +141,12 @@
 ;;;     @{<service-base>/cid=<cid>&mut?type=<mutation-type>&sid=<software-id>}
 ;;;     Body (JSON) contains targets field (integer, list, or ast).
 ;;;     Returns mutation-id (mid).
+;;;  POST
+;;;     @code{<service-base>/mut-many?cid=<cid>} Body (JSON) is an
+;;;     array of mutations, each containing type, sid and targets
+;;;     fields.  Returns a JSON array of mutation-ids (mid), in order.
+;;;     If any mutation cannot be created, none is and an error is
+;;;     returned.
 ;;;  GET
 ;;;     @code{<service-base>/cid=<cid>&mut?mid=<mutation-id>} Returns
 ;;;     mutation details.
@@ -140,6 +167,12 @@
 ;;;     format, array of structures, each containing program-name
 ;;;     and program-args.  Returns oid of newly created tests
 ;;;     suite.
+;;;  POST
+;;;     @code{<service-base>/tests-many?cid=<cid>} Body (JSON) is an
+;;;     array of test suite bodies as accepted by the tests POST
+;;;     above.  Returns a JSON array of the oids of the newly created
+;;;     test suites, in order.  If any test suite cannot be created,
+;;;     none is and an error is returned.
 ;;;  GET
 ;;;     @code{<service-base>/tests?cid=<cid>&oid=<test-suite-oid>}
 ;;;     Retrieves collection of test cases in the test-suite.
@@ -147,6 +180,23 @@
 ;;;     @code{<service-base>/tests?cid=<cid>&pid=<test-suite-oid>} Delete
 ;;;     the test suite.  (work in progress)
 ;;;
+;;; Fitness Cache:
+;;;
+;;;  GET
+;;;     @code{<service-base>/fitness-cache?cid=<cid>} Returns JSON
+;;;     containing the size, capacity, hits and misses of the fitness
+;;;     cache used when evaluating software, which are all zero
+;;;     while the cache is disabled.
+;;;  PUT
+;;;     @code{<service-base>/fitness-cache?cid=<cid>} Enables the
+;;;     fitness cache, replacing any previous cache.  The cache is
+;;;     server-wide, so this resets the cache and its statistics for
+;;;     every client, not only the client @code{cid}.  Body contains
+;;;     JSON with optional fields @code{capacity}, the maximum number
+;;;     of entries, and @code{path}, a file the entries are persisted
+;;;     to and loaded from.  The cache is disabled instead when
+;;;     @code{enabled} is false.  Returns JSON as for GET.
+;;;
 ;;; Write Software:
 ;;;
 ;;;  POST
@@ -210,6 +260,39 @@
 (defun (setf session-software) (value session)
   (setf (session-store-value session "software") value))
 
+(defun make-software-from-json (software-type json)
+  "Return a software object of SOFTWARE-TYPE from the initializers in JSON,
+or nil if JSON does not contain a path."
+  (let ((path (aget :path json))
+        (url (aget :url json))
+        (code (aget :code json)))
+    (declare (ignore url code)) ; not implemented yet
+    (when path
+      (format-genome
+       (from-file
+        (apply 'make-instance
+               software-type
+               (iter (for x in json)
+                     (unless
+                         (member (car x)
+                                 '(:path :project-dir
+                                   :url :code :software-id))
+                       (collect (car x))
+                       (collect (convert-symbol (cdr x))))))
+        path)))))
+
+(defun store-software (client software)
+  "Store SOFTWARE, if non-nil, with CLIENT, returning its oid."
+  (when software
+    (push software (session-software client))
+    (sel::oid software)))
+
+(defun create-software (client software-type json)
+  "Create a software object of SOFTWARE-TYPE from the initializers in JSON.
+The new software object is stored with CLIENT.  Returns its oid, or nil if
+JSON does not contain a path."
+  (store-software client (make-software-from-json software-type json)))
+
 (defroute
     soft (:post "application/json" &key cid (sid nil) (type nil))
   (declare (ignore sid))
@@ -218,31 +301,32 @@
                 (error (e)
                   (http-condition 400 "Malformed JSON (~a)!" e)))))
     (handler-case
-        (let* ((client (lookup-session cid))
-               (path (aget :path json))
-               (url (aget :url json))
-               (code (aget :code json))
-               (software-type (convert-symbol type))) ;conv. string to symbol
-          (declare (ignore url code)) ; not implemented yet
-          (when path
-            (let ((software
-                   (from-file
-                    (apply 'make-instance
-                           software-type
-                           (iter (for x in json)
-                                 (unless
-                                     (member (car x)
-                                             '(:path :project-dir
-                                               :url :code :software-id))
-                                   (collect (car x))
-                                   (collect (convert-symbol (cdr x))))))
-                    path)))
-              ;; store the software obj with the session
-              (push (format-genome software) (session-software client))
-              (format nil "~D" (sel::oid software)))))
+        (when-let ((oid (create-software (lookup-session cid)
+                                         ;; conv. string to symbol
+                                         (convert-symbol type)
+                                         json)))
+          (format nil "~D" oid))
       (error (e)
         (http-condition 400 "Error in software POST method (~a)!" e)))))
 
+(defroute
+    soft-many (:post "application/json" &key cid (type nil))
+  (let ((json (handler-case
+                  (decode-json-payload)
+                (error (e)
+                  (http-condition 400 "Malformed JSON (~a)!" e)))))
+    (handler-case
+        (let* ((client (lookup-session cid))
+               (software-type (convert-symbol type))
+               ;; Create all of the software before storing any, so
+               ;; nothing is stored when any creation fails.
+               (software
+                (mapcar {make-software-from-json software-type} json)))
+          (json:encode-json-to-string
+           (map 'vector {store-software client} software)))
+      (error (e)
+        (http-condition 400 "Error in software bulk POST method (~a)!" e)))))
+
 (defun find-software (session sid)
   "Return the population from the session record (if found)."
   (if-let ((software (session-software session)))
@@ -250,33 +334,59 @@
                  :key 'sel::oid :test 'eql))
     NIL))
 
-(defun get-software (cid sid type)
+(defparameter *software-fields* '(:oid :class :size :fitness)
+  "Fields of software objects which may be selected with fields=.")
+
+(defun parse-fields (fields)
+  "Parse the comma separated FIELDS query parameter.
+Returns a list of keywords from `*software-fields*', or nil without FIELDS."
+  (when fields
+    (mapcar (lambda (name)
+              (or (find name *software-fields* :test #'string-equal)
+                  (http-condition 400 "Unknown field ~a!" name)))
+            (split-sequence #\, (princ-to-string fields)
+                            :remove-empty-subseqs t))))
+
+(defun software-alist (software &optional (fields *software-fields*))
+  "Return an alist of FIELDS of SOFTWARE for encoding as JSON."
+  (iter (for field in fields)
+        (collect (cons field
+                       (ecase field
+                         (:oid (sel::oid software))
+                         (:class (format nil "~A"
+                                         (class-name (class-of software))))
+                         (:size (format nil "~D" (size software)))
+                         (:fitness (fitness software)))))))
+
+(defun get-software (cid sid type &key offset limit fields)
   (let ((result "{ \"error\": \"Nothing\"}"))
     (if-let ((client (lookup-session cid)))
       (if-let ((software (find-software client sid)))
         (setf result
-              (json:encode-json-plist-to-string
-               (list
-                :oid (sel::oid software)
-                :class (format nil "~A"
-                               (class-name (class-of software)))
-                :size (format nil "~D" (size software))
-                :fitness (fitness software))))
-        (let ((ids (iter (for x in (session-software client))
-                         (if (or (null type)
-                                 (eq (class-name (class-of x)) type))
-                             (collect (sel::oid x))))))
+              (json:encode-json-alist-to-string
+               (software-alist software
+                               (or (parse-fields fields) *software-fields*))))
+        (let ((software
+               (paginate
+                (iter (for x in (session-software client))
+                      (if (or (null type)
+                              (eq (class-name (class-of x)) type))
+                          (collect x)))
+                offset limit :key #'sel::oid)))
           (setf result
-                (json:encode-json-to-string ids))))
+                (json:encode-json-to-string
+                 (if-let ((fields (parse-fields fields)))
+                   (mapcar {software-alist _ fields} software)
+                   (mapcar #'sel::oid software))))))
       result)))
 
 (defroute
-    soft (:get :text/* &key cid sid (type nil))
-  (get-software cid sid type))
+    soft (:get :text/* &key cid sid (type nil) offset limit fields)
+  (get-software cid sid type :offset offset :limit limit :fields fields))
 
 (defroute
-    soft (:get "application/json" &key cid sid (type nil))
-  (get-software cid sid type))
+    soft (:get "application/json" &key cid sid (type nil) offset limit fields)
+  (get-software cid sid type :offset offset :limit limit :fields fields))
 
 ;;; Specific explainer for soft resource (software object)
 (defmethod explain-condition ((error error) (resource (eql #'soft))
@@ -338,15 +448,23 @@
     (push population (session-populations client))
     (population-name population)))
 
-(defun format-population-as-json (population)
-  (json:encode-json-plist-to-string
-   (list
-    :name (population-name population)
-    :type (symbol-name (population-type population))
-    :size (population-size population)
-    :sids (mapcar 'sel::oid (population-individuals population)))))
-
-(defun get-population (cid name)
+(defun format-population-as-json (population &key offset limit fields)
+  "Return JSON describing POPULATION.
+The size is that of the whole population, while its members are paginated by
+OFFSET and LIMIT.  Members are listed by sid, or as objects of the FIELDS
+keywords of `*software-fields*' when FIELDS is non-nil."
+  (let ((individuals (paginate (population-individuals population)
+                               offset limit :key #'sel::oid)))
+    (json:encode-json-plist-to-string
+     (list*
+      :name (population-name population)
+      :type (symbol-name (population-type population))
+      :size (population-size population)
+      (if fields
+          (list :members (mapcar {software-alist _ fields} individuals))
+          (list :sids (mapcar 'sel::oid individuals)))))))
+
+(defun get-population (cid name &key offset limit fields)
   (let* ((client (lookup-session cid)))
     (if client
         (let ((population (and name (find-population client name))))
@@ -354,7 +472,9 @@
               (let ((pop-names (iter (for x in (session-populations client))
                                      (collect (population-name x)))))
                 (json:encode-json-to-string pop-names))
-              (format-population-as-json population))))))
+              (format-population-as-json population
+                                         :offset offset :limit limit
+                                         :fields (parse-fields fields)))))))
 
 (defun add-population (client population sids)
   (iter (for sid in sids)
@@ -363,12 +483,12 @@
               (push ind (population-individuals population))))))
 
 (defroute
-    population (:get :text/* &key cid name)
-  (get-population cid name))
+    population (:get :text/* &key cid name offset limit fields)
+  (get-population cid name :offset offset :limit limit :fields fields))
 
 (defroute
-    population (:get "application/json" &key cid name)
-  (get-population cid name))
+    population (:get "application/json" &key cid name offset limit fields)
+  (get-population cid name :offset offset :limit limit :fields fields))
 
 (defroute
     population (:put "application/json" &key cid name)
@@ -410,15 +530,11 @@ Resource lookups are of the form \"<resource>:<oid>\""
                     (member id (session-property session res)
                             :key 'sel::oid :test 'eql))))))))
 
-(defroute
-    mut (:post "application/json" &key cid mid)
-  (declare (ignore mid))
-  (let* ((json (handler-case
-                   (decode-json-payload)
-                 (error (e)
-                   (http-condition 400 "Malformed JSON (~a)!" e))))
-         (session (lookup-session cid))
-         (type (aget :type json))
+(defun make-mutation-from-json (session json)
+  "Return a mutation from the type, sid, targets and properties in JSON,
+looking up the software and other resources in SESSION, or nil if JSON does
+not contain a type."
+  (let* ((type (aget :type json))
          (type-sym (and type (convert-symbol type)))
          (sid (aget :sid json))
          (software (find-software session sid))
@@ -431,16 +547,50 @@ Resource lookups are of the form \"<resource>:<oid>\""
                               (or (lookup-resource session (cdr x))
                                   (convert-symbol (cdr x)))))))
          (targets (aget :targets json)))
-    (if type
-        (let ((mutation
-               (apply 'make-instance
-                      type-sym
-                      :object software
-                      :targets targets
-                      properties)))
-          ;; store the software obj with the session
-          (push mutation (session-mutations session))
-          (format nil "~D" (sel::oid mutation))))))
+    (when type
+      (apply 'make-instance
+             type-sym
+             :object software
+             :targets targets
+             properties))))
+
+(defun store-mutation (session mutation)
+  "Store MUTATION, if non-nil, with SESSION, returning its oid."
+  (when mutation
+    (push mutation (session-mutations session))
+    (sel::oid mutation)))
+
+(defun create-mutation (session json)
+  "Create a mutation from the type, sid, targets and properties in JSON.
+The new mutation is stored with SESSION.  Returns its oid, or nil if JSON
+does not contain a type."
+  (store-mutation session (make-mutation-from-json session json)))
+
+(defroute
+    mut (:post "application/json" &key cid mid)
+  (declare (ignore mid))
+  (let ((json (handler-case
+                  (decode-json-payload)
+                (error (e)
+                  (http-condition 400 "Malformed JSON (~a)!" e)))))
+    (when-let ((oid (create-mutation (lookup-session cid) json)))
+      (format nil "~D" oid))))
+
+(defroute
+    mut-many (:post "application/json" &key cid)
+  (let ((json (handler-case
+                  (decode-json-payload)
+                (error (e)
+                  (http-condition 400 "Malformed JSON (~a)!" e))))
+        (session (lookup-session cid)))
+    (handler-case
+        ;; Create all of the mutations before storing any, so nothing is
+        ;; stored when any creation fails.
+        (let ((mutations (mapcar {make-mutation-from-json session} json)))
+          (json:encode-json-to-string
+           (map 'vector {store-mutation session} mutations)))
+      (error (e)
+        (http-condition 400 "Error in mutation bulk POST method (~a)!" e)))))
 
 (defun format-mutation-as-json (mutation)
   (json:encode-json-plist-to-string
@@ -482,35 +632,61 @@ Resource lookups are of the form \"<resource>:<oid>\""
   (car (member oid (session-test-suites client)
                :key 'sel::oid :test 'eql)))
 
+(defun make-test-suite-from-json (json)
+  "Return a test suite from the program-name/program-args pairs in the tests
+field of JSON."
+  (funcall 'make-instance
+           'test-suite
+           :test-cases
+           (mapcar
+            (lambda (test)
+              (let ((program-name (aget :program-name test))
+                    (program-args (aget :program-args test)))
+                (make-instance 'test-case :program-name program-name
+                               :program-args
+                               (mapcar (lambda (x)
+                                         (if (or (equal x ":BIN")
+                                                 (equal x "BIN"))
+                                             :bin
+                                             x))
+                                       program-args))))
+            (aget :tests json))))
+
+(defun store-test-suite (session test-suite)
+  "Store TEST-SUITE with SESSION, returning its oid."
+  (push test-suite (session-test-suites session))
+  (sel::oid test-suite))
+
+(defun create-test-suite (session json)
+  "Create a test suite from the program-name/program-args pairs in the tests
+field of JSON.  The new test suite is stored with SESSION.  Returns its oid."
+  (store-test-suite session (make-test-suite-from-json json)))
+
 (defroute
     tests (:post "application/json" &key cid oid)
   (declare (ignore oid))
-  (let* ((json (handler-case
-                   (decode-json-payload)
-                 (error (e)
-                   (http-condition 400 "Malformed JSON (~a)!" e))))
-         (session (lookup-session cid))
-         (tests (aget :tests json))
-         (test-suite
-          (funcall 'make-instance
-                   'test-suite
-                   :test-cases
-                   (mapcar
-                    (lambda (test)
-                      (let ((program-name (aget :program-name test))
-                            (program-args (aget :program-args test)))
-                        (make-instance 'test-case :program-name program-name
-                                       :program-args
-                                       (mapcar (lambda (x)
-                                                 (if (or (equal x ":BIN")
-                                                         (equal x "BIN"))
-                                                     :bin
-                                                     x))
-                                               program-args))))
-                    tests))))
-    ;; store the test-suite obj with the session
-    (push test-suite (session-test-suites session))
-    (format nil "~D" (sel::oid test-suite)))) ;; return the oid
+  (let ((json (handler-case
+                  (decode-json-payload)
+                (error (e)
+                  (http-condition 400 "Malformed JSON (~a)!" e)))))
+    ;; return the oid
+    (format nil "~D" (create-test-suite (lookup-session cid) json))))
+
+(defroute
+    tests-many (:post "application/json" &key cid)
+  (let ((json (handler-case
+                  (decode-json-payload)
+                (error (e)
+                  (http-condition 400 "Malformed JSON (~a)!" e))))
+        (session (lookup-session cid)))
+    (handler-case
+        ;; Create all of the test suites before storing any, so nothing is
+        ;; stored when any creation fails.
+        (let ((test-suites (mapcar #'make-test-suite-from-json json)))
+          (json:encode-json-to-string
+           (map 'vector {store-test-suite session} test-suites)))
+      (error (e)
+        (http-condition 400 "Error in test suite bulk POST method (~a)!" e)))))
 
 (defun format-test-as-json (test)
   (json:encode-json-plist-to-string
@@ -541,6 +717,40 @@ Resource lookups are of the form \"<resource>:<oid>\""
     tests (:get "application/json" &key cid oid)
   (get-test-suite cid oid))
 
+;;;; Fitness Cache Routes
+
+(defroute
+    fitness-cache (:get :text/* &key cid)
+  (declare (ignore cid))
+  (json:encode-json-plist-to-string (fitness-cache-stats)))
+
+(defroute
+    fitness-cache (:get "application/json" &key cid)
+  (declare (ignore cid))
+  (json:encode-json-plist-to-string (fitness-cache-stats)))
+
+;;; The fitness cache is shared by all sessions, so CID is only accepted
+;;; for uniformity with the other routes.
+(defroute
+    fitness-cache (:put "application/json" &key cid)
+  (declare (ignore cid))
+  (let ((json (handler-case
+                  (decode-json-payload)
+                (error (e)
+                  (http-condition 400 "Malformed JSON (~a)!" e)))))
+    (handler-case
+        (let ((capacity (aget :capacity json))
+              (path (aget :path json)))
+          (unless (typep capacity '(or null (integer 1)))
+            (error "Capacity ~a is not a positive integer" capacity))
+          (setf *fitness-cache*
+                (unless (and (assoc :enabled json) (not (aget :enabled json)))
+                  (apply #'make-instance 'fitness-cache
+                         :path path
+                         (when capacity (list :capacity capacity))))))
+      (error (e)
+        (http-condition 400 "Error in fitness-cache PUT method (~a)!" e)))
+    (json:encode-json-plist-to-string (fitness-cache-stats))))
 
 ;;;
 ;;; write the contents of a software object
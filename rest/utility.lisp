@@ -10,9 +10,15 @@
    :cl-json
    :snooze)
   (:shadowing-import-from :clack :clackup :stop)
+  (:import-from :flexi-streams)
+  (:import-from :salza2)
   (:export :convert-symbol
            :make-gensym-string
-           :decode-json-payload))
+           :decode-json-payload
+           :integer-parameter
+           :paginate
+           :*gzip-minimum-size*
+           :wrap-gzip))
 (in-package :software-evolution-library/rest/utility)
 (in-readtable :curry-compose-reader-macros)
 
@@ -37,3 +43,82 @@ Will raise an error if the JSON is malformed and decoding fails."
     ;;(json:decode-json-from-string payload)
     (json:decode-json-from-string payload)
     '()))
+
+(defun integer-parameter (value)
+  "Return the non-negative integer of the query parameter VALUE, which may be
+a string."
+  (let ((integer (handler-case
+                     (etypecase value
+                       (integer value)
+                       (string (parse-integer value)))
+                   (error () nil))))
+    (if (and integer (not (minusp integer)))
+        integer
+        (http-condition 400 "Expected a non-negative integer, not ~s!"
+                        value))))
+
+(defun paginate (list offset limit &key (key #'identity))
+  "Return the LIMIT elements of LIST starting at OFFSET, ordered by KEY.
+OFFSET and LIMIT are query parameters; when nil, return the elements from the
+start and to the end of LIST respectively.  The elements are ordered by the
+integer KEY, e.g. the oids of objects, so that pages are stable while
+elements with larger keys are added."
+  (let ((tail (nthcdr (if offset (integer-parameter offset) 0)
+                      (stable-sort (copy-list list) #'< :key key))))
+    (if limit
+        (take (integer-parameter limit) tail)
+        tail)))
+
+(defparameter *gzip-minimum-size* 1024
+  "Response bodies shorter than this many characters are never compressed.")
+
+(defun gzip-accepted-p (env)
+  "Return true if the request of the clack ENV accepts a gzip encoded body.
+That is, if its Accept-Encoding header lists gzip, or failing that *, with a
+non-zero q-value."
+  (when-let* ((headers (getf env :headers))
+              (accept (gethash "accept-encoding" headers)))
+    (let ((codings
+           (iter (for coding in (split-sequence #\, accept))
+                 (for (name . parameters) =
+                      (mapcar #'trim-whitespace (split-sequence #\; coding)))
+                 (collect
+                     (cons (string-downcase name)
+                           ;; A q-value of zero, e.g. "q=0" or "q=0.00",
+                           ;; refuses the coding.
+                           (notany (lambda (parameter)
+                                     (and (starts-with-subseq
+                                           "q=" (string-downcase parameter))
+                                          (every {find _ "0."}
+                                                 (subseq parameter 2))))
+                                   parameters))))))
+      (cdr (or (assoc "gzip" codings :test #'string=)
+               (assoc "*" codings :test #'string=))))))
+
+(defun wrap-gzip (app)
+  "Return a clack app compressing the responses of APP with gzip.
+Bodies of at least `*gzip-minimum-size*' characters are compressed when the
+request accepts a gzip encoding, e.g. large populations and software lists."
+  (lambda (env)
+    (let* ((response (funcall app env))
+           ;; Delayed (streamed) responses are functions, left as they are.
+           (body (and (listp response) (third response))))
+      (if (and (consp body)
+               (every #'stringp body)
+               (>= (reduce #'+ body :key #'length) *gzip-minimum-size*)
+               (gzip-accepted-p env))
+          (destructuring-bind (status headers body) response
+            (let ((data (salza2:compress-data
+                         (flexi-streams:string-to-octets
+                          (apply #'concatenate 'string body)
+                          :external-format :utf-8)
+                         'salza2:gzip-compressor)))
+              (list status
+                    (list* :content-encoding "gzip"
+                           :content-length (length data)
+                           :vary "Accept-Encoding"
+                           (remove-from-plist headers
+                                              :content-encoding
+                                              :content-length))
+                    data)))
+          response))))
@@ -28,6 +28,7 @@
    :return-nil-for-bin
    :retry-project-build
    :evaluate
+   :compute-fitness
    :copy
    :lines
    :line-breaks
@@ -281,16 +282,30 @@ first value from the `phenome' method."
   (declare (ignorable extra-keys))
   (evaluate (symbol-function (or test 'identity)) obj))
 
-(defmethod evaluate ((test function) (obj software)
+(defmethod evaluate (test (obj software)
                      &rest extra-keys &key &allow-other-keys)
-  (declare (ignorable extra-keys))
+  "Evaluate OBJ on TEST with `compute-fitness' and save the result as its
+fitness, unless OBJ already has a fitness."
   (if (fitness obj)
       (values (fitness obj) (fitness-extra-data obj))
-      (multiple-value-bind (fit extra) (funcall test obj)
+      (multiple-value-bind (fit extra)
+          (apply #'compute-fitness test obj extra-keys)
         (setf (fitness obj) fit)
         (setf (fitness-extra-data obj) extra)
         (values fit extra))))
 
+(defgeneric compute-fitness (test software &rest extra-keys
+                             &key &allow-other-keys)
+  (:documentation "Compute the fitness of SOFTWARE on TEST for `evaluate'.
+Return the fitness and any extra data, without reading or setting the fitness
+of SOFTWARE.  Methods may e.g. find the fitness of identical software in a
+cache instead of computing it."))
+
+(defmethod compute-fitness ((test function) (obj software)
+                            &rest extra-keys &key &allow-other-keys)
+  (declare (ignorable extra-keys))
+  (funcall test obj))
+
 (defgeneric fitness-extra-data (software)
   (:documentation "Hold extra data returned by the fitness function."))
 
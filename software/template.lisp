@@ -278,17 +278,34 @@ with `@') can also be used as Trivia patterns for destructuring.
        (list x y)))
     => (#<python-identifier \"x\"> #<python-integer \"2\">
         #<python-integer \"2\">)"
+  (mvlet* ((template names placeholders subtrees
+            (parse-ast-template template class args))
+           (dummy (allocate-instance (find-class class)))
+           (subs
+            (iter (for name in names)
+                  (for subtree in subtrees)
+                  (collect (cons name (template-subtree dummy subtree)))))
+           (ast name-paths
+            (ast-template-skeleton template class placeholders subs)))
+    (insert-template-subtrees ast name-paths subs)))
+
+(-> ast-template-skeleton (string symbol list list)
+    (values ast list &optional))
+(defun ast-template-skeleton (template class placeholders subs)
+  "Parse TEMPLATE, as returned by `parse-ast-template', into an AST of CLASS.
+PLACEHOLDERS are the placeholders substituted for the metavariable names
+in SUBS, an alist from names to subtrees (as returned by
+`template-subtree'). Subtrees that are strings are inlined into the
+template before parsing.
+
+Return two values: the parsed AST and an alist from each name to the
+paths of its placeholders in the AST. If no subtree in SUBS is a
+string, the result depends only on TEMPLATE and PLACEHOLDERS and may be
+reused with `insert-template-subtrees'."
   (nest
    ;; Build tables between names, placeholders, and subtrees.
-   (mvlet* ((template names placeholders subtrees
-             (parse-ast-template template class args))
-            (dummy (allocate-instance (find-class class)))
-            (subs
-             (iter (for name in names)
-                   (for subtree in subtrees)
-                   (collect (cons name (template-subtree dummy subtree)))))
-            (names (mapcar #'car subs))
-            (temp-subs (pairlis placeholders names))))
+   (let* ((names (mapcar #'car subs))
+          (temp-subs (pairlis placeholders names))))
    ;; Wrap the tables with convenience accessors.
    (labels ((name-placeholder (name)
               (rassocar name temp-subs :test #'string=))
@@ -299,8 +316,6 @@ with `@') can also be used as Trivia patterns for destructuring.
                             (and (null (children n))
                                  (string= (source-text n) placeholder)))
                           ast))))
-   ;; Replace the identifiers with subtrees, taking care to copy
-   ;; before and after text.
    (let* ((leading-whitespace
            (take-while #'whitespacep template))
           (template
@@ -315,23 +330,33 @@ with `@') can also be used as Trivia patterns for destructuring.
                             template
                             subtree)
                            template)))
-                   (sort names #'length> :key #'string)
+                   (sort (copy-list names) #'length> :key #'string)
                    :initial-value template))
           (ast
            (assure ast
              (if *tolerant*
                  (parse-tolerant class template)
-                 (convert class template :deepest t))))
-          (placeholder-paths
-           (iter (for p in placeholders)
-                 (for targets = (placeholder-targets p ast))
-                 (collect
-                  (cons p (mapcar (op (ast-path ast _)) targets))))))
-     (setf (before-text ast) leading-whitespace))
-   (labels ((placeholder-paths (placeholder)
-              (assocdr placeholder placeholder-paths :test #'equal))
-            (name-paths (name)
-              (placeholder-paths (name-placeholder name)))))
+                 (convert class template :deepest t)))))
+     (setf (before-text ast) leading-whitespace)
+     (values ast
+             (iter (for name in names)
+                   (for targets = (placeholder-targets (name-placeholder name)
+                                                       ast))
+                   (collect
+                    (cons name (mapcar (op (ast-path ast _)) targets))))))))
+
+(-> insert-template-subtrees (ast list list) (values ast &optional))
+(defun insert-template-subtrees (ast name-paths subs)
+  "Replace the placeholders in AST, a template skeleton as returned by
+`ast-template-skeleton', with the subtrees in SUBS.
+NAME-PATHS is an alist from metavariable names to placeholder paths in
+AST and SUBS is an alist from metavariable names to subtrees, taking
+care to copy before and after text."
+  (nest
+   (labels ((name-paths (name)
+              (assocdr name name-paths :test #'string=))
+            (name-subtree (name)
+              (assocdr name subs :test #'string=))))
    (labels
        ((minimize-path (ast path)
           "Find the shallowest parent of AST with the same source
@@ -423,7 +448,7 @@ If SUBTREE is a list do the same for each element."
                  :initial-value ast))))))
    (reduce (lambda (ast name)
              (insert-name-subtrees ast name))
-           names
+           (mapcar #'car subs)
            :initial-value ast)))
 
 (define-compiler-macro ast-template* (template class &rest args)
@@ -641,6 +641,9 @@
            ;; template.lisp
            :ast-template
            :ast-template*
+           :parse-ast-template
+           :ast-template-skeleton
+           :insert-template-subtrees
            :template-placeholder
            :template-metavariable
            :template-subtree
@@ -6,6 +6,8 @@
    #+gt :testbot
    :software-evolution-library/test/util
    :stefil+
+   :software-evolution-library
+   :software-evolution-library/software/simple
    :software-evolution-library/components/test-suite
    :software-evolution-library/command-line)
   (:import-from :software-evolution-library/components/test-suite
@@ -69,3 +71,72 @@
     (progn
       (is (= num-cases 5) "Wrong number of test cases in random-test-suite")
       (is (= full-test-count 20) "Wrong number of cases in full set"))))
+
+(deftest fitness-cache-counts-hits-and-misses ()
+  (let ((cache (make-instance 'fitness-cache :capacity 8)))
+    (is (not (nth-value 1 (fitness-cache-get cache "a"))))
+    (fitness-cache-put cache "a" 3)
+    (is (equal '(3 t) (multiple-value-list (fitness-cache-get cache "a"))))
+    (is (equal '(:size 1 :capacity 8 :hits 1 :misses 1)
+               (fitness-cache-stats cache)))))
+
+(deftest fitness-cache-evicts-least-recently-used ()
+  (let ((cache (make-instance 'fitness-cache :capacity 8)))
+    (dotimes (i 8)
+      (fitness-cache-put cache i i))
+    ;; Make the first entry the most recently used.
+    (fitness-cache-get cache 0)
+    (fitness-cache-put cache 8 8)
+    (is (<= (getf (fitness-cache-stats cache) :size) 8))
+    (is (nth-value 1 (fitness-cache-get cache 0)))
+    (is (nth-value 1 (fitness-cache-get cache 8)))
+    (is (not (nth-value 1 (fitness-cache-get cache 1))))))
+
+(deftest fitness-cache-persists-entries ()
+  (with-temporary-file (:pathname path)
+    (let ((cache (make-instance 'fitness-cache :path path)))
+      (fitness-cache-put cache "a" 1)
+      (fitness-cache-put cache "b" #(1 0 1) :extra-data '(:time 2))
+      ;; Entries which cannot be printed readably are not persisted.
+      (fitness-cache-put cache "c" 3 :extra-data (list (lambda ()))))
+    (let ((cache (make-instance 'fitness-cache :path path)))
+      (is (eql 1 (fitness-cache-get cache "a")))
+      (is (equalp '(#(1 0 1) t (:time 2))
+                  (multiple-value-list (fitness-cache-get cache "b"))))
+      (is (not (nth-value 1 (fitness-cache-get cache "c")))))))
+
+(deftest fitness-cache-used-by-evaluate ()
+  (let* ((*fitness-cache* (make-instance 'fitness-cache))
+         (calls 0)
+         (test (lambda (obj)
+                 (declare (ignore obj))
+                 (incf calls)
+                 (values 1 :extra))))
+    (flet ((make-simple (&rest lines)
+             (let ((obj (make-instance 'simple)))
+               (setf (lines obj) lines)
+               obj)))
+      (is (equal '(1 :extra) (multiple-value-list
+                              (evaluate test (make-simple "a" "b")))))
+      (is (equal '(1 :extra) (multiple-value-list
+                              (evaluate test (make-simple "a" "b")))))
+      (is (= 1 calls))
+      (evaluate test (make-simple "a" "c"))
+      (is (= 2 calls))
+      ;; Another anonymous test never reuses the fitness.
+      (evaluate (lambda (obj) (declare (ignore obj)) 2) (make-simple "a" "b"))
+      (is (equal '(:size 3 :capacity 65536 :hits 1 :misses 3)
+                 (fitness-cache-stats))))))
+
+(deftest fitness-cache-key-names-global-functions ()
+  (let ((obj (make-instance 'simple)))
+    (is (equal (fitness-cache-key obj #'length)
+               (fitness-cache-key obj #'length)))
+    (is (not (equal (fitness-cache-key obj #'length)
+                    (fitness-cache-key obj #'length :extra 1))))
+    (flet ((make-test (n) (lambda (obj) (declare (ignore obj)) n)))
+      (let ((test (make-test 1)))
+        (is (equal (fitness-cache-key obj test)
+                   (fitness-cache-key obj test)))
+        (is (not (equal (fitness-cache-key obj test)
+                        (fitness-cache-key obj (make-test 1)))))))))
@@ -16,6 +16,9 @@
    :software-evolution-library/rest/async-jobs
    :software-evolution-library/software/clang)
   #-windows (:import-from :hunchentoot)
+  (:import-from :software-evolution-library/rest/sessions :lookup-session)
+  (:import-from :software-evolution-library/rest/std-api
+                :session-mutations :session-test-suites)
   (:shadowing-import-from :clack :stop)
   (:export :test-rest))
 (in-package :software-evolution-library/test/rest)
@@ -131,6 +134,31 @@
 
       (values result status))))
 #-windows
+(defun rest-test-create-software-many (type cid count)
+  "Given type of Software object, client-id and count, returns 2
+ values: list of COUNT new software oids or nil, and status.
+ Assumes service is running."
+  (let* ((path (namestring (hello-world-dir "hello_world.c")))
+         (params `(("path" . ,path)
+                   ("compiler" . "clang")
+                   ("flags" . ,(list "-I" (namestring
+                                           (make-pathname
+                                            :directory +headers-dir+))))))
+         (result nil))
+    (multiple-value-bind (stream status)
+        (drakma:http-request
+         (format nil "http://127.0.0.1:~D/soft-many?cid=~A&type=~A"
+                 *clack-port* cid type)
+         :method :post
+         :content-type "application/json"
+         :content (json:encode-json-to-string
+                   (make-list count :initial-element params))
+         :want-stream t)
+      (if (= status 200)
+          (setf result (json:decode-json stream)))
+      (values result status))))
+
+#-windows
 (defun rest-test-get-new-client ()
   "Always creates a new REST client and returns (1) new client id,
  (2) http status code. The new client id is stored in *rest-client*."
@@ -167,6 +195,167 @@
         (is (eql status 200))
         (is (integerp oid))))))
 
+#-windows
+(deftest (rest-create-software-many :long-running) ()
+  ;; test ensures the web service can create several software objects
+  ;; in one request. Tests Create Software bulk (HTTP POST) method.
+  (with-fixture rest-server
+    (let ((cid (rest-test-get-client)))
+      (multiple-value-bind (oids status)
+          (rest-test-create-software-many
+           "SOFTWARE-EVOLUTION-LIBRARY/SOFTWARE/CLANG:CLANG" cid 3)
+        (is (eql status 200))
+        (is (eql (length oids) 3))
+        (is (every #'integerp oids))
+        (is (eql (length (remove-duplicates oids)) 3))))))
+
+#-windows
+(defun rest-test-post-many (route cid content)
+  "POST the list CONTENT as a JSON array to the bulk ROUTE, returning 2
+values: the body of the response and the status.  Assumes service is
+running."
+  (multiple-value-bind (stream status)
+      (drakma:http-request
+       (format nil "http://127.0.0.1:~D/~A?cid=~A" *clack-port* route cid)
+       :method :post
+       :content-type "application/json"
+       :content (json:encode-json-to-string (coerce content 'vector))
+       :want-stream t)
+    (values (read-line stream nil "") status)))
+
+#-windows
+(deftest (rest-create-tests-many :long-running) ()
+  ;; test ensures the web service can create several test suites in one
+  ;; request, and none when any cannot be created.
+  (with-fixture rest-server
+    (let* ((cid (rest-test-get-client))
+           (suite '((:tests ((:program-name . "echo")
+                             (:program-args "BIN"))))))
+      (multiple-value-bind (body status)
+          (rest-test-post-many "tests-many" cid (list suite suite))
+        (is (eql status 200))
+        (let ((oids (json:decode-json-from-string body)))
+          (is (eql (length oids) 2))
+          (is (every #'integerp oids))))
+      (multiple-value-bind (body status)
+          (rest-test-post-many "tests-many" cid nil)
+        (is (eql status 200))
+        (is (equal body "[]")))
+      (let ((count (length (session-test-suites (lookup-session cid)))))
+        (is (eql 400 (nth-value 1 (rest-test-post-many
+                                   "tests-many" cid
+                                   (list suite '((:tests . 1)))))))
+        (is (eql count
+                 (length (session-test-suites (lookup-session cid)))))))))
+
+#-windows
+(deftest (rest-create-mutations-many :long-running) ()
+  ;; test ensures the web service can create several mutations in one
+  ;; request, and none when any cannot be created.
+  (with-fixture rest-server
+    (let* ((cid (rest-test-get-client))
+           (sid (rest-test-create-software
+                 "SOFTWARE-EVOLUTION-LIBRARY/SOFTWARE/CLANG:CLANG" cid))
+           (mutation `((:type . "SOFTWARE-EVOLUTION-LIBRARY::MUTATION")
+                       (:sid . ,sid)
+                       (:targets . 1))))
+      (multiple-value-bind (body status)
+          (rest-test-post-many "mut-many" cid (list mutation mutation))
+        (is (eql status 200))
+        (let ((oids (json:decode-json-from-string body)))
+          (is (eql (length oids) 2))
+          (is (every #'integerp oids))))
+      (let ((count (length (session-mutations (lookup-session cid)))))
+        (is (eql 400 (nth-value 1 (rest-test-post-many
+                                   "mut-many" cid
+                                   (list mutation
+                                         '((:type . "NOT::A-MUTATION")))))))
+        (is (eql count
+                 (length (session-mutations (lookup-session cid)))))))))
+
+#-windows
+(defun rest-test-put-fitness-cache (cid settings)
+  "PUT the alist SETTINGS to the fitness cache route, returning 2 values:
+the decoded stats of the cache and the status.  Assumes service is running."
+  (multiple-value-bind (stream status)
+      (drakma:http-request
+       (format nil "http://127.0.0.1:~D/fitness-cache?cid=~A"
+               *clack-port* cid)
+       :method :put
+       :content-type "application/json"
+       :accept "application/json"
+       :content (json:encode-json-alist-to-string settings)
+       :want-stream t)
+    (values (and (= status 200) (json:decode-json stream)) status)))
+
+#-windows
+(deftest (rest-set-fitness-cache :long-running) ()
+  ;; test ensures the fitness cache may be enabled and disabled over the
+  ;; web service.
+  (with-fixture rest-server
+    (let ((cid (rest-test-get-client)))
+      (unwind-protect
+           (progn
+             (multiple-value-bind (stats status)
+                 (rest-test-put-fitness-cache cid '((:capacity . 16)))
+               (is (eql status 200))
+               (is (eql 16 (aget :capacity stats))))
+             (is (eql 400 (nth-value 1 (rest-test-put-fitness-cache
+                                        cid '((:capacity . -1)))))))
+        (multiple-value-bind (stats status)
+            (rest-test-put-fitness-cache cid (list (cons :enabled nil)))
+          (is (eql status 200))
+          (is (eql 0 (aget :capacity stats))))))))
+
+#-windows
+(deftest rest-paginate ()
+  (is (equal '(2 3) (sel/rest/utility:paginate '(1 2 3 4) 1 2)))
+  (is (equal '(3 4) (sel/rest/utility:paginate '(1 2 3 4) "2" nil)))
+  (is (equal '(1 2 3 4) (sel/rest/utility:paginate '(1 2 3 4) nil nil)))
+  ;; Pages are in order of the key, however the list grew.
+  (is (equal '(2 3) (sel/rest/utility:paginate '(4 1 3 2) 1 2)))
+  (is (equal '((2) (3))
+             (sel/rest/utility:paginate '((4) (3) (2) (1)) 1 2 :key #'car)))
+  (signals snooze:http-condition
+    (sel/rest/utility:paginate '(1 2 3 4) "-1" nil))
+  (signals snooze:http-condition
+    (sel/rest/utility:paginate '(1 2 3 4) nil -2)))
+
+#-windows
+(deftest rest-wait-session-job-timeout ()
+  (let ((session (make-instance 'sel/rest/sessions::session)))
+    (signals snooze:http-condition
+      (wait-session-job session "no-such-job" "soon"))
+    (signals snooze:http-condition
+      (wait-session-job session "no-such-job" -1))))
+
+#-windows
+(deftest rest-wrap-gzip ()
+  (let* ((body (make-string 2048 :initial-element #\a))
+         (app (sel/rest/utility:wrap-gzip
+               (constantly (list 200 '(:content-type "text/plain")
+                                 (list body)))))
+         (headers (make-hash-table :test 'equal)))
+    (setf (gethash "accept-encoding" headers) "gzip, deflate")
+    (destructuring-bind (status out-headers data)
+        (funcall app (list :headers headers))
+      (is (eql status 200))
+      (is (equal (getf out-headers :content-encoding) "gzip"))
+      (is (< (length data) (length body))))
+    ;; Clients not accepting gzip get the body as it is.
+    (is (equal (list body)
+               (third (funcall app (list :headers
+                                         (make-hash-table :test 'equal))))))
+    (flet ((gzip-accepted-p (accept)
+             (setf (gethash "accept-encoding" headers) accept)
+             (sel/rest/utility::gzip-accepted-p (list :headers headers))))
+      (is (gzip-accepted-p "deflate, gzip;q=0.5"))
+      (is (gzip-accepted-p "*"))
+      (is (not (gzip-accepted-p "gzip;q=0")))
+      (is (not (gzip-accepted-p "gzip; q=0.000, deflate")))
+      (is (not (gzip-accepted-p "*;q=1, gzip;q=0")))
+      (is (not (gzip-accepted-p "deflate"))))))
+
 #-windows
 (define-async-job four-types-1
     ((a integer) (b string) (c float) (d boolean))
@@ -91,3 +91,13 @@
     ;; Ensure correct results are returned by multi-threaded task-map
     ;; (in any order).
     (mapc (lambda (result) (is (member result results))) '(2 3 4))))
+
+(deftest (task-runner-wait-for-workers :long-running) ()
+  (let ((runner (run-task (make-instance 'parent-task :object "test3") 20)))
+    ;; Each of the 20 tasks sleeps for a second.
+    (is (not (task-runner-wait runner 0.1)))
+    (is (task-runner-wait runner 30))
+    (is (zerop (task-runner-workers-count runner)))
+    (is (= (length (task-runner-results runner)) 20))
+    ;; Waiting on a finished runner returns immediately.
+    (is (task-runner-wait runner 0))))
@@ -125,6 +125,7 @@
    :task-runner-stop-jobs
    :task-runner-add-job
    :task-runner-create-worker
+   :task-runner-wait
    :task
    :task-job
    :process-task
@@ -149,6 +150,7 @@
 * jobs-lock:    (internal) used to synchronize jobs stack
 * results-lock: (internal) used to synchronnize results list
 * workers-lock: (internal) used to synchronize worker list
+* workers-cv:   (internal) notified when the last worker thread exits
 * completed-jobs: number of jobs that have been executed and finished
 * completed-tasks: number of tasks that have finished"
   (jobs nil)
@@ -157,6 +159,7 @@
   (jobs-lock (bt:make-recursive-lock "task-runner-jobs"))
   (results-lock (bt:make-lock "task-runner-results"))
   (workers-lock (bt:make-lock "task-runner-workers"))
+  (workers-cv (bt:make-condition-variable :name "task-runner-workers"))
   (completed-jobs 0)
   (completed-tasks 0))
 
@@ -238,12 +241,15 @@
 ;;;
 ;;; exit-worker
 ;;; Do any processing necessary when a worker thread exits
-;;; For now, just decrement the *WORKER-COUNT* special variable.
+;;; For now, just remove the thread from the worker list, waking up any
+;;; threads in TASK-RUNNER-WAIT when it was the last one.
 ;;;
 (defun exit-worker (runner)
   (bt:with-lock-held ((task-runner-workers-lock runner))
     (setf (task-runner-workers runner)
-          (remove (current-thread) (task-runner-workers runner) :test 'equal))))
+          (remove (current-thread) (task-runner-workers runner) :test 'equal))
+    (unless (task-runner-workers runner)
+      (bt:condition-notify (task-runner-workers-cv runner)))))
 
 ;;;
 ;;; The task executed by each worker thread.
@@ -313,6 +319,29 @@ blocking until completion"
     (mapcar #'join-thread (task-runner-workers runner))
     runner))
 
+(defun task-runner-wait (runner &optional timeout)
+  "Block until all worker threads of RUNNER have exited, or until TIMEOUT
+seconds have passed.  Returns true if all the worker threads have exited.
+Unlike joining the worker threads this may be called from any number of
+threads at once, e.g. to wait for a task on behalf of several clients."
+  (let ((deadline (and timeout
+                       (+ (get-internal-real-time)
+                          (* timeout internal-time-units-per-second)))))
+    (bt:with-lock-held ((task-runner-workers-lock runner))
+      (loop while (task-runner-workers runner)
+            do (let ((remaining (and deadline
+                                     (/ (- deadline (get-internal-real-time))
+                                        internal-time-units-per-second))))
+                 (when (and remaining (<= remaining 0))
+                   (return))
+                 (bt:condition-wait (task-runner-workers-cv runner)
+                                    (task-runner-workers-lock runner)
+                                    :timeout remaining)))
+      (unless (task-runner-workers runner)
+        ;; A notification wakes a single waiter, pass it on to the others.
+        (bt:condition-notify (task-runner-workers-cv runner))
+        t))))
+
 (defun task-runner-remaining-jobs (runner)
   "Returns the number of jobs remaining."
   (length (task-runner-jobs runner)))